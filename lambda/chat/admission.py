@@ -0,0 +1,94 @@
+import math
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import boto3
+from botocore.exceptions import ClientError
+
+import metrics
+
+RATE_LIMIT_TABLE_NAME = os.environ.get('RATE_LIMIT_TABLE_NAME', '')
+
+# Per-user bucket: USER_RATE_LIMIT chat requests, refilled every USER_RATE_WINDOW_SECONDS
+USER_RATE_LIMIT = int(os.environ.get('USER_RATE_LIMIT', '10'))
+USER_RATE_WINDOW_SECONDS = int(os.environ.get('USER_RATE_WINDOW_SECONDS', '60'))
+
+# Deployment-wide bucket sized to the provider quota (requests per window); 0 disables it
+GLOBAL_RATE_LIMIT = int(os.environ.get('GLOBAL_RATE_LIMIT', '0'))
+GLOBAL_RATE_WINDOW_SECONDS = int(os.environ.get('GLOBAL_RATE_WINDOW_SECONDS', '60'))
+
+dynamodb = boto3.client('dynamodb')
+
+# Denials remembered in the container so repeat offenders are rejected without a DynamoDB call
+_denied_until: Dict[str, float] = {}
+
+
+class AdmissionDenied(Exception):
+    """Raised when a request exceeds a rate limit"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Rate limit exceeded ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def admit(username: str):
+    """Take one token from the user's and the global bucket, or raise AdmissionDenied"""
+    if not RATE_LIMIT_TABLE_NAME:
+        return
+
+    now = time.time()
+    if len(_denied_until) > 1000:
+        for scope in [s for s, until in _denied_until.items() if until <= now]:
+            del _denied_until[scope]
+    for scope in (f"user#{username}", 'global'):
+        until = _denied_until.get(scope, 0)
+        if until > now:
+            _reject(scope, until - now)
+
+    # One after the other, user first: a user over their limit must not spend a global token
+    checks = [(f"user#{username}", USER_RATE_LIMIT, USER_RATE_WINDOW_SECONDS)]
+    if GLOBAL_RATE_LIMIT > 0:
+        checks.append(('global', GLOBAL_RATE_LIMIT, GLOBAL_RATE_WINDOW_SECONDS))
+
+    for scope, limit, window_seconds in checks:
+        denied = _take(scope, limit, window_seconds, now)
+        if denied:
+            scope, retry_after = denied
+            _denied_until[scope] = now + retry_after
+            _reject(scope, retry_after)
+
+    metrics.incr('AdmissionAllowed')
+
+
+def _take(scope: str, limit: int, window_seconds: int, now: float) -> Optional[Tuple[str, float]]:
+    """Conditionally increment the counter for the current window; return (scope, retry_after) if full"""
+    window_start = int(now // window_seconds) * window_seconds
+    window_end = window_start + window_seconds
+    try:
+        dynamodb.update_item(
+            TableName=RATE_LIMIT_TABLE_NAME,
+            Key={'bucket': {'S': f"{scope}#{window_start}"}},
+            UpdateExpression='ADD #count :one SET #ttl = if_not_exists(#ttl, :ttl)',
+            ConditionExpression='attribute_not_exists(#count) OR #count < :limit',
+            ExpressionAttributeNames={'#count': 'count', '#ttl': 'ttl'},
+            ExpressionAttributeValues={
+                ':one': {'N': '1'},
+                ':limit': {'N': str(limit)},
+                ':ttl': {'N': str(window_end + window_seconds)},
+            },
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return scope, window_end - now
+        # Fail open: a rate limiter outage must not take chat down with it
+        print(f"Rate limit check failed for {scope.split('#')[0]}: {e.response['Error']['Code']}")
+        metrics.incr('AdmissionCheckErrors')
+    return None
+
+
+def _reject(scope: str, retry_after: float):
+    reason = 'user' if scope.startswith('user#') else 'global'
+    metrics.incr('AdmissionRejected', Reason=reason)
+    raise AdmissionDenied(reason, max(1, math.ceil(retry_after)))
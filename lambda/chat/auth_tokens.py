@@ -0,0 +1,42 @@
+import base64
+import os
+import time
+from typing import Optional
+
+# Tokens older than this are rejected
+TOKEN_MAX_AGE_SECONDS = int(os.environ.get('TOKEN_MAX_AGE_SECONDS', '86400'))
+
+
+def generate_user_token(username: str) -> str:
+    """Generate simple user token (in production, use proper JWT)"""
+    timestamp = str(int(time.time()))
+    data = f"{username}:{timestamp}"
+    return base64.b64encode(data.encode()).decode()
+
+
+def verify_user_token(token: str) -> Optional[str]:
+    """Verify user token and return username"""
+    if not token:
+        return None
+    
+    try:
+        data = base64.b64decode(token.encode()).decode()
+        username, timestamp = data.split(':')
+        
+        # Check if token is not too old
+        if int(time.time()) - int(timestamp) > TOKEN_MAX_AGE_SECONDS:
+            return None
+            
+        return username
+    except:
+        return None
+
+
+def token_from_header(value: Optional[str]) -> Optional[str]:
+    """Extract the token from an 'Authorization: Bearer <token>' header (or a bare token)"""
+    if not value:
+        return None
+    scheme, _, credentials = value.strip().partition(' ')
+    if credentials and scheme.lower() == 'bearer':
+        return credentials.strip()
+    return value.strip()
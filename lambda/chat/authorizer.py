@@ -0,0 +1,65 @@
+import metrics
+from auth_tokens import token_from_header, verify_user_token
+
+
+def handler(event, context):
+    """Validate the Authorization header and pass the verified username on
+
+    Serves every front door: the REST API's TOKEN authorizer and the WebSocket API's
+    $connect REQUEST authorizer (IAM policy responses), and the HTTP API's payload 2.0
+    authorizer (simple response).
+    """
+    try:
+        if event.get('version') == '2.0':
+            return simple_response(event)
+        return token_policy(event)
+    finally:
+        metrics.flush()
+
+
+def token_policy(event) -> dict:
+    """IAM policy response for TOKEN events and WebSocket $connect REQUEST events
+
+    API Gateway caches the returned policy per token for the authorizer's result TTL, so
+    the policy must cover every protected route, not just the one being called.
+    """
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    token = event.get('authorizationToken') or headers.get('authorization')
+    username = verify_user_token(token_from_header(token))
+    if not username:
+        metrics.incr('AuthorizerDenied')
+        # This exact message makes API Gateway answer 401 without invoking the backend
+        raise Exception('Unauthorized')
+
+    metrics.incr('AuthorizerAllowed')
+    return {
+        'principalId': username,
+        'policyDocument': {
+            'Version': '2012-10-17',
+            'Statement': [{
+                'Action': 'execute-api:Invoke',
+                'Effect': 'Allow',
+                'Resource': api_wildcard_arn(event['methodArn']),
+            }],
+        },
+        'context': {'username': username},
+    }
+
+
+def simple_response(event) -> dict:
+    """HTTP API authorizer response; the context arrives as requestContext.authorizer.lambda"""
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    username = verify_user_token(token_from_header(headers.get('authorization')))
+    if not username:
+        metrics.incr('AuthorizerDenied')
+        return {'isAuthorized': False}
+
+    metrics.incr('AuthorizerAllowed')
+    return {'isAuthorized': True, 'context': {'username': username}}
+
+
+def api_wildcard_arn(method_arn: str) -> str:
+    """arn:...:api-id/stage/METHOD/path -> arn:...:api-id/stage/*"""
+    api_arn, _, rest = method_arn.partition('/')
+    stage = rest.split('/', 1)[0]
+    return f"{api_arn}/{stage}/*"
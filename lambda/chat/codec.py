@@ -0,0 +1,63 @@
+import os
+import zlib
+from typing import Dict, Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 'zlib', 'zstd' (falls back to zlib if zstandard is not installed) or 'off'
+CONTENT_COMPRESSION = os.environ.get('CONTENT_COMPRESSION', 'zlib').lower()
+
+# Shorter content is stored as a plain string; compression overhead isn't worth it
+CONTENT_COMPRESSION_MIN_BYTES = int(os.environ.get('CONTENT_COMPRESSION_MIN_BYTES', '512'))
+
+# Optional preset dictionary trained on chat text (see scripts/bench_content_codec.py)
+CONTENT_DICTIONARY_PATH = os.environ.get('CONTENT_DICTIONARY_PATH', '')
+CONTENT_DICTIONARY_ID = int(os.environ.get('CONTENT_DICTIONARY_ID', '1'))
+
+# Format version byte at the start of every encoded value
+FORMAT_ZLIB = 1
+FORMAT_ZLIB_DICT = 2  # followed by a one-byte dictionary id
+FORMAT_ZSTD = 3
+
+_dictionaries: Dict[int, bytes] = {}
+if CONTENT_DICTIONARY_PATH and os.path.exists(CONTENT_DICTIONARY_PATH):
+    with open(CONTENT_DICTIONARY_PATH, 'rb') as f:
+        _dictionaries[CONTENT_DICTIONARY_ID] = f.read()
+
+
+def encode_content(text: str) -> Union[str, bytes]:
+    """Return text unchanged when short, otherwise a versioned compressed blob"""
+    raw = text.encode('utf-8')
+    if CONTENT_COMPRESSION == 'off' or len(raw) < CONTENT_COMPRESSION_MIN_BYTES:
+        return text
+
+    if CONTENT_COMPRESSION == 'zstd' and zstandard is not None:
+        encoded = bytes([FORMAT_ZSTD]) + zstandard.ZstdCompressor(level=3).compress(raw)
+    elif CONTENT_DICTIONARY_ID in _dictionaries:
+        compressor = zlib.compressobj(level=6, zdict=_dictionaries[CONTENT_DICTIONARY_ID])
+        encoded = bytes([FORMAT_ZLIB_DICT, CONTENT_DICTIONARY_ID]) + compressor.compress(raw) + compressor.flush()
+    else:
+        encoded = bytes([FORMAT_ZLIB]) + zlib.compress(raw, 6)
+
+    return encoded if len(encoded) < len(raw) else text
+
+
+def decode_content(value) -> str:
+    """Decode a stored content attribute; plain strings from older rows pass through"""
+    if isinstance(value, str):
+        return value
+
+    # boto3's resource layer wraps binary attributes in a Binary object
+    data = bytes(getattr(value, 'value', value))
+    version = data[0]
+    if version == FORMAT_ZLIB:
+        return zlib.decompress(data[1:]).decode('utf-8')
+    if version == FORMAT_ZLIB_DICT:
+        decompressor = zlib.decompressobj(zdict=_dictionaries[data[1]])
+        return (decompressor.decompress(data[2:]) + decompressor.flush()).decode('utf-8')
+    if version == FORMAT_ZSTD:
+        return zstandard.ZstdDecompressor().decompress(data[1:]).decode('utf-8')
+    raise ValueError(f"Unknown content format version {version}")
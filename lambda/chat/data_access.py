@@ -0,0 +1,658 @@
+import os
+import random
+import time
+from typing import Dict, Iterator, List, Optional, Union
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+CHAT_TABLE_NAME = os.environ['CHAT_TABLE_NAME']
+USERS_TABLE_NAME = os.environ['USERS_TABLE_NAME']
+SUMMARIES_TABLE_NAME = os.environ['SUMMARIES_TABLE_NAME']
+CONNECTIONS_TABLE_NAME = os.environ.get('CONNECTIONS_TABLE_NAME', '')
+SEARCH_TABLE_NAME = os.environ.get('SEARCH_TABLE_NAME', '')
+
+# Keys-only GSI on ChatHistory (username, timestamp): a user's rows without a scan
+CHAT_USER_INDEX_NAME = os.environ.get('CHAT_USER_INDEX_NAME', 'UserIndex')
+
+# Keys-only GSI on WebSocketConnections (username)
+CONNECTIONS_USER_INDEX_NAME = 'UserIndex'
+
+# Low-level client: no resource-layer type (de)serialization, pooled keep-alive connections
+# and socket timeouts that fail well inside the request budget
+dynamodb = boto3.client(
+    'dynamodb',
+    endpoint_url=os.environ.get('DYNAMODB_ENDPOINT_URL') or None,
+    config=Config(
+        max_pool_connections=int(os.environ.get('DYNAMODB_MAX_POOL_CONNECTIONS', '16')),
+        tcp_keepalive=True,
+        connect_timeout=1,
+        read_timeout=int(os.environ.get('DYNAMODB_READ_TIMEOUT_SECONDS', '3')),
+        retries={'max_attempts': 3, 'mode': 'standard'},
+    ),
+)
+
+
+class AlreadyExists(Exception):
+    """Raised when a conditional create finds an existing item"""
+
+
+class UnprocessedItems(Exception):
+    """Raised when a batch write still has unprocessed items after every retry"""
+
+
+# BatchWriteItem accepts at most 25 requests
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_WRITE_MAX_ATTEMPTS = 10
+# BatchGetItem accepts at most 100 keys
+BATCH_GET_MAX_KEYS = 100
+
+
+# ChatHistory: sessionId (S), timestamp (N), role (S), content (S or B), ttl (N), username (S)
+
+def message_to_item(session_id: str, timestamp: int, role: str, content: Union[str, bytes],
+                    ttl: int, username: Optional[str] = None) -> Dict:
+    item = {
+        'sessionId': {'S': session_id},
+        'timestamp': {'N': str(timestamp)},
+        'role': {'S': role},
+        'content': {'B': content} if isinstance(content, bytes) else {'S': content},
+        'ttl': {'N': str(ttl)},
+    }
+    if username:
+        item['username'] = {'S': username}
+    return item
+
+
+def item_to_message(item: Dict) -> Dict:
+    content = item['content']
+    message = {
+        'sessionId': item['sessionId']['S'],
+        'timestamp': int(item['timestamp']['N']),
+        'role': item['role']['S'],
+        'content': content['S'] if 'S' in content else content['B'],
+    }
+    if 'username' in item:
+        message['username'] = item['username']['S']
+    return message
+
+
+def message_key(session_id: str, timestamp: int) -> Dict:
+    return {'sessionId': {'S': session_id}, 'timestamp': {'N': str(timestamp)}}
+
+
+# Users: username (S), password_hash (S), created_at (N), data_key (B, KMS-wrapped, optional),
+# and while an account is being deleted: deletion_status (S), deletion_started_at (N),
+# deletion_updated_at (N), deleted_items (N)
+
+def user_to_item(username: str, password_hash: str, created_at: int) -> Dict:
+    return {
+        'username': {'S': username},
+        'password_hash': {'S': password_hash},
+        'created_at': {'N': str(created_at)},
+    }
+
+
+def item_to_user(item: Dict) -> Dict:
+    user = {
+        'username': item['username']['S'],
+        'password_hash': item['password_hash']['S'],
+        'created_at': int(item['created_at']['N']),
+    }
+    if 'deletion_status' in item:
+        user['deletion'] = item_to_deletion(item)
+    return user
+
+
+def item_to_deletion(item: Dict) -> Dict:
+    return {
+        'status': item['deletion_status']['S'],
+        'startedAt': int(item['deletion_started_at']['N']),
+        'updatedAt': int(item['deletion_updated_at']['N']),
+        'deletedItems': int(item['deleted_items']['N']),
+    }
+
+
+# ChatSummaries: username (S), sessionId (S), summary (S or B), created_at (N), ttl (N),
+# optionally embedding (B, little-endian float32, encrypted like the summary when content
+# encryption is on) and embedding_model (S), and the features counted in the trend
+# rollups: sentiment (N, -1 to 1) and topics (SS)
+
+def summary_to_item(username: str, session_id: str, summary: Union[str, bytes], created_at: int, ttl: int,
+                    embedding: Optional[bytes] = None, embedding_model: Optional[str] = None,
+                    sentiment: Optional[float] = None, topics: Optional[List[str]] = None) -> Dict:
+    item = {
+        'username': {'S': username},
+        'sessionId': {'S': session_id},
+        'summary': {'B': summary} if isinstance(summary, bytes) else {'S': summary},
+        'created_at': {'N': str(created_at)},
+        'ttl': {'N': str(ttl)},
+    }
+    if embedding is not None:
+        item['embedding'] = {'B': embedding}
+        item['embedding_model'] = {'S': embedding_model}
+    if sentiment is not None:
+        item['sentiment'] = {'N': str(round(sentiment, 3))}
+        if topics:
+            item['topics'] = {'SS': sorted(set(topics))}
+    return item
+
+
+def item_to_summary(item: Dict) -> Dict:
+    summary = item['summary']
+    return {
+        'sessionId': item['sessionId']['S'],
+        'summary': summary['S'] if 'S' in summary else summary['B'],
+        'created_at': int(item['created_at']['N']),
+    }
+
+
+def item_to_summary_features(item: Optional[Dict]) -> Optional[Dict]:
+    """{created_at, sentiment, topics} of a summary item, or None if it has no features"""
+    if not item or 'sentiment' not in item:
+        return None
+    return {
+        'created_at': int(item['created_at']['N']),
+        'sentiment': float(item['sentiment']['N']),
+        'topics': item.get('topics', {}).get('SS', []),
+    }
+
+
+# Connections: connectionId (S), username (S), connected_at (N), ttl (N)
+
+def connection_to_item(connection_id: str, username: str, connected_at: int, ttl: int) -> Dict:
+    return {
+        'connectionId': {'S': connection_id},
+        'username': {'S': username},
+        'connected_at': {'N': str(connected_at)},
+        'ttl': {'N': str(ttl)},
+    }
+
+
+# SearchIndex: username (S), term (S, '<token hash>#<day>'), messages (SS, '<sessionId>#<timestamp>'
+# of the user's messages containing the token that day), ttl (N); plus one '#stats' item per
+# user with docs (N, messages indexed). Lists written before messages existed hold refs (NS,
+# bare timestamps) instead, resolved through UserIndex until they expire.
+
+SEARCH_STATS_TERM = '#stats'
+
+
+def posting_ref(session_id: str, timestamp: int) -> str:
+    return f"{session_id}#{timestamp}"
+
+
+def posting_key(ref: str) -> Optional[Dict]:
+    """ChatHistory key of a posting ref; None for a bare (legacy) timestamp"""
+    session_id, _, timestamp = ref.rpartition('#')
+    return message_key(session_id, int(timestamp)) if session_id else None
+
+
+def search_key(username: str, term: str) -> Dict:
+    return {'username': {'S': username}, 'term': {'S': term}}
+
+
+def put_message(session_id: str, timestamp: int, role: str, content: Union[str, bytes],
+                ttl: int, username: Optional[str] = None):
+    dynamodb.put_item(
+        TableName=CHAT_TABLE_NAME,
+        Item=message_to_item(session_id, timestamp, role, content, ttl, username),
+    )
+
+
+def query_messages(session_id: str, limit: int, after_timestamp: Optional[int] = None) -> List[Dict]:
+    """Newest messages of a session (optionally only those after a timestamp), oldest first"""
+    if after_timestamp is None:
+        condition = 'sessionId = :sid'
+        values = {':sid': {'S': session_id}}
+        names = None
+    else:
+        condition = 'sessionId = :sid AND #ts > :last'
+        values = {':sid': {'S': session_id}, ':last': {'N': str(after_timestamp)}}
+        names = {'#ts': 'timestamp'}
+
+    params = {
+        'TableName': CHAT_TABLE_NAME,
+        'KeyConditionExpression': condition,
+        'ExpressionAttributeValues': values,
+        'Limit': limit,
+        'ScanIndexForward': False,
+    }
+    if names:
+        params['ExpressionAttributeNames'] = names
+
+    items = dynamodb.query(**params).get('Items', [])
+    items.reverse()
+    return [item_to_message(item) for item in items]
+
+
+def iter_session_message_pages(session_id: str, page_size: int = 200) -> Iterator[List[Dict]]:
+    """All of a session's messages, oldest first, one query page at a time"""
+    params = {
+        'TableName': CHAT_TABLE_NAME,
+        'KeyConditionExpression': 'sessionId = :sid',
+        'ExpressionAttributeValues': {':sid': {'S': session_id}},
+        'Limit': page_size,
+    }
+    while True:
+        response = dynamodb.query(**params)
+        yield [item_to_message(item) for item in response.get('Items', [])]
+        if 'LastEvaluatedKey' not in response:
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def iter_user_message_key_pages(username: str) -> Iterator[List[Dict]]:
+    """Keys ({sessionId, timestamp}) of every message stored with the user's name, via UserIndex"""
+    params = {
+        'TableName': CHAT_TABLE_NAME,
+        'IndexName': CHAT_USER_INDEX_NAME,
+        'KeyConditionExpression': 'username = :username',
+        'ExpressionAttributeValues': {':username': {'S': username}},
+    }
+    while True:
+        response = dynamodb.query(**params)
+        yield [
+            {'sessionId': item['sessionId']['S'], 'timestamp': int(item['timestamp']['N'])}
+            for item in response.get('Items', [])
+        ]
+        if 'LastEvaluatedKey' not in response:
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def scan_message_key_pages(segment: int = 0, total_segments: int = 1) -> Iterator[List[Dict]]:
+    """{username, sessionId, timestamp} of every message stored with a username, from a
+    parallel Scan segment of UserIndex (keys only; for offline jobs)"""
+    params = {'TableName': CHAT_TABLE_NAME, 'IndexName': CHAT_USER_INDEX_NAME}
+    if total_segments > 1:
+        params.update(Segment=segment, TotalSegments=total_segments)
+    while True:
+        response = dynamodb.scan(**params)
+        yield [
+            {
+                'username': item['username']['S'],
+                'sessionId': item['sessionId']['S'],
+                'timestamp': int(item['timestamp']['N']),
+            }
+            for item in response.get('Items', [])
+        ]
+        if 'LastEvaluatedKey' not in response:
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def get_user(username: str) -> Optional[Dict]:
+    item = dynamodb.get_item(TableName=USERS_TABLE_NAME, Key={'username': {'S': username}}).get('Item')
+    return item_to_user(item) if item else None
+
+
+def create_user(username: str, password_hash: str, created_at: int):
+    """Create a user, raising AlreadyExists if the username is taken"""
+    try:
+        dynamodb.put_item(
+            TableName=USERS_TABLE_NAME,
+            Item=user_to_item(username, password_hash, created_at),
+            ConditionExpression='attribute_not_exists(username)',
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            raise AlreadyExists(username)
+        raise
+
+
+def get_user_data_key(username: str) -> Optional[bytes]:
+    item = dynamodb.get_item(
+        TableName=USERS_TABLE_NAME,
+        Key={'username': {'S': username}},
+        ProjectionExpression='data_key',
+    ).get('Item')
+    return item['data_key']['B'] if item and 'data_key' in item else None
+
+
+def put_user_data_key(username: str, wrapped_key: bytes) -> bool:
+    """Store a user's wrapped data key unless one exists; False if another writer won"""
+    try:
+        dynamodb.update_item(
+            TableName=USERS_TABLE_NAME,
+            Key={'username': {'S': username}},
+            UpdateExpression='SET data_key = :key',
+            # No new key once deletion has started and removed the old one
+            ConditionExpression='attribute_exists(username) AND attribute_not_exists(data_key) '
+                                'AND attribute_not_exists(deletion_status)',
+            ExpressionAttributeValues={':key': {'B': wrapped_key}},
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+
+def begin_user_deletion(username: str, now: int) -> Optional[Dict]:
+    """Mark the user as being deleted and drop their wrapped data key; None if no such user.
+
+    Without the data key, encrypted content is unreadable from this point on, before the
+    rows themselves are gone. Calling it again keeps the original start time and progress.
+    """
+    try:
+        response = dynamodb.update_item(
+            TableName=USERS_TABLE_NAME,
+            Key={'username': {'S': username}},
+            UpdateExpression='SET deletion_status = :deleting, '
+                             'deletion_started_at = if_not_exists(deletion_started_at, :now), '
+                             'deletion_updated_at = :now, '
+                             'deleted_items = if_not_exists(deleted_items, :zero) '
+                             'REMOVE data_key',
+            ConditionExpression='attribute_exists(username)',
+            ExpressionAttributeValues={':deleting': {'S': 'deleting'}, ':now': {'N': str(now)}, ':zero': {'N': '0'}},
+            ReturnValues='ALL_NEW',
+        )
+        return item_to_deletion(response['Attributes'])
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return None
+        raise
+
+
+def record_deletion_progress(username: str, deleted: int, now: int):
+    dynamodb.update_item(
+        TableName=USERS_TABLE_NAME,
+        Key={'username': {'S': username}},
+        UpdateExpression='SET deletion_updated_at = :now ADD deleted_items :deleted',
+        ConditionExpression='attribute_exists(username)',
+        ExpressionAttributeValues={':now': {'N': str(now)}, ':deleted': {'N': str(deleted)}},
+    )
+
+
+def delete_user(username: str):
+    dynamodb.delete_item(TableName=USERS_TABLE_NAME, Key={'username': {'S': username}})
+
+
+def batch_delete(table_name: str, keys: List[Dict]) -> int:
+    """Delete up to BATCH_WRITE_MAX_ITEMS items in one BatchWriteItem, retrying unprocessed items"""
+    return _batch_write(table_name, [{'DeleteRequest': {'Key': key}} for key in keys])
+
+
+def batch_put(table_name: str, items: List[Dict]) -> int:
+    """Put up to BATCH_WRITE_MAX_ITEMS items in one BatchWriteItem, retrying unprocessed items"""
+    return _batch_write(table_name, [{'PutRequest': {'Item': item}} for item in items])
+
+
+def _batch_write(table_name: str, requests: List[Dict]) -> int:
+    count = len(requests)
+    for attempt in range(BATCH_WRITE_MAX_ATTEMPTS):
+        response = dynamodb.batch_write_item(RequestItems={table_name: requests})
+        requests = response.get('UnprocessedItems', {}).get(table_name, [])
+        if not requests:
+            return count
+        # Unprocessed items mean the table is throttling; back off with full jitter
+        time.sleep(random.uniform(0, min(2.0, 0.05 * 2 ** attempt)))
+    raise UnprocessedItems(f"{len(requests)} writes to {table_name} still unprocessed")
+
+
+def put_summary_item(item: Dict) -> Optional[Dict]:
+    """Store a summary item, returning the item it replaced (if any)"""
+    return dynamodb.put_item(TableName=SUMMARIES_TABLE_NAME, Item=item, ReturnValues='ALL_OLD').get('Attributes')
+
+
+def iter_summary_feature_pages(username: str) -> Iterator[List[Dict]]:
+    """Trend features of a user's summaries (those that have them), one query page at a time"""
+    params = {
+        'TableName': SUMMARIES_TABLE_NAME,
+        'KeyConditionExpression': 'username = :username',
+        'ExpressionAttributeValues': {':username': {'S': username}},
+        'ProjectionExpression': 'created_at, sentiment, topics',
+    }
+    while True:
+        response = dynamodb.query(**params)
+        features = map(item_to_summary_features, response.get('Items', []))
+        yield [f for f in features if f is not None]
+        if 'LastEvaluatedKey' not in response:
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def iter_summary_key_pages(username: Optional[str] = None, segment: int = 0,
+                           total_segments: int = 1) -> Iterator[List[Dict]]:
+    """{username, sessionId, ttl} of one user's summaries, or of every summary (a parallel
+    Scan segment; for offline jobs only)"""
+    params = {
+        'TableName': SUMMARIES_TABLE_NAME,
+        'ProjectionExpression': 'username, sessionId, #ttl',
+        'ExpressionAttributeNames': {'#ttl': 'ttl'},
+    }
+    if username:
+        params.update(KeyConditionExpression='username = :username',
+                      ExpressionAttributeValues={':username': {'S': username}})
+    elif total_segments > 1:
+        params.update(Segment=segment, TotalSegments=total_segments)
+    operation = dynamodb.query if username else dynamodb.scan
+    while True:
+        response = operation(**params)
+        yield [
+            {
+                'username': item['username']['S'],
+                'sessionId': item['sessionId']['S'],
+                'ttl': int(item['ttl']['N']) if 'ttl' in item else None,
+            }
+            for item in response.get('Items', [])
+        ]
+        if 'LastEvaluatedKey' not in response:
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def query_summaries(username: str, limit: int = 50) -> List[Dict]:
+    """A user's summaries, newest session key first"""
+    response = dynamodb.query(
+        TableName=SUMMARIES_TABLE_NAME,
+        KeyConditionExpression='username = :username',
+        ExpressionAttributeValues={':username': {'S': username}},
+        ScanIndexForward=False,
+        Limit=limit,
+    )
+    return [item_to_summary(item) for item in response.get('Items', [])]
+
+
+def query_summary_embeddings(username: str, embedding_model: str, limit: int) -> List[Dict]:
+    """Up to limit of a user's summaries that have an embedding from embedding_model"""
+    results, start_key = [], None
+    while len(results) < limit:
+        kwargs = {'ExclusiveStartKey': start_key} if start_key else {}
+        response = dynamodb.query(
+            TableName=SUMMARIES_TABLE_NAME,
+            KeyConditionExpression='username = :username',
+            FilterExpression='embedding_model = :model',
+            ExpressionAttributeValues={':username': {'S': username}, ':model': {'S': embedding_model}},
+            ProjectionExpression='sessionId, summary, embedding',
+            **kwargs,
+        )
+        results.extend({
+            'sessionId': item['sessionId']['S'],
+            'summary': item['summary'].get('S', item['summary'].get('B')),
+            'embedding': item['embedding']['B'],
+        } for item in response.get('Items', []))
+        start_key = response.get('LastEvaluatedKey')
+        if not start_key:
+            break
+    return results[:limit]
+
+
+def iter_summary_pages(username: str) -> Iterator[List[Dict]]:
+    """All of a user's summaries, one query page at a time"""
+    params = {
+        'TableName': SUMMARIES_TABLE_NAME,
+        'KeyConditionExpression': 'username = :username',
+        'ExpressionAttributeValues': {':username': {'S': username}},
+    }
+    while True:
+        response = dynamodb.query(**params)
+        yield [item_to_summary(item) for item in response.get('Items', [])]
+        if 'LastEvaluatedKey' not in response:
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def summary_key(username: str, session_id: str) -> Dict:
+    return {'username': {'S': username}, 'sessionId': {'S': session_id}}
+
+
+def message_keys_at(username: str, timestamp: int) -> List[Dict]:
+    """Keys of the user's messages stored at a timestamp, via UserIndex (normally one); resolves
+    the bare timestamps of older posting lists"""
+    response = dynamodb.query(
+        TableName=CHAT_TABLE_NAME,
+        IndexName=CHAT_USER_INDEX_NAME,
+        KeyConditionExpression='username = :username AND #ts = :ts',
+        ExpressionAttributeNames={'#ts': 'timestamp'},
+        ExpressionAttributeValues={':username': {'S': username}, ':ts': {'N': str(timestamp)}},
+    )
+    return [message_key(item['sessionId']['S'], timestamp) for item in response.get('Items', [])]
+
+
+def batch_get_messages(keys: List[Dict]) -> List[Dict]:
+    """Messages for up to BATCH_GET_MAX_KEYS keys, in no particular order; missing rows are left out"""
+    messages = []
+    request = {CHAT_TABLE_NAME: {'Keys': keys}}
+    for attempt in range(BATCH_WRITE_MAX_ATTEMPTS):
+        response = dynamodb.batch_get_item(RequestItems=request)
+        messages.extend(item_to_message(item) for item in response.get('Responses', {}).get(CHAT_TABLE_NAME, []))
+        request = response.get('UnprocessedKeys')
+        if not request:
+            return messages
+        time.sleep(random.uniform(0, min(2.0, 0.05 * 2 ** attempt)))
+    raise UnprocessedItems(f"{len(request[CHAT_TABLE_NAME]['Keys'])} reads from {CHAT_TABLE_NAME} still unprocessed")
+
+
+def add_postings(username: str, term: str, refs: List[str], ttl: int):
+    """Add message refs (posting_ref) to a posting list; the list expires with its newest message"""
+    dynamodb.update_item(
+        TableName=SEARCH_TABLE_NAME,
+        Key=search_key(username, term),
+        UpdateExpression='ADD messages :refs SET #ttl = :ttl',
+        ExpressionAttributeNames={'#ttl': 'ttl'},
+        ExpressionAttributeValues={':refs': {'SS': refs}, ':ttl': {'N': str(ttl)}},
+    )
+
+
+def remove_postings(username: str, term: str, refs: List[str]):
+    """Remove message refs from a posting list (either format), if it still exists"""
+    timestamps = sorted({ref.rpartition('#')[2] for ref in refs})
+    try:
+        dynamodb.update_item(
+            TableName=SEARCH_TABLE_NAME,
+            Key=search_key(username, term),
+            UpdateExpression='DELETE messages :refs, refs :timestamps',
+            # Don't recreate lists already expired or deleted with the account
+            ConditionExpression='attribute_exists(username)',
+            ExpressionAttributeValues={':refs': {'SS': refs}, ':timestamps': {'NS': timestamps}},
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+def add_search_docs(username: str, delta: int, ttl: Optional[int] = None):
+    """Adjust the user's indexed message count; a ttl only ever moves the item's expiry later"""
+    key = search_key(username, SEARCH_STATS_TERM)
+    if ttl:
+        try:
+            dynamodb.update_item(
+                TableName=SEARCH_TABLE_NAME,
+                Key=key,
+                UpdateExpression='ADD docs :delta SET #ttl = :ttl',
+                ConditionExpression='attribute_not_exists(#ttl) OR #ttl < :ttl',
+                ExpressionAttributeNames={'#ttl': 'ttl'},
+                ExpressionAttributeValues={':delta': {'N': str(delta)}, ':ttl': {'N': str(ttl)}},
+            )
+            return
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+    dynamodb.update_item(
+        TableName=SEARCH_TABLE_NAME,
+        Key=key,
+        UpdateExpression='ADD docs :delta',
+        ExpressionAttributeValues={':delta': {'N': str(delta)}},
+    )
+
+
+def get_search_docs(username: str) -> int:
+    item = dynamodb.get_item(
+        TableName=SEARCH_TABLE_NAME,
+        Key=search_key(username, SEARCH_STATS_TERM),
+        ProjectionExpression='docs',
+    ).get('Item')
+    return int(item['docs']['N']) if item and 'docs' in item else 0
+
+
+def query_postings(username: str, token: str) -> List[str]:
+    """Refs of the user's messages containing a token (posting_ref, or a bare timestamp in
+    lists of the older format), from every day's posting list"""
+    params = {
+        'TableName': SEARCH_TABLE_NAME,
+        'KeyConditionExpression': 'username = :username AND begins_with(term, :prefix)',
+        'ExpressionAttributeValues': {':username': {'S': username}, ':prefix': {'S': f"{token}#"}},
+        'ProjectionExpression': 'messages, refs',
+    }
+    refs = []
+    while True:
+        response = dynamodb.query(**params)
+        for item in response.get('Items', []):
+            refs.extend(item.get('messages', {}).get('SS', []))
+            refs.extend(item.get('refs', {}).get('NS', []))
+        if 'LastEvaluatedKey' not in response:
+            return refs
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def iter_search_key_pages(username: str) -> Iterator[List[Dict]]:
+    """Keys of every SearchIndex item of the user, one query page at a time"""
+    params = {
+        'TableName': SEARCH_TABLE_NAME,
+        'KeyConditionExpression': 'username = :username',
+        'ExpressionAttributeValues': {':username': {'S': username}},
+        'ProjectionExpression': 'username, term',
+    }
+    while True:
+        response = dynamodb.query(**params)
+        yield [search_key(username, item['term']['S']) for item in response.get('Items', [])]
+        if 'LastEvaluatedKey' not in response:
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def put_connection(connection_id: str, username: str, connected_at: int, ttl: int):
+    dynamodb.put_item(
+        TableName=CONNECTIONS_TABLE_NAME,
+        Item=connection_to_item(connection_id, username, connected_at, ttl),
+    )
+
+
+def get_connection_user(connection_id: str) -> Optional[str]:
+    item = dynamodb.get_item(
+        TableName=CONNECTIONS_TABLE_NAME,
+        Key={'connectionId': {'S': connection_id}},
+    ).get('Item')
+    return item['username']['S'] if item else None
+
+
+def iter_user_connection_key_pages(username: str) -> Iterator[List[Dict]]:
+    """Keys of the user's WebSocketConnections rows, via its UserIndex"""
+    params = {
+        'TableName': CONNECTIONS_TABLE_NAME,
+        'IndexName': CONNECTIONS_USER_INDEX_NAME,
+        'KeyConditionExpression': 'username = :username',
+        'ExpressionAttributeValues': {':username': {'S': username}},
+    }
+    while True:
+        response = dynamodb.query(**params)
+        yield [{'connectionId': item['connectionId']} for item in response.get('Items', [])]
+        if 'LastEvaluatedKey' not in response:
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def delete_connection(connection_id: str):
+    dynamodb.delete_item(TableName=CONNECTIONS_TABLE_NAME, Key={'connectionId': {'S': connection_id}})
@@ -0,0 +1,203 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Set
+
+import boto3
+
+import data_access
+import idempotency
+import metrics
+import trends
+import usage
+from deadline import Deadline, DeadlineExceeded
+
+# Batches of 25 deletes in flight at once
+DELETE_CONCURRENCY = int(os.environ.get('DELETE_CONCURRENCY', '8'))
+
+# Time DELETE /me spends deleting before handing the rest to the worker
+DELETE_INLINE_BUDGET_SECONDS = float(os.environ.get('DELETE_INLINE_BUDGET_SECONDS', '10'))
+
+# Async function that finishes large deletions; without one, each DELETE /me call continues
+# where the last one stopped
+DELETION_WORKER_FUNCTION_NAME = os.environ.get('DELETION_WORKER_FUNCTION_NAME', '')
+
+# A deletion whose progress hasn't moved for this long is assumed to have stopped
+DELETION_STALE_SECONDS = int(os.environ.get('DELETION_STALE_SECONDS', '120'))
+
+# Progress is written to the Users row about this often
+PROGRESS_EVERY_ITEMS = 1000
+
+_lambda = None
+
+
+def _lambda_client():
+    global _lambda
+    if _lambda is None:
+        _lambda = boto3.client('lambda')
+    return _lambda
+
+
+class BatchDeleter:
+    """Deletes keys from one table in parallel BatchWriteItem calls of 25.
+
+    At most DELETE_CONCURRENCY batches are in flight; add() blocks when they are, so keys
+    can be fed from a paginated query without holding the whole key list.
+    """
+
+    def __init__(self, table_name: str, executor: ThreadPoolExecutor, progress: 'Progress'):
+        self.table_name = table_name
+        self._executor = executor
+        self._progress = progress
+        self._batch: List[Dict] = []
+        self._in_flight: Set[Future] = set()
+
+    def add(self, key: Dict):
+        self._batch.append(key)
+        if len(self._batch) == data_access.BATCH_WRITE_MAX_ITEMS:
+            self._submit()
+
+    def finish(self):
+        if self._batch:
+            self._submit()
+        self._settle(wait(self._in_flight).done)
+
+    def _submit(self):
+        if not self._progress.deadline.remaining():
+            # Let the batches already sent land so the saved progress counts them
+            self._settle(wait(self._in_flight).done)
+            raise DeadlineExceeded('Deletion did not finish within its budget')
+        while len(self._in_flight) >= max(1, DELETE_CONCURRENCY):
+            self._settle(wait(self._in_flight, return_when=FIRST_COMPLETED).done)
+        batch, self._batch = self._batch, []
+        self._in_flight.add(self._executor.submit(data_access.batch_delete, self.table_name, batch))
+
+    def _settle(self, done: Set[Future]):
+        self._in_flight -= done
+        for future in done:
+            self._progress.add(future.result())
+
+
+class Progress:
+    """Deleted item count, written to the user's row every PROGRESS_EVERY_ITEMS"""
+
+    def __init__(self, username: str, deadline: Deadline):
+        self.username = username
+        self.deadline = deadline
+        self.total = 0
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+    def add(self, deleted: int):
+        with self._lock:
+            self.total += deleted
+            self._unsaved += deleted
+            save = self._unsaved >= PROGRESS_EVERY_ITEMS
+        if save:
+            self.save()
+
+    def save(self):
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, 0
+        if unsaved:
+            data_access.record_deletion_progress(self.username, unsaved, int(time.time()))
+
+
+def _legacy_message_keys(username: str, session_ids: List[str]) -> Iterator[Dict]:
+    """Rows in the user's summarized sessions that UserIndex can't find (stored without a username)"""
+    for session_id in session_ids:
+        for page in data_access.iter_session_message_pages(session_id):
+            for item in page:
+                if item.get('username', username) == username:
+                    yield data_access.message_key(session_id, item['timestamp'])
+
+
+def delete_user_data(username: str, deadline: Deadline) -> int:
+    """Delete the user's messages, summaries, search index, usage counters, trend rollups,
+    idempotency records, WebSocket connections and finally the user row.
+
+    Every step is idempotent, so a run cut short by the deadline (DeadlineExceeded) is
+    finished by running it again. Returns the number of items deleted by this run.
+    """
+    start = time.perf_counter()
+    progress = Progress(username, deadline)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, DELETE_CONCURRENCY)) as executor:
+            messages = BatchDeleter(data_access.CHAT_TABLE_NAME, executor, progress)
+            for page in data_access.iter_user_message_key_pages(username):
+                for key in page:
+                    messages.add(data_access.message_key(key['sessionId'], key['timestamp']))
+            messages.finish()
+
+            session_ids = [s['sessionId'] for page in data_access.iter_summary_pages(username) for s in page]
+            legacy = BatchDeleter(data_access.CHAT_TABLE_NAME, executor, progress)
+            for key in _legacy_message_keys(username, session_ids):
+                legacy.add(key)
+            legacy.finish()
+
+            summaries = BatchDeleter(data_access.SUMMARIES_TABLE_NAME, executor, progress)
+            for session_id in session_ids:
+                summaries.add(data_access.summary_key(username, session_id))
+            summaries.finish()
+
+            if data_access.SEARCH_TABLE_NAME:
+                postings = BatchDeleter(data_access.SEARCH_TABLE_NAME, executor, progress)
+                for page in data_access.iter_search_key_pages(username):
+                    for key in page:
+                        postings.add(key)
+                postings.finish()
+
+            if data_access.CONNECTIONS_TABLE_NAME:
+                connections = BatchDeleter(data_access.CONNECTIONS_TABLE_NAME, executor, progress)
+                for page in data_access.iter_user_connection_key_pages(username):
+                    for key in page:
+                        connections.add(key)
+                connections.finish()
+    finally:
+        progress.save()
+
+    usage.delete_usage(username)
+    trends.delete_trends(username)
+    idempotency.delete_records(username)
+    data_access.delete_user(username)
+    metrics.timing('UserDeletionLatency', (time.perf_counter() - start) * 1000)
+    metrics.incr('UserItemsDeleted', progress.total)
+    return progress.total
+
+
+def is_stale(deletion: Dict) -> bool:
+    return time.time() - deletion['updatedAt'] > DELETION_STALE_SECONDS
+
+
+def start_worker(username: str) -> bool:
+    """Hand the rest of a deletion to the async worker; False if none is configured"""
+    if not DELETION_WORKER_FUNCTION_NAME:
+        return False
+    _lambda_client().invoke(
+        FunctionName=DELETION_WORKER_FUNCTION_NAME,
+        InvocationType='Event',
+        Payload=json.dumps({'username': username}).encode('utf-8'),
+    )
+    metrics.incr('UserDeletionHandedOff')
+    return True
+
+
+def worker_handler(event, context):
+    """Async worker for large deletions.
+
+    Raising on the deadline makes Lambda retry the event, which carries on from the
+    progress already made.
+    """
+    username = event['username']
+    deadline = Deadline.from_context(context)
+    try:
+        if data_access.begin_user_deletion(username, int(time.time())) is None:
+            print(f"User {username} is already deleted")
+            return {'status': 'deleted'}
+        deleted = delete_user_data(username, deadline)
+        print(f"Deleted {deleted} items for user {username}")
+        return {'status': 'deleted', 'deletedItems': deleted}
+    finally:
+        metrics.flush()
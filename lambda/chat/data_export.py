@@ -0,0 +1,261 @@
+import os
+import queue
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import boto3
+
+import data_access
+import encryption
+import metrics
+from codec import decode_content
+from deadline import Deadline, DeadlineExceeded
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+EXPORT_BUCKET_NAME = os.environ.get('EXPORT_BUCKET_NAME', '')
+
+# Sessions read at once; each worker pages through one session
+EXPORT_CONCURRENCY = int(os.environ.get('EXPORT_CONCURRENCY', '8'))
+# Pages fetched but not yet written; workers block when it is full, so memory stays flat
+EXPORT_QUEUE_PAGES = int(os.environ.get('EXPORT_QUEUE_PAGES', '32'))
+
+# Exports up to this size are returned in the response body (API Gateway caps Lambda
+# responses near 6 MB); larger ones go to EXPORT_BUCKET_NAME
+EXPORT_INLINE_MAX_BYTES = int(os.environ.get('EXPORT_INLINE_MAX_BYTES', str(4 * 1024 * 1024)))
+EXPORT_URL_TTL_SECONDS = int(os.environ.get('EXPORT_URL_TTL_SECONDS', '900'))
+
+# S3 multipart parts other than the last must be at least 5 MiB
+PART_BYTES = 8 * 1024 * 1024
+
+EXPORT_FORMAT_VERSION = 1
+
+_s3 = None
+
+
+def _s3_client():
+    global _s3
+    if _s3 is None:
+        _s3 = boto3.client('s3')
+    return _s3
+
+
+def _line(record: Dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record) + b'\n'
+    return json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class ExportSink:
+    """NDJSON output that stays in memory until EXPORT_INLINE_MAX_BYTES, then spills to S3.
+
+    Once spilled, lines are gzip-compressed into a multipart upload part by part, so only
+    one part is ever held. force_s3 spills from the start.
+    """
+
+    def __init__(self, key: str, force_s3: bool = False):
+        self.key = key
+        self.bytes_written = 0
+        self._inline: List[bytes] = []
+        self._inline_bytes = 0
+        self._compressor = None
+        self._part = bytearray()
+        self._parts: List[Dict] = []
+        self._upload_id = None
+        if force_s3:
+            self._spill()
+
+    @property
+    def spilled(self) -> bool:
+        return self._compressor is not None
+
+    def write(self, data: bytes):
+        self.bytes_written += len(data)
+        if not self.spilled:
+            self._inline.append(data)
+            self._inline_bytes += len(data)
+            if self._inline_bytes <= EXPORT_INLINE_MAX_BYTES:
+                return
+            self._spill()
+            return
+        self._part += self._compressor.compress(data)
+        if len(self._part) >= PART_BYTES:
+            self._upload_part()
+
+    def _spill(self):
+        if not EXPORT_BUCKET_NAME:
+            raise ExportTooLarge('Export is too large to return inline and EXPORT_BUCKET_NAME is not set')
+        # wbits=31 writes a gzip container
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        self._upload_id = _s3_client().create_multipart_upload(
+            Bucket=EXPORT_BUCKET_NAME, Key=self.key,
+            ContentType='application/x-ndjson', ContentEncoding='gzip',
+        )['UploadId']
+        pending, self._inline, self._inline_bytes = self._inline, [], 0
+        for data in pending:
+            self._part += self._compressor.compress(data)
+        metrics.incr('ExportSpilledToS3')
+
+    def _upload_part(self):
+        number = len(self._parts) + 1
+        etag = _s3_client().upload_part(
+            Bucket=EXPORT_BUCKET_NAME, Key=self.key, UploadId=self._upload_id,
+            PartNumber=number, Body=bytes(self._part),
+        )['ETag']
+        self._parts.append({'PartNumber': number, 'ETag': etag})
+        self._part = bytearray()
+
+    def inline_body(self) -> str:
+        return b''.join(self._inline).decode('utf-8')
+
+    def finish(self) -> Optional[str]:
+        """Complete the upload and return a presigned URL, or None for an inline export"""
+        if not self.spilled:
+            return None
+        self._part += self._compressor.flush()
+        self._upload_part()
+        _s3_client().complete_multipart_upload(
+            Bucket=EXPORT_BUCKET_NAME, Key=self.key, UploadId=self._upload_id,
+            MultipartUpload={'Parts': self._parts},
+        )
+        return _s3_client().generate_presigned_url(
+            'get_object', Params={'Bucket': EXPORT_BUCKET_NAME, 'Key': self.key},
+            ExpiresIn=EXPORT_URL_TTL_SECONDS,
+        )
+
+    def abort(self):
+        if self._upload_id:
+            try:
+                _s3_client().abort_multipart_upload(Bucket=EXPORT_BUCKET_NAME, Key=self.key, UploadId=self._upload_id)
+            except Exception as e:
+                print(f"Aborting export upload {self.key} failed: {str(e)}")
+
+
+class ExportTooLarge(Exception):
+    """Raised when an export exceeds the inline limit and no export bucket is configured"""
+
+
+def iter_user_session_ids(username: str) -> Iterator[str]:
+    """Sessions with messages stored under the user (UserIndex) or a summary for the user"""
+    seen = set()
+    for page in data_access.iter_user_message_key_pages(username):
+        for key in page:
+            if key['sessionId'] not in seen:
+                seen.add(key['sessionId'])
+                yield key['sessionId']
+    for page in data_access.iter_summary_pages(username):
+        for summary in page:
+            if summary['sessionId'] not in seen:
+                seen.add(summary['sessionId'])
+                yield summary['sessionId']
+
+
+_DONE = object()
+
+
+def _fetch_sessions(username: str, pages: queue.Queue, stop: threading.Event, counts: Dict):
+    """Workers page through sessions concurrently, handing each page to the writer.
+
+    Sessions are submitted as the index pages listing them arrive, so reading starts
+    before the user's whole key list has been read.
+    """
+    def fetch(session_id: str):
+        try:
+            for page in data_access.iter_session_message_pages(session_id):
+                if stop.is_set():
+                    return
+                pages.put((session_id, page))
+        except Exception as e:
+            pages.put((session_id, e))
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, EXPORT_CONCURRENCY)) as executor:
+            for session_id in iter_user_session_ids(username):
+                if stop.is_set():
+                    break
+                counts['sessions'] += 1
+                executor.submit(fetch, session_id)
+    except Exception as e:
+        pages.put((None, e))
+    pages.put(_DONE)
+
+
+def _message_records(username: str, session_id: str, page: List[Dict]) -> Iterator[Dict]:
+    # Rows written by another user under the same sessionId are not part of this export;
+    # rows from before usernames were stored are kept
+    page = [item for item in page if item.get('username', username) == username]
+    contents = encryption.decrypt_many(username, [
+        (item['content'], encryption.message_aad(session_id, item['timestamp'])) for item in page
+    ])
+    for item, content in zip(page, contents):
+        if content is None:
+            continue
+        yield {
+            'type': 'message',
+            'sessionId': session_id,
+            'timestamp': item['timestamp'],
+            'role': item['role'],
+            'content': decode_content(content),
+        }
+
+
+def export_user(username: str, sink: ExportSink, deadline: Deadline) -> Dict:
+    """Write every summary and message of the user to sink as NDJSON; returns counts"""
+    start = time.perf_counter()
+    sink.write(_line({'type': 'export', 'version': EXPORT_FORMAT_VERSION,
+                      'username': username, 'exportedAt': int(time.time())}))
+
+    counts = {'sessions': 0, 'summaries': 0, 'messages': 0}
+    for page in data_access.iter_summary_pages(username):
+        texts = encryption.decrypt_many(username, [
+            (s['summary'], encryption.summary_aad(username, s['sessionId'])) for s in page
+        ])
+        for summary, text in zip(page, texts):
+            if text is None:
+                continue
+            sink.write(_line({'type': 'summary', **summary, 'summary': text}))
+            counts['summaries'] += 1
+
+    pages: queue.Queue = queue.Queue(maxsize=max(1, EXPORT_QUEUE_PAGES))
+    stop = threading.Event()
+    producer = threading.Thread(target=_fetch_sessions, args=(username, pages, stop, counts), daemon=True)
+    producer.start()
+    try:
+        while True:
+            try:
+                item = pages.get(timeout=max(0.01, deadline.remaining()))
+            except queue.Empty:
+                raise DeadlineExceeded('Export did not finish in time')
+            if item is _DONE:
+                break
+            session_id, page = item
+            if isinstance(page, Exception):
+                raise page
+            for record in _message_records(username, session_id, page):
+                sink.write(_line(record))
+                counts['messages'] += 1
+    except BaseException:
+        stop.set()
+        # Unblock workers waiting on a full queue so they see the stop flag
+        while producer.is_alive():
+            try:
+                pages.get_nowait()
+            except queue.Empty:
+                producer.join(0.05)
+        raise
+
+    sink.write(_line({'type': 'end', **counts}))
+    metrics.timing('ExportLatency', (time.perf_counter() - start) * 1000)
+    metrics.incr('ExportedMessages', counts['messages'])
+    return counts
+
+
+def export_key(username: str) -> str:
+    return f"exports/{username}/{int(time.time())}-{os.urandom(4).hex()}.ndjson.gz"
@@ -0,0 +1,57 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, List, Optional, Tuple
+
+# Time kept back from the Lambda timeout to build and return a response
+RESPONSE_RESERVE_MS = int(os.environ.get('RESPONSE_RESERVE_MS', '1500'))
+
+# Used when no Lambda context is available (local runs)
+DEFAULT_TIMEOUT_MS = 30000
+
+_executor = ThreadPoolExecutor(max_workers=4)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage cannot finish within the invocation's remaining time"""
+
+
+class Deadline:
+    """Time budget for one invocation, derived from the Lambda context"""
+
+    def __init__(self, remaining_ms: float, reserve_ms: float = RESPONSE_RESERVE_MS):
+        self._expires_at = time.monotonic() + max(0.0, remaining_ms - reserve_ms) / 1000
+
+    @classmethod
+    def from_context(cls, context) -> 'Deadline':
+        if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+            return cls(context.get_remaining_time_in_millis())
+        return cls(DEFAULT_TIMEOUT_MS)
+
+    def remaining(self) -> float:
+        """Seconds left before the response must be returned"""
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def budget(self, cap: Optional[float] = None) -> float:
+        """Seconds a stage may use: the remaining time, optionally capped"""
+        remaining = self.remaining()
+        return remaining if cap is None else min(cap, remaining)
+
+    def has(self, seconds: float) -> bool:
+        return self.remaining() >= seconds
+
+    def run(self, fn: Callable, *args, cap: Optional[float] = None):
+        """Run fn within the stage budget or raise DeadlineExceeded"""
+        return self.run_all([(fn, args)], cap=cap)[0]
+
+    def run_all(self, calls: List[Tuple[Callable, tuple]], cap: Optional[float] = None) -> list:
+        """Run calls concurrently and wait for all of them within the stage budget"""
+        budget = self.budget(cap)
+        if budget <= 0:
+            raise DeadlineExceeded('No time left for stage')
+        stop_at = time.monotonic() + budget
+        futures = [_executor.submit(fn, *args) for fn, args in calls]
+        try:
+            return [f.result(timeout=max(0.0, stop_at - time.monotonic())) for f in futures]
+        except FutureTimeout:
+            raise DeadlineExceeded(f"Stage did not finish within {budget:.2f}s")
@@ -0,0 +1,236 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+import boto3
+
+import data_access
+import metrics
+
+try:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+# 'kms' (CONTENT_KMS_KEY_ID wraps the per-user data keys), 'local' (LocalKms, for tests and
+# local runs) or 'off'
+CONTENT_ENCRYPTION = os.environ.get('CONTENT_ENCRYPTION', 'off').lower()
+CONTENT_KMS_KEY_ID = os.environ.get('CONTENT_KMS_KEY_ID', '')
+
+# Base64 32-byte master key for LocalKms; without one, data is only readable by this process
+CONTENT_LOCAL_KMS_KEY = os.environ.get('CONTENT_LOCAL_KMS_KEY', '')
+
+# Unwrapped data keys kept in the container
+DATA_KEY_CACHE_TTL_SECONDS = float(os.environ.get('DATA_KEY_CACHE_TTL_SECONDS', '300'))
+DATA_KEY_CACHE_MAX_USERS = int(os.environ.get('DATA_KEY_CACHE_MAX_USERS', '256'))
+
+# First byte of an encrypted value; distinct from the codec's compression format bytes (1-3)
+FORMAT_AESGCM = 16
+# First byte of the plaintext when the value being encrypted was a plain string
+_PLAIN_TEXT = b'\x00'
+# First byte of the plaintext for raw bytes (encrypt_blob); encoded content starts with a
+# codec format byte (1-3)
+_RAW_BYTES = b'\x04'
+
+NONCE_BYTES = 12
+
+
+class LocalKms:
+    """In-process stand-in for the two KMS calls used here: GenerateDataKey and Decrypt.
+
+    Data keys are wrapped with AES-GCM under a master key, with the encryption context as
+    associated data, so a wrapped key only unwraps for the user it was made for.
+    """
+
+    def __init__(self, master_key: Optional[bytes] = None):
+        self._master = AESGCM(master_key or AESGCM.generate_key(bit_length=256))
+
+    def generate_data_key(self, KeyId: str, KeySpec: str = 'AES_256', EncryptionContext: Dict = None):
+        plaintext = os.urandom(32)
+        nonce = os.urandom(NONCE_BYTES)
+        blob = nonce + self._master.encrypt(nonce, plaintext, _context_aad(EncryptionContext))
+        return {'KeyId': KeyId, 'Plaintext': plaintext, 'CiphertextBlob': blob}
+
+    def decrypt(self, CiphertextBlob: bytes, EncryptionContext: Dict = None, KeyId: str = None):
+        nonce, sealed = CiphertextBlob[:NONCE_BYTES], CiphertextBlob[NONCE_BYTES:]
+        return {'KeyId': KeyId, 'Plaintext': self._master.decrypt(nonce, sealed, _context_aad(EncryptionContext))}
+
+
+def _context_aad(context: Optional[Dict]) -> bytes:
+    return '&'.join(f"{k}={v}" for k, v in sorted((context or {}).items())).encode('utf-8')
+
+
+_kms_client = None
+
+
+def _kms():
+    global _kms_client
+    if _kms_client is None:
+        if CONTENT_ENCRYPTION == 'local':
+            if not CONTENT_LOCAL_KMS_KEY:
+                print("CONTENT_LOCAL_KMS_KEY is not set; encrypted data will not survive this process")
+            _kms_client = LocalKms(base64.b64decode(CONTENT_LOCAL_KMS_KEY) if CONTENT_LOCAL_KMS_KEY else None)
+        else:
+            _kms_client = boto3.client('kms')
+    return _kms_client
+
+
+def enabled() -> bool:
+    if CONTENT_ENCRYPTION not in ('kms', 'local'):
+        return False
+    if AESGCM is None:
+        raise RuntimeError('CONTENT_ENCRYPTION needs the cryptography package')
+    return True
+
+
+_keys: OrderedDict = OrderedDict()  # username -> ((AESGCM, token key), expires_at)
+_keys_lock = threading.Lock()
+# Serializes cache misses so concurrent writes for one user make a single KMS call
+_load_lock = threading.Lock()
+
+
+def _cached_keys(username: str):
+    with _keys_lock:
+        entry = _keys.get(username)
+        if entry and entry[1] > time.monotonic():
+            _keys.move_to_end(username)
+            return entry[0]
+    return None
+
+
+def _user_keys(username: str):
+    """(AES-GCM cipher, search token key) from the user's data key, unwrapping or creating
+    the key on a miss"""
+    keys = _cached_keys(username)
+    if keys is not None:
+        metrics.incr('DataKeyCacheHit')
+        return keys
+
+    with _load_lock:
+        keys = _cached_keys(username)
+        if keys is not None:
+            return keys
+        metrics.incr('DataKeyCacheMiss')
+        context = {'username': username}
+        plaintext = None
+        wrapped = data_access.get_user_data_key(username)
+        if wrapped is None:
+            generated = _kms().generate_data_key(KeyId=CONTENT_KMS_KEY_ID, KeySpec='AES_256', EncryptionContext=context)
+            if data_access.put_user_data_key(username, generated['CiphertextBlob']):
+                plaintext = generated['Plaintext']
+            else:
+                # Another container stored a key first; use that one
+                wrapped = data_access.get_user_data_key(username)
+                if wrapped is None:
+                    raise LookupError(f"User {username} does not exist to hold a data key")
+        if plaintext is None:
+            plaintext = _kms().decrypt(CiphertextBlob=wrapped, EncryptionContext=context)['Plaintext']
+        keys = (AESGCM(plaintext), hmac.new(plaintext, b'search-tokens', hashlib.sha256).digest())
+
+        with _keys_lock:
+            _keys[username] = (keys, time.monotonic() + DATA_KEY_CACHE_TTL_SECONDS)
+            while len(_keys) > DATA_KEY_CACHE_MAX_USERS:
+                _keys.popitem(last=False)
+        return keys
+
+
+def user_cipher(username: str):
+    """AES-GCM cipher for the user's data key"""
+    return _user_keys(username)[0]
+
+
+def forget_user(username: str):
+    """Drop a user's cached data key (e.g. after the stored key is deleted)"""
+    with _keys_lock:
+        _keys.pop(username, None)
+
+
+def _seal(cipher, value: Union[str, bytes], aad: bytes) -> bytes:
+    plaintext = _PLAIN_TEXT + value.encode('utf-8') if isinstance(value, str) else value
+    nonce = os.urandom(NONCE_BYTES)
+    return bytes([FORMAT_AESGCM]) + nonce + cipher.encrypt(nonce, plaintext, aad)
+
+
+def _open(cipher, data: bytes, aad: bytes) -> Union[str, bytes]:
+    plaintext = cipher.decrypt(data[1:1 + NONCE_BYTES], data[1 + NONCE_BYTES:], aad)
+    if plaintext[:1] == _PLAIN_TEXT:
+        return plaintext[1:].decode('utf-8')
+    if plaintext[:1] == _RAW_BYTES:
+        return plaintext[1:]
+    return plaintext
+
+
+def is_encrypted(value) -> bool:
+    return isinstance(value, (bytes, bytearray)) and len(value) > 1 + NONCE_BYTES and value[0] == FORMAT_AESGCM
+
+
+def encrypt(username: str, value: Union[str, bytes], aad: str) -> Union[str, bytes]:
+    """Encrypt an encoded content value (string or compressed blob) under the user's key.
+
+    aad names the row the value belongs to, so a ciphertext can't be moved to another row.
+    """
+    if not enabled() or not username:
+        return value
+    return _seal(user_cipher(username), value, aad.encode('utf-8'))
+
+
+def encrypt_blob(username: str, data: bytes, aad: str) -> bytes:
+    """Encrypt raw bytes that aren't an encoded content value (e.g. an embedding)"""
+    if not enabled() or not username:
+        return data
+    return _seal(user_cipher(username), _RAW_BYTES + data, aad.encode('utf-8'))
+
+
+def decrypt_many(username: str, values: List[Tuple[object, str]]) -> List[Optional[Union[str, bytes]]]:
+    """Decrypt several (value, aad) pairs with one key lookup; None where a value won't open.
+
+    Values that were never encrypted pass through unchanged.
+    """
+    results = []
+    cipher = None
+    for value, aad in values:
+        if not is_encrypted(value):
+            results.append(value)
+            continue
+        if not username:
+            results.append(None)
+            continue
+        if cipher is None:
+            cipher = user_cipher(username)
+        try:
+            results.append(_open(cipher, bytes(value), aad.encode('utf-8')))
+        except Exception:
+            # Another user's row or a tampered value
+            metrics.incr('DecryptFailures')
+            results.append(None)
+    return results
+
+
+def blind_tokens(username: str, tokens: List[str]) -> List[str]:
+    """Keyed hashes of search tokens, so the search index holds no readable words.
+
+    Keyed by the user's data key when content is encrypted: the same word hashes
+    differently for every user, and deleting the data key orphans the hashes.
+    """
+    key = _user_keys(username)[1] if enabled() and username else b''
+    return [
+        base64.urlsafe_b64encode(hashlib.blake2b(token.encode('utf-8'), digest_size=9, key=key).digest()).decode('ascii')
+        for token in tokens
+    ]
+
+
+def message_aad(session_id: str, timestamp: int) -> str:
+    return f"message:{session_id}:{timestamp}"
+
+
+def summary_aad(username: str, session_id: str) -> str:
+    return f"summary:{username}:{session_id}"
+
+
+def embedding_aad(username: str, session_id: str) -> str:
+    return f"embedding:{username}:{session_id}"
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+
+class HistoryCache:
+    """Bounded LRU of shaped conversation history keyed by sessionId.
+
+    Each entry holds the history list sent to the LLM plus the newest stored timestamp, so a
+    warm container only has to query for rows written after it. Entries are evicted
+    least-recently-used first when either the entry count or the byte budget is exceeded.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()  # session_id -> (history, last_timestamp, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Tuple[List[Dict], int]]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self.misses += 1
+                metrics.incr('HistoryCacheMiss')
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            metrics.incr('HistoryCacheHit')
+            return list(entry[0]), entry[1]
+
+    def put(self, session_id: str, history: List[Dict], last_timestamp: int):
+        size = _estimate_size(history)
+        with self._lock:
+            self._discard(session_id)
+            if size > self.max_bytes:
+                return
+            self._entries[session_id] = (list(history), last_timestamp, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self.evictions += 1
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            self._discard(session_id)
+
+    def invalidate_prefix(self, prefix: str):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self._discard(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+            }
+
+    def _discard(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+
+def _estimate_size(history: List[Dict]) -> int:
+    # UTF-8 payload plus a rough per-message allowance for the dict and role string
+    return sum(len(m['content'].encode('utf-8')) + 100 for m in history)
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import time
+from typing import Dict, Optional
+
+import boto3
+from botocore.exceptions import ClientError
+
+import encryption
+import metrics
+
+IDEMPOTENCY_TABLE_NAME = os.environ.get('IDEMPOTENCY_TABLE_NAME', '')
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+
+# An in-progress record older than this is assumed abandoned (longer than the Lambda timeout)
+IN_PROGRESS_TIMEOUT_SECONDS = int(os.environ.get('IDEMPOTENCY_IN_PROGRESS_TIMEOUT_SECONDS', '35'))
+
+# Keys-only GSI (username) for deleting a user's records
+USER_INDEX_NAME = 'UserIndex'
+
+IN_PROGRESS = 'in_progress'
+COMPLETED = 'completed'
+
+idempotency_table = boto3.resource('dynamodb').Table(IDEMPOTENCY_TABLE_NAME) if IDEMPOTENCY_TABLE_NAME else None
+
+
+def get_key(event) -> Optional[str]:
+    """Read the Idempotency-Key header (case-insensitive)"""
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'idempotency-key' and value:
+            return value.strip()[:128]
+    return None
+
+
+def fingerprint(*parts: str) -> str:
+    """Hash of the request payload, used to reject a key reused for a different request"""
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def begin(username: str, key: str, request_hash: str) -> Optional[Dict]:
+    """Claim the key for this request.
+
+    Returns None when the caller should process the request, otherwise the existing record
+    (completed or still in progress) for the caller to answer from.
+    """
+    if idempotency_table is None:
+        return None
+
+    now = int(time.time())
+    try:
+        idempotency_table.put_item(
+            Item={
+                'key': f"{username}#{key}",
+                'username': username,
+                'status': IN_PROGRESS,
+                'request_hash': request_hash,
+                'started_at': now,
+                'ttl': now + IDEMPOTENCY_TTL_SECONDS,
+            },
+            ConditionExpression=(
+                'attribute_not_exists(#key) OR #ttl < :now '
+                'OR (#status = :in_progress AND started_at < :stale)'
+            ),
+            ExpressionAttributeNames={'#key': 'key', '#ttl': 'ttl', '#status': 'status'},
+            ExpressionAttributeValues={
+                ':now': now,
+                ':in_progress': IN_PROGRESS,
+                ':stale': now - IN_PROGRESS_TIMEOUT_SECONDS,
+            },
+        )
+        return None
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+    record = idempotency_table.get_item(Key={'key': f"{username}#{key}"}, ConsistentRead=True).get('Item')
+    metrics.incr('IdempotentDuplicate', Status=record['status'] if record else 'missing')
+    return record
+
+
+def _response_aad(username: str, key: str) -> str:
+    return f"idempotency:{username}#{key}"
+
+
+def complete(username: str, key: str, response: Dict):
+    """Store the final response so duplicates can be answered without re-running the request.
+
+    The body holds the reply with personal details restored, so it is encrypted under the
+    user's data key like the stored messages.
+    """
+    if idempotency_table is None:
+        return
+    idempotency_table.update_item(
+        Key={'key': f"{username}#{key}"},
+        UpdateExpression='SET #status = :completed, status_code = :code, response_body = :body',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={
+            ':completed': COMPLETED,
+            ':code': response['statusCode'],
+            ':body': encryption.encrypt(username, response['body'], _response_aad(username, key)),
+        },
+    )
+
+
+def response_body(username: str, key: str, record: Dict) -> Optional[str]:
+    """The stored response body of a completed record; None if it can't be decrypted"""
+    value = record['response_body']
+    value = getattr(value, 'value', value)  # boto3 returns binary attributes as Binary
+    return encryption.decrypt_many(username, [(value, _response_aad(username, key))])[0]
+
+
+def release(username: str, key: str):
+    """Drop an in-progress claim after a failure so the client can retry"""
+    if idempotency_table is None:
+        return
+    try:
+        idempotency_table.delete_item(
+            Key={'key': f"{username}#{key}"},
+            ConditionExpression='#status = :in_progress',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':in_progress': IN_PROGRESS},
+        )
+    except ClientError as e:
+        print(f"Could not release idempotency key: {e.response['Error']['Code']}")
+
+
+def delete_records(username: str):
+    """Delete all of a user's idempotency records (they hold the user's replies)"""
+    if idempotency_table is None:
+        return
+    params = {
+        'IndexName': USER_INDEX_NAME,
+        'KeyConditionExpression': 'username = :username',
+        'ExpressionAttributeValues': {':username': username},
+    }
+    # batch_writer sends 25-item batches and resends unprocessed items
+    with idempotency_table.batch_writer() as batch:
+        while True:
+            response = idempotency_table.query(**params)
+            for item in response.get('Items', []):
+                batch.delete_item(Key={'key': item['key']})
+            if 'LastEvaluatedKey' not in response:
+                break
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
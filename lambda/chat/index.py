@@ -5,55 +5,181 @@ import hashlib
 import hmac
 import base64
 from decimal import Decimal
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Tuple
 from uuid import uuid4
-import boto3
-from llm_provider import call_llm
-
-dynamodb = boto3.resource('dynamodb')
-chat_table = dynamodb.Table(os.environ['CHAT_TABLE_NAME'])
-users_table = dynamodb.Table(os.environ['USERS_TABLE_NAME'])
-summaries_table = dynamodb.Table(os.environ['SUMMARIES_TABLE_NAME'])
-
-DATA_RETENTION_DAYS = int(os.environ.get('DATA_RETENTION_DAYS', '30'))
-SYSTEM_PROMPT = os.environ.get('SYSTEM_PROMPT', 'You are a helpful AI assistant.')
+import admission
+import data_access
+import data_deletion
+import data_export
+import encryption
+import idempotency
+import memory
+import metrics
+import redaction
+import runtime_config
+import search
+import traffic_capture
+import trends
+import usage
+import websocket_channel
+from admission import admit, AdmissionDenied
+from auth_tokens import generate_user_token, token_from_header, verify_user_token
+from codec import encode_content, decode_content
+from deadline import Deadline, DeadlineExceeded
+from history_cache import HistoryCache
+from llm_provider import invoke_llm, LLMUnavailableError
+from screening import CRISIS_HIGH_ACTION, CRISIS_RESOURCES_MESSAGE, HIGH, screen_message
+from usage import QuotaExceeded
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The system prompt and DATA_RETENTION_DAYS are runtime_config settings, re-read per request
+HISTORY_LIMIT = 20  # Last 10 exchanges
+
+# Per-stage budgets in seconds; summarization is skipped unless this much time remains
+HISTORY_BUDGET_SECONDS = float(os.environ.get('HISTORY_BUDGET_SECONDS', '3'))
+SUMMARY_MIN_BUDGET_SECONDS = float(os.environ.get('SUMMARY_MIN_BUDGET_SECONDS', '8'))
+MEMORY_BUDGET_SECONDS = float(os.environ.get('MEMORY_BUDGET_SECONDS', '1'))
+
+SUMMARY_UNAVAILABLE = 'Conversation summary unavailable'
+
+DEGRADED_REPLY = (
+    "I'm sorry, I'm taking longer than usual to respond right now. "
+    "Please send your message again in a moment."
+)
+
+# Warm-container cache of recent history per session
+history_cache = HistoryCache(
+    max_entries=int(os.environ.get('HISTORY_CACHE_MAX_ENTRIES', '256')),
+    max_bytes=int(os.environ.get('HISTORY_CACHE_MAX_BYTES', str(8 * 1024 * 1024))),
+)
+
+# With TRAFFIC_CAPTURE=on, captured requests include the latency of their DynamoDB calls
+traffic_capture.instrument(data_access.dynamodb, admission.dynamodb, usage.usage_table,
+                           idempotency.idempotency_table, trends.trends_table)
+
+ADMIN_USERNAMES = {u.strip().lower() for u in os.environ.get('ADMIN_USERNAMES', '').split(',') if u.strip()}
 
 
 def handler(event, context):
     """Lambda handler for all API requests"""
+    deadline = Deadline.from_context(context)
+    capture = traffic_capture.begin(event)
+    response = None
     try:
-        path = event.get('path', '')
-        method = event.get('httpMethod', '')
-        
-        if path == '/auth/register' and method == 'POST':
-            return handle_register(event)
-        elif path == '/auth/login' and method == 'POST':
-            return handle_login(event)
-        elif path == '/chat' and method == 'POST':
-            return handle_chat(event)
-        elif path == '/summaries' and method == 'GET':
-            return handle_get_summaries(event)
-        else:
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'Endpoint not found'})
-            }
-
+        response = route_request(event, deadline)
+        return response
+    
     except Exception as e:
-        print(f"Error processing request: {str(e)}")
+        response = exception_response(e)
+        return response
+    
+    finally:
+        usage.wait_pending(deadline.remaining())
+        trends.wait_pending(deadline.remaining())
+        metrics.flush()
+        traffic_capture.finish(capture, response)
+
+
+def route_request(event, deadline: Deadline) -> dict:
+    """Dispatch an API Gateway event to its route's handler"""
+    if websocket_channel.is_websocket_event(event):
+        traffic_capture.note(route=f"WS {event['requestContext'].get('routeKey', '')}")
+        return handle_websocket(event, deadline)
+    
+    path, method = request_route(event)
+    traffic_capture.note(route=f"{method} {path}"[:64])
+    
+    if path == '/auth/register' and method == 'POST':
+        return handle_register(event)
+    elif path == '/auth/login' and method == 'POST':
+        return handle_login(event)
+    elif path == '/chat' and method == 'POST':
+        return handle_chat(event, deadline)
+    elif path == '/summaries' and method == 'GET':
+        return handle_get_summaries(event)
+    elif path == '/admin/usage' and method == 'GET':
+        return handle_admin_usage(event)
+    elif path == '/search' and method == 'GET':
+        return handle_search(event, deadline)
+    elif path == '/trends' and method == 'GET':
+        return handle_trends(event)
+    elif path == '/export' and method == 'GET':
+        return handle_export(event, deadline)
+    elif path == '/me' and method == 'GET':
+        return handle_get_me(event)
+    elif path == '/me' and method == 'DELETE':
+        return handle_delete_me(event, deadline)
+    else:
         return {
-            'statusCode': 500,
+            'statusCode': 404,
             'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Internal server error'})
+            'body': json.dumps({'error': 'Endpoint not found'})
         }
 
 
+def exception_response(e: Exception) -> dict:
+    """Map an exception raised while handling a request to its error response"""
+    if isinstance(e, AdmissionDenied):
+        return error_response(
+            'Too many requests. Please wait a moment and try again.',
+            429,
+            headers={'Retry-After': str(e.retry_after)}
+        )
+
+    if isinstance(e, QuotaExceeded):
+        return error_response(
+            'Daily usage limit reached. Please come back tomorrow.',
+            429,
+            headers={'Retry-After': str(e.retry_after)}
+        )
+
+    if isinstance(e, DeadlineExceeded):
+        print(f"Request deadline exceeded: {str(e)}")
+        return error_response('The request took too long. Please try again.', 504)
+
+    if isinstance(e, LLMUnavailableError):
+        print(f"LLM unavailable: {str(e)}")
+        return error_response('The assistant is temporarily unavailable. Please try again shortly.', 503)
+
+    print(f"Error processing request: {str(e)}")
+    return {
+        'statusCode': 500,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({'error': 'Internal server error'})
+    }
+
+
+def request_route(event) -> Tuple[str, str]:
+    """(path, method) for REST API (payload 1.0) and HTTP API (payload 2.0) events"""
+    if event.get('version') == '2.0':
+        context = event.get('requestContext') or {}
+        path = event.get('rawPath', '')
+        # Named stages are part of rawPath on HTTP APIs: /prod/chat -> /chat
+        stage = context.get('stage')
+        if stage and stage != '$default' and path.startswith(f"/{stage}/"):
+            path = path[len(stage) + 1:]
+        return path, context.get('http', {}).get('method', '')
+    return event.get('path', ''), event.get('httpMethod', '')
+
+
+def request_body(event) -> dict:
+    """Parsed JSON body; HTTP APIs may deliver it base64 encoded"""
+    body = event.get('body') or '{}'
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    return json.loads(body)
+
+
 def handle_register(event):
     """Handle user registration"""
-    body = json.loads(event.get('body', '{}'))
+    body = request_body(event)
     username = body.get('username', '').strip().lower()
     password = body.get('password', '')
+    traffic_capture.note_user(username)
     
     if not username or not password:
         return error_response('Username and password are required', 400)
@@ -61,47 +187,40 @@ def handle_register(event):
     if len(password) < 6:
         return error_response('Password must be at least 6 characters', 400)
     
-    # Check if user exists
-    try:
-        users_table.get_item(Key={'username': username})['Item']
-        return error_response('Username already exists', 409)
-    except KeyError:
-        pass  # User doesn't exist, good to proceed
-    
     # Hash password
     password_hash = hash_password(password)
     
-    # Create user
-    users_table.put_item(
-        Item={
-            'username': username,
-            'password_hash': password_hash,
-            'created_at': int(time.time()),
-        }
-    )
+    # Create user; the conditional put replaces a separate existence check
+    try:
+        data_access.create_user(username, password_hash, int(time.time()))
+    except data_access.AlreadyExists:
+        return error_response('Username already exists', 409)
     
     return success_response({'message': 'User registered successfully'})
 
 
 def handle_login(event):
     """Handle user login"""
-    body = json.loads(event.get('body', '{}'))
+    body = request_body(event)
     username = body.get('username', '').strip().lower()
     password = body.get('password', '')
+    traffic_capture.note_user(username)
     
     if not username or not password:
         return error_response('Username and password are required', 400)
     
     # Get user
-    try:
-        user = users_table.get_item(Key={'username': username})['Item']
-    except KeyError:
+    user = data_access.get_user(username)
+    if not user:
         return error_response('Invalid username or password', 401)
     
     # Verify password
     if not verify_password(password, user['password_hash']):
         return error_response('Invalid username or password', 401)
     
+    if user.get('deletion'):
+        return error_response('This account is being deleted', 403)
+    
     # Generate session token (simple JWT-like token)
     token = generate_user_token(username)
     
@@ -112,63 +231,291 @@ def handle_login(event):
     })
 
 
-def handle_chat(event):
+def handle_chat(event, deadline: Deadline):
     """Handle chat requests"""
-    body = json.loads(event.get('body', '{}'))
+    body = request_body(event)
     message = body.get('message')
     session_id = body.get('sessionId', str(uuid4()))
-    token = body.get('token')
     
     if not message:
         return error_response('Message is required', 400)
     
-    # Verify user token
-    username = verify_user_token(token)
+    username = authenticated_user(event, body.get('token'))
     if not username:
         return error_response('Invalid or expired token', 401)
     
+    # A retried request with the same Idempotency-Key is answered from the first attempt
+    idempotency_key = idempotency.get_key(event)
+    if idempotency_key:
+        # A session id defaulted above is new on every attempt, so only a sent one counts
+        request_hash = idempotency.fingerprint(body.get('sessionId', ''), message)
+        existing = idempotency.begin(username, idempotency_key, request_hash)
+        if existing:
+            return idempotent_replay(existing, request_hash, username, idempotency_key)
+        try:
+            response = process_chat_turn(username, session_id, message, deadline)
+        except Exception:
+            idempotency.release(username, idempotency_key)
+            raise
+        # A degraded reply asks the client to send again, so the retry must run the turn anew
+        if response['statusCode'] == 200 and not json.loads(response['body']).get('degraded'):
+            idempotency.complete(username, idempotency_key, response)
+        else:
+            idempotency.release(username, idempotency_key)
+        return response
+    
+    return process_chat_turn(username, session_id, message, deadline)
+
+
+def process_chat_turn(username: str, session_id: str, message: str, deadline: Deadline,
+                      on_delta: Optional[Callable[[str], None]] = None) -> dict:
+    """Screen the message for crisis language, then run the chat turn
+
+    on_delta receives the reply's text as it streams from the provider (WebSocket clients).
+    """
+    screening = screen_message(message)
+    if not screening.flagged:
+        return chat_turn(username, session_id, message, deadline, on_delta)
+    
+    if screening.level == HIGH and CRISIS_HIGH_ACTION == 'resources':
+        return crisis_resources_turn(username, session_id, message, deadline)
+    
+    # Flagged messages always get an answer: if the turn is refused or the model is
+    # unavailable, fall back to the crisis resources instead of an error
+    try:
+        return chat_turn(username, session_id, message, deadline, on_delta, task='crisis')
+    except (AdmissionDenied, QuotaExceeded, LLMUnavailableError) as e:
+        print(f"Crisis turn for session {session_id} fell back to resources: {type(e).__name__}")
+        metrics.incr('CrisisResourcesFallback')
+        # chat_turn already took this request's admission token unless admission refused it
+        return crisis_resources_turn(username, session_id, message, deadline,
+                                     admitted=not isinstance(e, AdmissionDenied))
+
+
+def crisis_resources_turn(username: str, session_id: str, message: str, deadline: Deadline,
+                          admitted: bool = False) -> dict:
+    """Answer with the crisis resources message without calling the LLM
+
+    Admission applies as for any turn, but a refused message is still answered: only the
+    writes are skipped.
+    """
+    stored = True
+    if not admitted:
+        try:
+            admit(username)
+        except AdmissionDenied:
+            stored = False
+    
+    timestamp = int(time.time() * 1000)
+    ttl = int(time.time()) + (runtime_config.get('data_retention_days') * 24 * 60 * 60)
+    traffic_capture.note_user(username, session_id)
+    traffic_capture.note(task='crisis_resources', messageChars=len(message))
+    
+    # Stored like any turn so the next reply sees it; a cached history picks these rows up
+    # on its next incremental fetch
+    if stored:
+        message = redaction.vault(session_id).redact(message)
+        try:
+            deadline.run_all([
+                (store_message, (session_id, timestamp, 'user', message, ttl, username)),
+                (store_message, (session_id, timestamp + 1, 'assistant', CRISIS_RESOURCES_MESSAGE, ttl, username)),
+            ])
+        except DeadlineExceeded:
+            print(f"Message writes for session {session_id} did not finish in time")
+            metrics.incr('StoreDeadlineExceeded')
+    
+    return success_response({
+        'sessionId': session_id,
+        'response': CRISIS_RESOURCES_MESSAGE,
+        'timestamp': timestamp,
+        'crisis': True
+    })
+
+
+def chat_turn(username: str, session_id: str, message: str, deadline: Deadline,
+              on_delta: Optional[Callable[[str], None]] = None, task: str = 'chat') -> dict:
+    """Run one chat turn: admission, history, LLM call, storage and summary"""
+    # Reject over-limit users before any DynamoDB or LLM work
+    admit(username)
+    
+    # PII never reaches the LLM or the tables; placeholders are restored in the reply
+    vault = redaction.vault(session_id)
+    message = vault.redact(message)
+    
+    # Today's usage and summaries recalled from other sessions load while history is fetched
+    usage_totals = usage.prefetch_totals(username)
+    recalled = memory.prefetch(username, session_id, message)
+    
     # Retrieve conversation history
-    history = get_conversation_history(session_id)
+    history = deadline.run(get_conversation_history, session_id, username, cap=HISTORY_BUDGET_SECONDS)
+    traffic_capture.note_user(username, session_id)
+    traffic_capture.note(task=task, turns=len(history), messageChars=len(message))
+    quota_status = usage.check_quota(usage.totals_within(usage_totals, deadline.budget(HISTORY_BUDGET_SECONDS)))
+    notes = memory.recall_within(recalled, deadline.budget(MEMORY_BUDGET_SECONDS))
     
-    # Build messages for LLM
+    # Build messages for LLM. Keep this order stable (system prompt, history oldest first,
+    # new message last): everything before the new message is the provider-cached prefix,
+    # so recalled notes go with the new message rather than into the system prompt.
     messages = [
-        {'role': 'system', 'content': SYSTEM_PROMPT},
+        {'role': 'system', 'content': runtime_config.get('system_prompt')},
         *history,
         {'role': 'user', 'content': message}
     ]
+    prompt = messages[:-1] + [{'role': 'user', 'content': memory.with_notes(message, notes)}]
     
-    # Call LLM
-    response = call_llm(messages)
+    # Call LLM; out of time, answer with a well-formed degraded reply instead of timing out
+    restorer = vault.restoring_stream(on_delta) if on_delta else None
+    try:
+        result = invoke_llm(prompt, task, cache_key=session_id, deadline=deadline, on_delta=restorer)
+    except DeadlineExceeded:
+        traffic_capture.note(degraded=True)
+        data = {
+            'sessionId': session_id,
+            'response': CRISIS_RESOURCES_MESSAGE if task == 'crisis' else DEGRADED_REPLY,
+            'timestamp': int(time.time() * 1000),
+            'degraded': True
+        }
+        if task == 'crisis':
+            data['crisis'] = True
+        return success_response(data)
+    if restorer:
+        restorer.flush()
+    response = result['text']
+    traffic_capture.note(replyChars=len(response))
+    
+    # Counter update runs in the background alongside the message writes
+    usage.record(
+        username,
+        requests=1,
+        input_tokens=result.get('input_tokens', 0),
+        output_tokens=result.get('output_tokens', 0),
+        llm_ms=result.get('latency_ms', 0)
+    )
     
     # Store user message and assistant response
     timestamp = int(time.time() * 1000)
-    ttl = int(time.time()) + (DATA_RETENTION_DAYS * 24 * 60 * 60)
+    ttl = int(time.time()) + (runtime_config.get('data_retention_days') * 24 * 60 * 60)
     
-    store_message(session_id, timestamp, 'user', message, ttl, username)
-    store_message(session_id, timestamp + 1, 'assistant', response, ttl, username)
+    try:
+        deadline.run_all([
+            (store_message, (session_id, timestamp, 'user', message, ttl, username)),
+            (store_message, (session_id, timestamp + 1, 'assistant', response, ttl, username)),
+        ])
+    except DeadlineExceeded:
+        # The reply is still worth returning; the writes finish if the container stays warm
+        print(f"Message writes for session {session_id} did not finish in time")
+        metrics.incr('StoreDeadlineExceeded')
+    history_cache.put(history_cache_key(session_id, username), (history + [
+        {'role': 'user', 'content': message},
+        {'role': 'assistant', 'content': response},
+    ])[-HISTORY_LIMIT:], timestamp + 1)
     
-    # Generate and store summary if conversation is getting long
-    if len(history) >= 10:  # After 5 exchanges
+    # Generate and store summary if conversation is getting long. It is optional, so it is
+    # skipped when the budget is short and picked up again on a later turn.
+    if len(history) >= 10 and not deadline.has(SUMMARY_MIN_BUDGET_SECONDS):
+        metrics.incr('SummarySkippedForDeadline')
+    elif len(history) >= 10:  # After 5 exchanges
         print(f"Generating summary for user {username}, session {session_id}")
-        summary = generate_conversation_summary(messages)
+        summary = generate_conversation_summary(messages, username, deadline)
         store_summary(username, session_id, summary, ttl)
         print(f"Summary stored: {summary[:50]}...")
     
-    return success_response({
+    data = {
         'sessionId': session_id,
-        'response': response,
+        'response': vault.restore(response),
         'timestamp': timestamp
+    }
+    if quota_status:
+        data['quotaStatus'] = quota_status
+    if task == 'crisis':
+        data['crisis'] = True
+    
+    return success_response(data)
+
+
+def idempotent_replay(record: Dict, request_hash: str, username: str, key: str) -> dict:
+    """Answer a duplicate request from its idempotency record"""
+    if not record:
+        return error_response('Request could not be deduplicated, please retry', 409)
+    
+    if record.get('request_hash') != request_hash:
+        return error_response('Idempotency-Key was already used for a different request', 422)
+    
+    if record['status'] == idempotency.COMPLETED:
+        body = idempotency.response_body(username, key, record)
+        if body is None:
+            return error_response('Request could not be deduplicated, please retry', 409)
+        return {
+            'statusCode': int(record['status_code']),
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*',
+                'Idempotent-Replayed': 'true'
+            },
+            'body': body
+        }
+    
+    return error_response('This message is still being processed', 409, headers={'Retry-After': '2'})
+
+
+def handle_websocket(event, deadline: Deadline) -> dict:
+    """WebSocket API routes: $connect, $disconnect and sendMessage"""
+    context = event['requestContext']
+    connection_id = context['connectionId']
+    
+    if context['eventType'] == 'CONNECT':
+        # Authenticate once per connection; messages are trusted by connectionId afterwards
+        params = event.get('queryStringParameters') or {}
+        username = authenticated_user(event, params.get('token'))
+        if not username:
+            return error_response('Invalid or expired token', 401)
+        websocket_channel.register(connection_id, username)
+        return {'statusCode': 200}
+    
+    if context['eventType'] == 'DISCONNECT':
+        websocket_channel.forget(connection_id)
+        return {'statusCode': 200}
+    
+    return handle_ws_message(event, connection_id, deadline)
+
+
+def handle_ws_message(event, connection_id: str, deadline: Deadline) -> dict:
+    """Run a chat turn for a sendMessage frame, streaming the reply back over the connection"""
+    body = request_body(event)
+    endpoint = websocket_channel.callback_url(event)
+    request_id = body.get('requestId')
+    message = body.get('message')
+    session_id = body.get('sessionId') or str(uuid4())
+    
+    username = websocket_channel.lookup(connection_id)
+    if not username:
+        response = error_response('Invalid or expired token', 401)
+    elif not message:
+        response = error_response('Message is required', 400)
+    else:
+        stream = websocket_channel.DeltaStream(endpoint, connection_id, request_id)
+        try:
+            response = process_chat_turn(username, session_id, message, deadline, on_delta=stream)
+        except Exception as e:
+            response = exception_response(e)
+        stream.flush()
+    
+    # The final frame carries the complete reply (or the error) like the REST response body
+    frame = json.loads(response['body'])
+    frame.update({
+        'type': 'done' if response['statusCode'] == 200 else 'error',
+        'status': response['statusCode'],
+        'requestId': request_id,
     })
+    websocket_channel.send(endpoint, connection_id, frame)
+    return {'statusCode': 200}
 
 
 def handle_get_summaries(event):
     """Get user's conversation summaries"""
-    token = event.get('queryStringParameters', {}).get('token') if event.get('queryStringParameters') else None
-    
-    print(f"Getting summaries for token: {token[:10] if token else 'None'}...")
+    params = event.get('queryStringParameters') or {}
     
-    # Verify user token
-    username = verify_user_token(token)
+    username = authenticated_user(event, params.get('token'))
     if not username:
         print(f"Invalid token verification")
         return error_response('Invalid or expired token', 401)
@@ -183,68 +530,233 @@ def handle_get_summaries(event):
     return success_response({'summaries': summaries})
 
 
-def get_conversation_history(session_id: str) -> List[Dict]:
-    """Retrieve conversation history from DynamoDB"""
-    response = table.query(
-        KeyConditionExpression='sessionId = :sid',
-        ExpressionAttributeValues={':sid': session_id},
-        Limit=20,  # Last 10 exchanges
-        ScanIndexForward=False
-    )
+def handle_admin_usage(event):
+    """Get per-user usage counters (admins only)"""
+    params = event.get('queryStringParameters') or {}
+    
+    username = authenticated_user(event, params.get('token'))
+    if not username:
+        return error_response('Invalid or expired token', 401)
+    
+    if username not in ADMIN_USERNAMES:
+        return error_response('Admin access required', 403)
+    
+    if usage.usage_table is None:
+        return error_response('Usage accounting is not enabled', 404)
+    
+    if params.get('username'):
+        try:
+            days = min(max(int(params.get('days', '7')), 1), 90)
+        except ValueError:
+            return error_response('days must be a number', 400)
+        return success_response({'usage': usage.get_usage(params['username'].strip().lower(), days)})
+    
+    # Without a username, list the heaviest users for a day
+    day = params.get('day', usage.today())
+    return success_response({'day': day, 'topUsers': usage.get_top_users(day)})
 
-    items = response.get('Items', [])
-    items.reverse()
 
-    return [
-        {'role': item['role'], 'content': item['content']}
-        for item in items
-    ]
+def handle_search(event, deadline: Deadline):
+    """Search the user's own messages"""
+    params = event.get('queryStringParameters') or {}
+    
+    username = authenticated_user(event, params.get('token'))
+    if not username:
+        return error_response('Invalid or expired token', 401)
+    
+    if not data_access.SEARCH_TABLE_NAME:
+        return error_response('Search is not enabled', 404)
+    
+    query = (params.get('q') or '').strip()[:200]
+    if not query:
+        return error_response('Query is required', 400)
+    traffic_capture.note(queryChars=len(query))
+    
+    try:
+        limit = min(max(int(params.get('limit', '10')), 1), search.SEARCH_MAX_RESULTS)
+    except ValueError:
+        return error_response('limit must be a number', 400)
+    
+    found = search.search(username, query, limit, deadline)
+    return success_response({'query': query, **found})
 
 
-def store_message(session_id: str, timestamp: int, role: str, content: str, ttl: int):
-    """Store message in DynamoDB"""
-    table.put_item(
-        Item={
-            'sessionId': session_id,
-            'timestamp': timestamp,
-            'role': role,
-            'content': content,
-            'ttl': ttl
-        }
-    )
+def handle_trends(event):
+    """Daily or weekly mood and topic series of the user's sessions"""
+    params = event.get('queryStringParameters') or {}
+    
+    username = authenticated_user(event, params.get('token'))
+    if not username:
+        return error_response('Invalid or expired token', 401)
+    
+    if trends.trends_table is None:
+        return error_response('Trends are not enabled', 404)
+    
+    period = params.get('period', 'week')
+    if period not in trends.MAX_PERIODS:
+        return error_response('period must be day or week', 400)
+    
+    try:
+        count = int(params.get('count', '12' if period == 'week' else '30'))
+    except ValueError:
+        return error_response('count must be a number', 400)
+    count = min(max(count, 1), trends.MAX_PERIODS[period])
+    
+    return success_response({'period': period, 'series': trends.get_trends(username, period, count)})
 
 
-def get_conversation_history(session_id: str) -> List[Dict]:
-    """Retrieve conversation history from DynamoDB"""
-    response = chat_table.query(
-        KeyConditionExpression='sessionId = :sid',
-        ExpressionAttributeValues={':sid': session_id},
-        Limit=20,  # Last 10 exchanges
-        ScanIndexForward=False
-    )
+def handle_export(event, deadline: Deadline):
+    """Export the user's summaries and messages as NDJSON"""
+    params = event.get('queryStringParameters') or {}
+    
+    username = authenticated_user(event, params.get('token'))
+    if not username:
+        return error_response('Invalid or expired token', 401)
+    
+    # Small exports come back in the body; large ones (or delivery=url) as a download link
+    sink = data_export.ExportSink(data_export.export_key(username), force_s3=params.get('delivery') == 'url')
+    try:
+        counts = data_export.export_user(username, sink, deadline)
+        url = sink.finish()
+    except data_export.ExportTooLarge as e:
+        print(f"Export for user {username} failed: {str(e)}")
+        return error_response('Export is too large to return directly', 413)
+    except Exception:
+        sink.abort()
+        raise
+    
+    print(f"Exported {counts['messages']} messages in {counts['sessions']} sessions for user {username}")
+    if url:
+        return success_response({'url': url, 'expiresIn': data_export.EXPORT_URL_TTL_SECONDS, **counts})
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/x-ndjson',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': sink.inline_body()
+    }
 
-    items = response.get('Items', [])
-    items.reverse()
 
-    return [
-        {'role': item['role'], 'content': item['content']}
-        for item in items
-    ]
+def handle_get_me(event):
+    """Get the user's account, including the progress of a pending deletion"""
+    params = event.get('queryStringParameters') or {}
+    
+    username = authenticated_user(event, params.get('token'))
+    if not username:
+        return error_response('Invalid or expired token', 401)
+    
+    user = data_access.get_user(username)
+    if not user:
+        return error_response('User not found', 404)
+    
+    data = {'username': username, 'createdAt': user['created_at']}
+    if user.get('deletion'):
+        data['deletion'] = user['deletion']
+    return success_response(data)
 
 
-def store_message(session_id: str, timestamp: int, role: str, content: str, ttl: int, username: str = None):
-    """Store message in DynamoDB"""
-    item = {
-        'sessionId': session_id,
-        'timestamp': timestamp,
-        'role': role,
-        'content': content,
-        'ttl': ttl,
-    }
-    if username:
-        item['username'] = username
+def handle_delete_me(event, deadline: Deadline):
+    """Delete all of the user's data; large accounts finish in the background"""
+    params = event.get('queryStringParameters') or {}
     
-    chat_table.put_item(Item=item)
+    username = authenticated_user(event, params.get('token'))
+    if not username:
+        return error_response('Invalid or expired token', 401)
+    
+    user = data_access.get_user(username)
+    if not user:
+        return success_response({'status': 'deleted'})
+    
+    # A deletion the worker is still making progress on is left to it
+    running = user.get('deletion')
+    if running and data_deletion.DELETION_WORKER_FUNCTION_NAME and not data_deletion.is_stale(running):
+        return deletion_pending_response(running, True)
+    
+    # Removes the user's data key first: stored content is unreadable from here on
+    deletion = data_access.begin_user_deletion(username, int(time.time()))
+    if deletion is None:
+        return success_response({'status': 'deleted'})
+    encryption.forget_user(username)
+    memory.forget_user(username)
+    history_cache.invalidate_prefix(f"{username}/")
+    
+    budget = Deadline(deadline.budget(data_deletion.DELETE_INLINE_BUDGET_SECONDS) * 1000, reserve_ms=0)
+    try:
+        deleted = data_deletion.delete_user_data(username, budget)
+    except (DeadlineExceeded, data_access.UnprocessedItems) as e:
+        # Out of time, or throttled past the batch retries: the rest is picked up later
+        print(f"Deletion for user {username} paused: {str(e)}")
+        handed_off = data_deletion.start_worker(username)
+        user = data_access.get_user(username)
+        print(f"Deletion for user {username} continues {'in the worker' if handed_off else 'on the next request'}")
+        return deletion_pending_response(user['deletion'] if user else deletion, handed_off)
+    
+    print(f"Deleted {deleted} items for user {username}")
+    return success_response({'status': 'deleted', 'deletedItems': deletion['deletedItems'] + deleted})
+
+
+def deletion_pending_response(deletion: Dict, in_background: bool) -> dict:
+    """202 with deletion progress; without a worker the client repeats DELETE /me to continue"""
+    response = success_response({**deletion, 'inBackground': in_background})
+    response['statusCode'] = 202
+    return response
+
+
+def authenticated_user(event, legacy_token: Optional[str] = None) -> Optional[str]:
+    """Username verified by the API Gateway authorizer, or from the token when invoked directly"""
+    authorizer = (event.get('requestContext') or {}).get('authorizer') or {}
+    # HTTP API (payload 2.0) nests the authorizer context under 'lambda'
+    authorizer = authorizer.get('lambda') or authorizer
+    if authorizer.get('username'):
+        username = authorizer['username']
+    else:
+        # Direct invocations and local runs bypass the authorizer
+        headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+        username = verify_user_token(token_from_header(headers.get('authorization')) or legacy_token)
+    if username:
+        traffic_capture.note_user(username)
+    return username
+
+
+def history_cache_key(session_id: str, username: Optional[str]) -> str:
+    # Per user as well as per session: a cached history is already decrypted
+    return f"{username}/{session_id}" if username else session_id
+
+
+def get_conversation_history(session_id: str, username: Optional[str] = None) -> List[Dict]:
+    """Retrieve conversation history, reading only new rows when the session is cached"""
+    cache_key = history_cache_key(session_id, username)
+    cached = history_cache.get(cache_key)
+    if cached:
+        history, last_timestamp = cached
+        # Pick up turns written by other containers since this one last saw the session
+        items = data_access.query_messages(session_id, HISTORY_LIMIT, after_timestamp=last_timestamp)
+    else:
+        history, last_timestamp = [], 0
+        items = data_access.query_messages(session_id, HISTORY_LIMIT)
+
+    if items:
+        last_timestamp = items[-1]['timestamp']
+    # One data key lookup for the whole page; rows that won't open with this user's key are dropped
+    contents = encryption.decrypt_many(username, [
+        (item['content'], encryption.message_aad(session_id, item['timestamp'])) for item in items
+    ])
+    # Rows stored before redaction was enabled are redacted on the way in
+    vault = redaction.vault(session_id)
+    history = (history + [
+        {'role': item['role'], 'content': vault.redact(decode_content(content))}
+        for item, content in zip(items, contents) if content is not None
+    ])[-HISTORY_LIMIT:]
+
+    history_cache.put(cache_key, history, last_timestamp)
+    return history
+
+
+def store_message(session_id: str, timestamp: int, role: str, content: str, ttl: int, username: str = None):
+    """Store message in DynamoDB, compressed and then encrypted under the user's data key"""
+    value = encryption.encrypt(username, encode_content(content), encryption.message_aad(session_id, timestamp))
+    data_access.put_message(session_id, timestamp, role, value, ttl, username)
 
 
 def hash_password(password: str) -> str:
@@ -266,78 +778,60 @@ def verify_password(password: str, stored_hash: str) -> bool:
         return False
 
 
-def generate_user_token(username: str) -> str:
-    """Generate simple user token (in production, use proper JWT)"""
-    timestamp = str(int(time.time()))
-    data = f"{username}:{timestamp}"
-    return base64.b64encode(data.encode()).decode()
-
-
-def verify_user_token(token: str) -> Optional[str]:
-    """Verify user token and return username"""
-    if not token:
-        return None
-    
-    try:
-        data = base64.b64decode(token.encode()).decode()
-        username, timestamp = data.split(':')
-        
-        # Check if token is not too old (24 hours)
-        if int(time.time()) - int(timestamp) > 86400:
-            return None
-            
-        return username
-    except:
-        return None
-
-
-def generate_conversation_summary(messages: List[Dict]) -> str:
-    """Generate a summary of the conversation"""
-    # Create a summary prompt
+def summary_prompt(messages: List[Dict]) -> List[Dict]:
+    """Prompt asking the LLM to summarize the last messages of a conversation"""
     conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages[-10:]])
     
-    summary_prompt = [
+    return [
         {'role': 'system', 'content': 'Summarize this conversation in 2-3 sentences. Focus on the main topics discussed and key points.'},
         {'role': 'user', 'content': f"Conversation to summarize:\n{conversation_text}"}
     ]
-    
+
+
+def generate_conversation_summary(messages: List[Dict], username: Optional[str] = None,
+                                  deadline: Optional[Deadline] = None) -> str:
+    """Generate a summary of the conversation (SUMMARY_UNAVAILABLE if the LLM call fails)"""
     try:
-        summary = call_llm(summary_prompt)
-        return summary
+        result = invoke_llm(summary_prompt(messages), task='summary', deadline=deadline)
+        if username:
+            usage.record(
+                username,
+                input_tokens=result.get('input_tokens', 0),
+                output_tokens=result.get('output_tokens', 0),
+                llm_ms=result.get('latency_ms', 0)
+            )
+        return result['text']
     except:
-        return "Conversation summary unavailable"
+        return SUMMARY_UNAVAILABLE
 
 
 def store_summary(username: str, session_id: str, summary: str, ttl: int):
-    """Store conversation summary"""
-    summaries_table.put_item(
-        Item={
-            'username': username,
-            'sessionId': session_id,
-            'summary': summary,
-            'created_at': int(time.time()),
-            'ttl': ttl,
-        }
-    )
+    """Store conversation summary with its embedding for later recall"""
+    item = summary_item(username, session_id, summary, ttl)
+    replaced = data_access.put_summary_item(item)
+    trends.record(username, replaced, item)
+
+
+def summary_item(username: str, session_id: str, summary: str, ttl: int) -> Dict:
+    """ChatSummaries item for a summary: embedded for recall, then encrypted"""
+    embedding, model = memory.remember(username, session_id, summary)
+    # Features are taken from the plaintext so the rollups need no decryption
+    sentiment, topics = trends.extract_features(summary)
+    value = encryption.encrypt(username, summary, encryption.summary_aad(username, session_id))
+    if embedding is not None:
+        # The vector gives away the summary's words as well as the text would
+        embedding = encryption.encrypt_blob(username, embedding, encryption.embedding_aad(username, session_id))
+    return data_access.summary_to_item(username, session_id, value, int(time.time()), ttl, embedding, model,
+                                       sentiment, topics)
 
 
 def get_user_summaries(username: str) -> List[Dict]:
     """Get all summaries for a user"""
-    response = summaries_table.query(
-        KeyConditionExpression='username = :username',
-        ExpressionAttributeValues={':username': username},
-        ScanIndexForward=False,
-        Limit=50
-    )
-    
-    return [
-        {
-            'sessionId': item['sessionId'],
-            'summary': item['summary'],
-            'created_at': item['created_at']
-        }
-        for item in response.get('Items', [])
-    ]
+    summaries = data_access.query_summaries(username, limit=50)
+    texts = encryption.decrypt_many(username, [
+        (s['summary'], encryption.summary_aad(username, s['sessionId'])) for s in summaries
+    ])
+    return [{**s, 'summary': text} for s, text in zip(summaries, texts) if text is not None]
 
 
 class DecimalEncoder(json.JSONEncoder):
@@ -348,6 +842,19 @@ class DecimalEncoder(json.JSONEncoder):
         return super(DecimalEncoder, self).default(obj)
 
 
+def _orjson_default(obj):
+    if isinstance(obj, Decimal):
+        return int(obj) if obj % 1 == 0 else float(obj)
+    raise TypeError
+
+
+def dumps(data) -> str:
+    """Serialize a response body, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data, default=_orjson_default).decode('utf-8')
+    return json.dumps(data, cls=DecimalEncoder)
+
+
 def success_response(data: dict) -> dict:
     """Return success response"""
     return {
@@ -356,17 +863,18 @@ def success_response(data: dict) -> dict:
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
         },
-        'body': json.dumps(data, cls=DecimalEncoder)
+        'body': dumps(data)
     }
 
 
-def error_response(message: str, status_code: int = 400) -> dict:
+def error_response(message: str, status_code: int = 400, headers: Optional[dict] = None) -> dict:
     """Return error response"""
     return {
         'statusCode': status_code,
         'headers': {
             'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
+            'Access-Control-Allow-Origin': '*',
+            **(headers or {})
         },
-        'body': json.dumps({'error': message}, cls=DecimalEncoder)
+        'body': dumps({'error': message})
     }
\ No newline at end of file
@@ -1,63 +1,529 @@
 import os
 import json
+import time
 import boto3
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, List, Dict, Optional, Tuple
 
-LLM_PROVIDER = os.environ.get('LLM_PROVIDER', 'bedrock')
+from botocore.config import Config
 
+import metrics
+import runtime_config
+import traffic_capture
+from deadline import Deadline, DeadlineExceeded
+from resilience import CircuitBreaker, LatencyTracker, backoff_delay
 
-def call_llm(messages: List[Dict]) -> str:
+# The primary provider (llm_provider) and its ordered fallback targets (llm_fallback_providers,
+# e.g. "openai,bedrock:anthropic.claude-3-sonnet...") are runtime_config settings.
+
+# Model IDs per provider and tier; override with the llm_model_tiers setting (same JSON shape)
+DEFAULT_MODEL_TIERS = {
+    'bedrock': {
+        'fast': 'anthropic.claude-3-haiku-20240307-v1:0',
+        'standard': 'anthropic.claude-3-haiku-20240307-v1:0',
+        'safe': 'anthropic.claude-3-5-sonnet-20240620-v1:0',
+    },
+    'openai': {
+        'fast': 'gpt-4o-mini',
+        'standard': 'gpt-4o-mini',
+        'safe': 'gpt-4o',
+    },
+    'local': {
+        'standard': 'extractive',
+    },
+}
+
+# Routing rules evaluated in order, first match wins; override with the llm_routing_policy setting.
+# A rule matches on 'task' and optionally 'max_input_chars' (total prompt size).
+DEFAULT_ROUTING_POLICY = [
+    {'task': 'crisis', 'tier': 'safe', 'max_tokens': 1024},
+    {'task': 'summary', 'tier': 'fast', 'max_tokens': 256},
+    {'task': 'chat', 'max_input_chars': 4000, 'tier': 'fast', 'max_tokens': 1024},
+    {'task': 'chat', 'tier': 'standard', 'max_tokens': 1024},
+]
+
+DEFAULT_ROUTE = {'tier': 'standard', 'max_tokens': 1024}
+
+PROVIDER_TIMEOUTS = {
+    'bedrock': float(os.environ.get('BEDROCK_TIMEOUT_SECONDS', '12')),
+    'openai': float(os.environ.get('OPENAI_TIMEOUT_SECONDS', '12')),
+}
+
+# Simulated latency of the 'local' provider, to exercise batch jobs and timeouts offline
+LOCAL_LLM_LATENCY_MS = float(os.environ.get('LOCAL_LLM_LATENCY_MS', '0'))
+
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '2'))
+
+# An attempt is not started with less than this much of the invocation deadline left
+LLM_MIN_ATTEMPT_SECONDS = float(os.environ.get('LLM_MIN_ATTEMPT_SECONDS', '1.5'))
+LLM_HEDGE_ENABLED = os.environ.get('LLM_HEDGE_ENABLED', 'false').lower() == 'true'
+LLM_HEDGE_DELAY_MS = float(os.environ.get('LLM_HEDGE_DELAY_MS', '3000'))
+
+BREAKER_ERROR_THRESHOLD = float(os.environ.get('LLM_BREAKER_ERROR_THRESHOLD', '0.5'))
+BREAKER_SLOW_CALL_MS = float(os.environ.get('LLM_BREAKER_SLOW_CALL_MS', '10000'))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get('LLM_BREAKER_COOLDOWN_SECONDS', '30'))
+
+# Provider-side prompt caching: 'auto' enables it for models known to support it
+LLM_PROMPT_CACHING = os.environ.get('LLM_PROMPT_CACHING', 'auto').lower()
+PROMPT_CACHE_MODEL_MARKERS = (
+    'claude-3-5-haiku',
+    'claude-3-7-sonnet',
+    'claude-sonnet-4',
+    'claude-opus-4',
+    'claude-haiku-4',
+)
+
+THROTTLE_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'ModelNotReadyException',
+}
+
+
+_bedrock_clients = {}
+_openai_clients = {}
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+_latencies: Dict[Tuple[str, str], LatencyTracker] = {}
+_hedge_executor = ThreadPoolExecutor(max_workers=4)
+
+
+class LLMUnavailableError(Exception):
+    """Raised when every configured provider failed or is circuit-broken"""
+
+
+class _DeltaSink:
+    """Forwards streamed text and remembers whether any reached the caller"""
+
+    def __init__(self, on_delta: Callable[[str], None]):
+        self.on_delta = on_delta
+        self.started = False
+
+    def __call__(self, text: str):
+        if text:
+            self.started = True
+            self.on_delta(text)
+
+
+def call_llm(messages: List[Dict], task: str = 'chat', cache_key: Optional[str] = None,
+             deadline: Optional[Deadline] = None) -> str:
     """Call LLM provider based on configuration"""
-    if LLM_PROVIDER == 'openai':
-        return call_openai(messages)
+    return invoke_llm(messages, task, cache_key, deadline)['text']
+
+
+def invoke_llm(messages: List[Dict], task: str = 'chat', cache_key: Optional[str] = None,
+               deadline: Optional[Deadline] = None,
+               on_delta: Optional[Callable[[str], None]] = None) -> Dict:
+    """Call the provider chain with retries, circuit breaking, fallback and optional hedging.
+
+    Messages must keep a stable order (system prompt, then history oldest first, then the
+    new turn) so the cacheable prefix is identical from one turn to the next. With a
+    deadline, every attempt's timeout is capped by the time left and DeadlineExceeded is
+    raised once there is not enough left for another attempt.
+
+    With on_delta, the response is streamed and on_delta is called with each text chunk.
+    Streaming disables hedging, and a target that fails after text was delivered is not
+    retried or replaced, since the caller has already shown part of its answer.
+    """
+    decision = route(task, messages)
+    chain = provider_chain(decision['tier'])
+    options = {'max_tokens': decision['max_tokens'], 'cache_key': cache_key}
+    sink = _DeltaSink(on_delta) if on_delta else None
+    if sink:
+        options['on_delta'] = sink
+    tried = set()
+    last_error: Optional[Exception] = None
+    for index, target in enumerate(chain):
+        if target in tried:
+            continue
+        if not _breaker(target).allow():
+            metrics.incr('LLMCircuitOpen', Provider=target[0])
+            continue
+        try:
+            if LLM_HEDGE_ENABLED and not sink:
+                remaining = [t for t in chain[index + 1:] if t not in tried]
+                hedge_target = remaining[0] if remaining else target
+                result = _hedged_attempt(target, hedge_target, messages, options, tried, deadline)
+            else:
+                tried.add(target)
+                result = _attempt(target, messages, options, deadline)
+            traffic_capture.llm_call(task, result)
+            return result
+        except DeadlineExceeded:
+            metrics.incr('LLMDeadlineExceeded', Task=task)
+            raise
+        except Exception as e:
+            if sink and sink.started:
+                metrics.incr('LLMStreamInterrupted', Provider=target[0])
+                raise LLMUnavailableError(f"Stream from {target[0]} failed mid-response: {e}")
+            last_error = e
+            metrics.incr('LLMFallback', Provider=target[0])
+            print(f"LLM target {target[0]}:{target[1]} failed: {type(e).__name__}")
+
+    if last_error is None:
+        metrics.incr('LLMAllCircuitsOpen')
+        raise LLMUnavailableError('All LLM providers are unavailable')
+    raise LLMUnavailableError(f"All LLM providers failed: {last_error}")
+
+
+def route(task: str, messages: List[Dict]) -> Dict:
+    """Pick the model tier and max_tokens for a task from the routing policy"""
+    input_chars = sum(len(m.get('content') or '') for m in messages)
+    for rule in runtime_config.get('llm_routing_policy') or DEFAULT_ROUTING_POLICY:
+        if rule.get('task', task) != task:
+            continue
+        if 'max_input_chars' in rule and input_chars > rule['max_input_chars']:
+            continue
+        decision = {
+            'tier': rule.get('tier', DEFAULT_ROUTE['tier']),
+            'max_tokens': int(rule.get('max_tokens', DEFAULT_ROUTE['max_tokens'])),
+        }
+        break
     else:
-        return call_bedrock(messages)
+        decision = dict(DEFAULT_ROUTE)
+    metrics.incr('LLMRoute', Task=task, Tier=decision['tier'])
+    return decision
+
+
+def model_for(provider: str, tier: str) -> str:
+    """Resolve a provider's model ID for a tier, falling back to its standard tier"""
+    tiers = (runtime_config.get('llm_model_tiers') or {}).get(provider) or DEFAULT_MODEL_TIERS.get(provider, {})
+    return tiers.get(tier) or tiers.get('standard', '')
+
+
+def provider_chain(tier: str = 'standard') -> List[Tuple[str, str]]:
+    """Return the ordered (provider, model) targets: primary first, then fallbacks"""
+    fallbacks = runtime_config.get('llm_fallback_providers')
+    entries = [runtime_config.get('llm_provider')] + [e.strip() for e in fallbacks.split(',') if e.strip()]
+    chain = []
+    for entry in entries:
+        provider, _, model = entry.partition(':')
+        target = (provider, model or model_for(provider, tier))
+        if provider in PROVIDERS and target not in chain:
+            chain.append(target)
+    return chain
+
+
+def breaker_states() -> Dict[str, str]:
+    """Current circuit breaker state per provider target"""
+    return {f"{p}:{m}": breaker.state for (p, m), breaker in _breakers.items()}
+
+
+def _breaker(target: Tuple[str, str]) -> CircuitBreaker:
+    if target not in _breakers:
+        _breakers[target] = CircuitBreaker(
+            f"{target[0]}:{target[1]}",
+            error_threshold=BREAKER_ERROR_THRESHOLD,
+            slow_call_ms=BREAKER_SLOW_CALL_MS,
+            cooldown_seconds=BREAKER_COOLDOWN_SECONDS,
+        )
+    return _breakers[target]
+
+
+def _latency(target: Tuple[str, str]) -> LatencyTracker:
+    if target not in _latencies:
+        _latencies[target] = LatencyTracker()
+    return _latencies[target]
+
+
+def _attempt(target: Tuple[str, str], messages: List[Dict], options: Dict,
+             deadline: Optional[Deadline] = None) -> Dict:
+    """Call one target, retrying throttling errors with jittered backoff"""
+    provider, model = target
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        timeout = PROVIDER_TIMEOUTS.get(provider, 12.0)
+        if deadline is not None:
+            if not deadline.has(LLM_MIN_ATTEMPT_SECONDS):
+                # Nothing is sent, so record() won't run: free a half-open breaker's probe
+                _breaker(target).cancel_probe()
+                raise DeadlineExceeded(f"No time left to call {provider}")
+            timeout = min(timeout, deadline.remaining())
+        start = time.monotonic()
+        try:
+            result = PROVIDERS[provider](messages, model, timeout, **options)
+        except Exception as e:
+            elapsed_ms = (time.monotonic() - start) * 1000
+            streamed = getattr(options.get('on_delta'), 'started', False)
+            if _is_throttle(e) and attempt < LLM_MAX_RETRIES and not streamed:
+                metrics.incr('LLMThrottled', Provider=provider)
+                delay = backoff_delay(attempt)
+                if deadline is not None:
+                    delay = min(delay, deadline.remaining())
+                time.sleep(delay)
+                continue
+            _breaker(target).record(False, elapsed_ms)
+            metrics.incr('LLMErrors', Provider=provider)
+            raise
+
+        elapsed_ms = (time.monotonic() - start) * 1000
+        _breaker(target).record(True, elapsed_ms)
+        _latency(target).add(elapsed_ms)
+        metrics.timing('LLMLatency', elapsed_ms, Provider=provider)
+        metrics.incr('LLMInputTokens', result.get('input_tokens', 0), Provider=provider)
+        metrics.incr('LLMCachedInputTokens', result.get('cached_input_tokens', 0), Provider=provider)
+        metrics.incr('LLMOutputTokens', result.get('output_tokens', 0), Provider=provider)
+        print(f"LLM call {provider}:{model} {elapsed_ms:.0f}ms "
+              f"input={result.get('input_tokens', 0)} cached={result.get('cached_input_tokens', 0)} "
+              f"output={result.get('output_tokens', 0)}")
+        result.update({'provider': provider, 'model': model, 'latency_ms': elapsed_ms})
+        return result
+
+
+def _hedged_attempt(primary: Tuple[str, str], secondary: Tuple[str, str],
+                    messages: List[Dict], options: Dict, tried: set,
+                    deadline: Optional[Deadline] = None) -> Dict:
+    """Start the primary; if it has not finished by its p95 latency, race a second request"""
+    tried.add(primary)
+    delay = (_latency(primary).p95() or LLM_HEDGE_DELAY_MS) / 1000
+    if deadline is not None:
+        delay = min(delay, deadline.remaining())
+    futures = {_hedge_executor.submit(_attempt, primary, messages, options, deadline): primary}
+    done, _ = wait(futures, timeout=delay)
+
+    if not done and _breaker(secondary).allow():
+        metrics.incr('LLMHedgeFired', Provider=secondary[0])
+        tried.add(secondary)
+        futures[_hedge_executor.submit(_attempt, secondary, messages, options, deadline)] = secondary
+
+    pending = set(futures)
+    last_error: Optional[Exception] = None
+    while pending:
+        timeout = deadline.remaining() if deadline is not None else None
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded('Hedged LLM requests did not finish in time')
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                last_error = e
+                continue
+            if len(futures) > 1:
+                metrics.incr('LLMHedgeWon', Provider=futures[future][0])
+            return result
+    raise last_error
 
 
-def call_bedrock(messages: List[Dict]) -> str:
+def _is_throttle(error: Exception) -> bool:
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        return response.get('Error', {}).get('Code') in THROTTLE_ERROR_CODES
+    return type(error).__name__ == 'RateLimitError' or getattr(error, 'status_code', None) == 429
+
+
+def _bedrock_client(timeout: float):
+    # Whole seconds keep the number of cached clients small when timeouts follow the deadline
+    timeout = max(1, int(timeout))
+    if timeout not in _bedrock_clients:
+        _bedrock_clients[timeout] = boto3.client(
+            'bedrock-runtime',
+            region_name=os.environ.get('AWS_REGION', 'us-east-1'),
+            config=Config(
+                connect_timeout=2,
+                read_timeout=timeout,
+                retries={'total_max_attempts': 1, 'mode': 'standard'},
+            ),
+        )
+    return _bedrock_clients[timeout]
+
+
+def call_bedrock(messages: List[Dict], model_id: str = DEFAULT_MODEL_TIERS['bedrock']['standard'],
+                 timeout: float = PROVIDER_TIMEOUTS['bedrock'], max_tokens: int = 1024,
+                 cache_key: Optional[str] = None,
+                 on_delta: Optional[Callable[[str], None]] = None) -> Dict:
     """Call AWS Bedrock with Claude"""
-    client = boto3.client('bedrock-runtime', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+    client = _bedrock_client(timeout)
+    payload = bedrock_payload(messages, max_tokens, cache_points=_prompt_caching_enabled(model_id))
+
+    if on_delta:
+        return _stream_bedrock(client, model_id, payload, on_delta)
+
+    response = client.invoke_model(
+        modelId=model_id,
+        contentType='application/json',
+        accept='application/json',
+        body=json.dumps(payload)
+    )
+
+    response_body = json.loads(response['body'].read())
+    return _bedrock_result(response_body['content'][0]['text'], response_body.get('usage', {}))
 
-    # Using Claude 3 Haiku (cost-effective and fast)
-    model_id = 'anthropic.claude-3-haiku-20240307-v1:0'
 
+def bedrock_payload(messages: List[Dict], max_tokens: int, cache_points: bool = False) -> Dict:
+    """Anthropic Messages request body, as sent to InvokeModel or in a batch inference record"""
     # Separate system message from conversation
     system_message = next((m['content'] for m in messages if m['role'] == 'system'), None)
     conversation = [m for m in messages if m['role'] != 'system']
 
+    if system_message and cache_points:
+        system_message, conversation = _mark_cache_points(system_message, conversation)
+
     payload = {
         'anthropic_version': 'bedrock-2023-05-31',
-        'max_tokens': 1024,
+        'max_tokens': max_tokens,
         'messages': conversation,
     }
 
     if system_message:
         payload['system'] = system_message
+    return payload
 
-    response = client.invoke_model(
+
+def _stream_bedrock(client, model_id: str, payload: Dict, on_delta: Callable[[str], None]) -> Dict:
+    """Stream a Bedrock response, forwarding text deltas as they arrive"""
+    response = client.invoke_model_with_response_stream(
         modelId=model_id,
         contentType='application/json',
         accept='application/json',
         body=json.dumps(payload)
     )
 
-    response_body = json.loads(response['body'].read())
-    return response_body['content'][0]['text']
+    parts, usage = [], {}
+    for event in response['body']:
+        chunk = json.loads(event['chunk']['bytes']) if 'chunk' in event else {}
+        kind = chunk.get('type')
+        if kind == 'message_start':
+            usage.update(chunk['message'].get('usage', {}))
+        elif kind == 'content_block_delta':
+            text = chunk['delta'].get('text', '')
+            parts.append(text)
+            on_delta(text)
+        elif kind == 'message_delta':
+            usage.update(chunk.get('usage', {}))
+    return _bedrock_result(''.join(parts), usage)
+
+
+def _bedrock_result(text: str, usage: Dict) -> Dict:
+    cache_read = usage.get('cache_read_input_tokens', 0)
+    cache_write = usage.get('cache_creation_input_tokens', 0)
+    return {
+        'text': text,
+        'input_tokens': usage.get('input_tokens', 0) + cache_read + cache_write,
+        'cached_input_tokens': cache_read,
+        'cache_write_tokens': cache_write,
+        'output_tokens': usage.get('output_tokens', 0),
+    }
+
 
+def _prompt_caching_enabled(model_id: str) -> bool:
+    if LLM_PROMPT_CACHING == 'auto':
+        return any(marker in model_id for marker in PROMPT_CACHE_MODEL_MARKERS)
+    return LLM_PROMPT_CACHING == 'true'
 
-def call_openai(messages: List[Dict]) -> str:
+
+def _mark_cache_points(system_message: str, conversation: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """Add cache breakpoints after the system prompt and after the last history message"""
+    system_blocks = [{'type': 'text', 'text': system_message, 'cache_control': {'type': 'ephemeral'}}]
+    if len(conversation) < 2:
+        return system_blocks, conversation
+
+    # Everything before the newest user turn is the stable prefix shared with the next request
+    prefix_end = conversation[-2]
+    marked = {
+        'role': prefix_end['role'],
+        'content': [{'type': 'text', 'text': prefix_end['content'], 'cache_control': {'type': 'ephemeral'}}],
+    }
+    return system_blocks, conversation[:-2] + [marked, conversation[-1]]
+
+
+def call_openai(messages: List[Dict], model: str = DEFAULT_MODEL_TIERS['openai']['standard'],
+                timeout: float = PROVIDER_TIMEOUTS['openai'], max_tokens: int = 1024,
+                cache_key: Optional[str] = None,
+                on_delta: Optional[Callable[[str], None]] = None) -> Dict:
     """Call OpenAI API"""
     try:
         from openai import OpenAI
     except ImportError:
         raise ImportError("OpenAI package not installed. Run: pip install openai")
 
-    client = OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
+    if 'default' not in _openai_clients:
+        _openai_clients['default'] = OpenAI(
+            api_key=os.environ.get('OPENAI_API_KEY'),
+            max_retries=0,
+        )
+    client = _openai_clients['default']
+
+    # OpenAI caches prompt prefixes automatically; the key keeps a session's requests on the same cache
+    extra_body = {'prompt_cache_key': cache_key} if cache_key and LLM_PROMPT_CACHING != 'false' else None
+
+    if on_delta:
+        return _stream_openai(client, messages, model, timeout, max_tokens, extra_body, on_delta)
 
     response = client.chat.completions.create(
-        model='gpt-4o-mini',
+        model=model,
         messages=messages,
-        max_tokens=1024
+        max_tokens=max_tokens,
+        extra_body=extra_body,
+        timeout=timeout
     )
 
-    return response.choices[0].message.content or 'No response generated'
+    return _openai_result(response.choices[0].message.content or 'No response generated', response.usage)
+
+
+def _stream_openai(client, messages: List[Dict], model: str, timeout: float, max_tokens: int,
+                   extra_body: Optional[Dict], on_delta: Callable[[str], None]) -> Dict:
+    """Stream an OpenAI response, forwarding text deltas as they arrive"""
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        extra_body=extra_body,
+        timeout=timeout,
+        stream=True,
+        stream_options={'include_usage': True},
+    )
+
+    parts, usage = [], None
+    for chunk in stream:
+        # The final chunk carries usage and no choices
+        if chunk.usage:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            on_delta(chunk.choices[0].delta.content)
+    return _openai_result(''.join(parts) or 'No response generated', usage)
+
+
+def _openai_result(text: str, usage) -> Dict:
+    details = getattr(usage, 'prompt_tokens_details', None) if usage else None
+    return {
+        'text': text,
+        'input_tokens': usage.prompt_tokens if usage else 0,
+        'cached_input_tokens': (getattr(details, 'cached_tokens', 0) or 0) if details else 0,
+        'cache_write_tokens': 0,
+        'output_tokens': usage.completion_tokens if usage else 0,
+    }
+
+
+def call_local(messages: List[Dict], model: str = 'extractive', timeout: float = 12.0, max_tokens: int = 1024,
+               cache_key: Optional[str] = None,
+               on_delta: Optional[Callable[[str], None]] = None) -> Dict:
+    """Offline stand-in for local runs and batch jobs: no network, deterministic output.
+
+    Answers with the first sentence of up to three lines of the last message, so a
+    summary prompt gets an extractive summary of the transcript it contains.
+    """
+    if LOCAL_LLM_LATENCY_MS:
+        time.sleep(min(LOCAL_LLM_LATENCY_MS / 1000, timeout))
+    lines = [line.split(': ', 1)[-1] for line in (messages[-1]['content'] or '').splitlines() if line.strip()]
+    if len(lines) > 1 and lines[0].endswith(':'):
+        lines = lines[1:]
+    sentences = [line.split('. ')[0].rstrip('.') + '.' for line in lines[:3]]
+    text = ' '.join(sentences)[:max_tokens * 4]
+    if on_delta:
+        for i, word in enumerate(text.split(' ')):
+            on_delta(word if i == 0 else ' ' + word)
+    return {
+        'text': text,
+        'input_tokens': sum(len(m.get('content') or '') for m in messages) // 4,
+        'cached_input_tokens': 0,
+        'cache_write_tokens': 0,
+        'output_tokens': len(text) // 4,
+    }
+
+
+PROVIDERS = {
+    'bedrock': call_bedrock,
+    'openai': call_openai,
+    'local': call_local,
+}
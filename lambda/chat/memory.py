@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import List, NamedTuple, Optional, Tuple
+
+import boto3
+import numpy as np
+
+import data_access
+import encryption
+import metrics
+
+MEMORY_RETRIEVAL_ENABLED = os.environ.get('MEMORY_RETRIEVAL', 'on').lower() not in ('off', 'false', '0')
+
+# 'local' is a deterministic hashing-trick embedding that needs no network; 'bedrock' uses
+# MEMORY_EMBEDDING_MODEL. Vectors from different embedders are never mixed in one index.
+MEMORY_EMBEDDING_PROVIDER = os.environ.get('MEMORY_EMBEDDING_PROVIDER', 'local').lower()
+MEMORY_EMBEDDING_MODEL = os.environ.get('MEMORY_EMBEDDING_MODEL', 'amazon.titan-embed-text-v2:0')
+MEMORY_EMBEDDING_DIM = int(os.environ.get('MEMORY_EMBEDDING_DIM', '512'))
+
+MEMORY_TOP_K = int(os.environ.get('MEMORY_TOP_K', '3'))
+MEMORY_MIN_SCORE = float(os.environ.get('MEMORY_MIN_SCORE', '0.15'))
+# Injected summaries are cut to this many tokens (estimated at 4 characters per token)
+MEMORY_TOKEN_BUDGET = int(os.environ.get('MEMORY_TOKEN_BUDGET', '300'))
+MEMORY_MAX_SUMMARIES = int(os.environ.get('MEMORY_MAX_SUMMARIES', '500'))
+
+# Warm-container cache of per-user indexes; other containers' new summaries show up after the TTL
+MEMORY_INDEX_TTL_SECONDS = float(os.environ.get('MEMORY_INDEX_TTL_SECONDS', '300'))
+MEMORY_INDEX_MAX_USERS = int(os.environ.get('MEMORY_INDEX_MAX_USERS', '256'))
+
+MEMORY_PREAMBLE = 'Notes from earlier conversations with this user, for context:'
+
+_executor = ThreadPoolExecutor(max_workers=2)
+_bedrock = None
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from had has have i i'm im in is it it's its me my of on or "
+    "so that the this to was we were what with you your".split()
+)
+_SUFFIXES = ('ing', 'ed', 'es', 's', 'ly')
+
+
+def embedding_model() -> str:
+    """Identifies the embedder; stored with each vector"""
+    if MEMORY_EMBEDDING_PROVIDER == 'bedrock':
+        return f"bedrock:{MEMORY_EMBEDDING_MODEL}:{MEMORY_EMBEDDING_DIM}"
+    return f"local:hash-v1:{MEMORY_EMBEDDING_DIM}"
+
+
+def embed(text: str) -> np.ndarray:
+    """Unit-length float32 embedding of text"""
+    if MEMORY_EMBEDDING_PROVIDER == 'bedrock':
+        vector = _embed_bedrock(text)
+    else:
+        vector = embed_local(text)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def embed_local(text: str, dim: int = MEMORY_EMBEDDING_DIM) -> np.ndarray:
+    """Signed feature hashing of stemmed words and half-weight bigrams.
+
+    Hashes are blake2b rather than hash() so vectors are the same in every process.
+    """
+    words = [_stem(w) for w in _TOKEN.findall(text.lower()) if w not in _STOPWORDS]
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    vector = np.zeros(dim, dtype=np.float32)
+    if not features:
+        return vector
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(f.encode('utf-8'), digest_size=8).digest(), 'little') for f in features],
+        dtype=np.uint64,
+    )
+    weights = np.where(hashes >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+    weights[len(words):] *= 0.5
+    np.add.at(vector, (hashes % np.uint64(dim)).astype(np.intp), weights)
+    return vector
+
+
+def _embed_bedrock(text: str) -> np.ndarray:
+    global _bedrock
+    if _bedrock is None:
+        _bedrock = boto3.client('bedrock-runtime')
+    response = _bedrock.invoke_model(
+        modelId=MEMORY_EMBEDDING_MODEL,
+        body=json.dumps({'inputText': text[:8000], 'dimensions': MEMORY_EMBEDDING_DIM, 'normalize': True}),
+    )
+    return np.asarray(json.loads(response['body'].read())['embedding'], dtype=np.float32)
+
+
+def to_bytes(vector: np.ndarray) -> bytes:
+    return vector.astype('<f4').tobytes()
+
+
+class UserIndex(NamedTuple):
+    session_ids: List[str]
+    summaries: List[str]
+    matrix: np.ndarray  # (summaries, MEMORY_EMBEDDING_DIM) float32, unit rows
+    loaded_at: float
+
+
+_indexes: OrderedDict = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _load_index(username: str) -> UserIndex:
+    rows = data_access.query_summary_embeddings(username, embedding_model(), MEMORY_MAX_SUMMARIES)
+    texts = encryption.decrypt_many(username, [
+        (r['summary'], encryption.summary_aad(username, r['sessionId'])) for r in rows
+    ])
+    # Vectors stored before embeddings were encrypted are plain MEMORY_EMBEDDING_DIM floats
+    plain = MEMORY_EMBEDDING_DIM * 4
+    vectors = encryption.decrypt_many(username, [
+        (None if len(r['embedding']) == plain else r['embedding'], encryption.embedding_aad(username, r['sessionId']))
+        for r in rows
+    ])
+    rows = [
+        {**r, 'summary': text, 'embedding': r['embedding'] if len(r['embedding']) == plain else vector}
+        for r, text, vector in zip(rows, texts, vectors)
+    ]
+    rows = [r for r in rows if r['summary'] is not None and r['embedding'] is not None]
+    if rows:
+        matrix = np.frombuffer(b''.join(r['embedding'] for r in rows), dtype='<f4')
+        matrix = matrix.reshape(len(rows), MEMORY_EMBEDDING_DIM).astype(np.float32)
+    else:
+        matrix = np.zeros((0, MEMORY_EMBEDDING_DIM), dtype=np.float32)
+    metrics.incr('MemoryIndexLoads')
+    return UserIndex([r['sessionId'] for r in rows], [r['summary'] for r in rows], matrix, time.monotonic())
+
+
+def user_index(username: str) -> UserIndex:
+    """The user's index from the warm-container cache, reloaded after MEMORY_INDEX_TTL_SECONDS"""
+    with _indexes_lock:
+        index = _indexes.get(username)
+        if index is not None and time.monotonic() - index.loaded_at < MEMORY_INDEX_TTL_SECONDS:
+            _indexes.move_to_end(username)
+            return index
+    index = _load_index(username)
+    _cache_index(username, index)
+    return index
+
+
+def _cache_index(username: str, index: UserIndex):
+    with _indexes_lock:
+        _indexes[username] = index
+        _indexes.move_to_end(username)
+        while len(_indexes) > MEMORY_INDEX_MAX_USERS:
+            _indexes.popitem(last=False)
+
+
+def forget_user(username: str):
+    """Drop the user's cached index (e.g. after their summaries are deleted)"""
+    with _indexes_lock:
+        _indexes.pop(username, None)
+
+
+def remember(username: str, session_id: str, summary: str) -> Tuple[Optional[bytes], Optional[str]]:
+    """Embed a summary as it is stored; returns (embedding bytes, model) for the item"""
+    if not MEMORY_RETRIEVAL_ENABLED:
+        return None, None
+    try:
+        vector = embed(summary)
+    except Exception as e:
+        print(f"Summary embedding failed: {str(e)}")
+        metrics.incr('MemoryEmbedErrors')
+        return None, None
+
+    # Keep a cached index current for this container without a reload
+    with _indexes_lock:
+        index = _indexes.get(username)
+    if index is not None:
+        session_ids, summaries = list(index.session_ids), list(index.summaries)
+        if session_id in session_ids:
+            row = session_ids.index(session_id)
+            summaries[row] = summary
+            matrix = index.matrix.copy()
+            matrix[row] = vector
+        else:
+            session_ids.append(session_id)
+            summaries.append(summary)
+            matrix = np.vstack([index.matrix, vector[np.newaxis, :]])
+        _cache_index(username, UserIndex(session_ids, summaries, matrix, index.loaded_at))
+    return to_bytes(vector), embedding_model()
+
+
+def search(username: str, text: str, exclude_session: Optional[str] = None,
+           k: int = MEMORY_TOP_K) -> List[Tuple[float, str]]:
+    """Top-k (score, summary) by cosine similarity, best first, above MEMORY_MIN_SCORE"""
+    index = user_index(username)
+    if not len(index.session_ids):
+        return []
+    scores = index.matrix @ embed(text)
+    if exclude_session in index.session_ids:
+        scores[index.session_ids.index(exclude_session)] = -np.inf
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(float(scores[i]), index.summaries[i]) for i in top if scores[i] >= MEMORY_MIN_SCORE]
+
+
+def recall(username: str, session_id: str, text: str) -> List[str]:
+    """Most relevant summaries from the user's other sessions, within MEMORY_TOKEN_BUDGET"""
+    start = time.perf_counter()
+    budget = MEMORY_TOKEN_BUDGET * 4
+    notes = []
+    for _, summary in search(username, text, exclude_session=session_id):
+        if len(summary) > budget:
+            break
+        notes.append(summary)
+        budget -= len(summary)
+    metrics.timing('MemoryRecallLatency', (time.perf_counter() - start) * 1000)
+    if notes:
+        metrics.incr('MemoryRecalled', len(notes))
+    return notes
+
+
+def prefetch(username: str, session_id: str, text: str) -> Future:
+    """Start recall so the index load and search overlap the history fetch"""
+    if not MEMORY_RETRIEVAL_ENABLED:
+        done = Future()
+        done.set_result([])
+        return done
+    return _executor.submit(recall, username, session_id, text)
+
+
+def recall_within(future: Future, timeout: float) -> List[str]:
+    """Result of prefetch, or no notes (fail open) if it fails or is not ready in time"""
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        metrics.incr('MemoryRecallTimeout')
+    except Exception as e:
+        print(f"Memory recall failed: {str(e)}")
+        metrics.incr('MemoryRecallErrors')
+    return []
+
+
+def with_notes(message: str, notes: List[str]) -> str:
+    """The user's message with recalled notes in front of it"""
+    if not notes:
+        return message
+    lines = '\n'.join(f"- {note}" for note in notes)
+    return f"{MEMORY_PREAMBLE}\n{lines}\n\n{message}"
@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'SoulShield')
+
+_lock = threading.Lock()
+_counters: Dict[Tuple, float] = defaultdict(float)
+_timings: Dict[Tuple, List[float]] = defaultdict(list)
+
+
+def _key(name: str, dimensions: Dict) -> Tuple:
+    return (name, tuple(sorted((k, str(v)) for k, v in dimensions.items())))
+
+
+def incr(name: str, value: float = 1, **dimensions):
+    """Add to a counter for the current invocation"""
+    with _lock:
+        _counters[_key(name, dimensions)] += value
+
+
+def timing(name: str, milliseconds: float, **dimensions):
+    """Record a latency sample in milliseconds"""
+    with _lock:
+        _timings[_key(name, dimensions)].append(round(milliseconds, 2))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def snapshot() -> Dict:
+    """Return buffered metrics without clearing them"""
+    with _lock:
+        counters = {_label(k): v for k, v in _counters.items()}
+        timings = {
+            _label(k): {
+                'count': len(v),
+                'p50': percentile(v, 50),
+                'p95': percentile(v, 95),
+                'max': max(v),
+            }
+            for k, v in _timings.items() if v
+        }
+    return {'counters': counters, 'timings': timings}
+
+
+def flush():
+    """Print buffered metrics as CloudWatch Embedded Metric Format lines and reset"""
+    with _lock:
+        counters = dict(_counters)
+        timings = dict(_timings)
+        _counters.clear()
+        _timings.clear()
+
+    now = int(time.time() * 1000)
+    for (name, dims), value in counters.items():
+        print(json.dumps(_emf_record(now, name, dims, value, 'Count')))
+    for (name, dims), values in timings.items():
+        print(json.dumps(_emf_record(now, name, dims, values, 'Milliseconds')))
+
+
+def _emf_record(timestamp: int, name: str, dims: Tuple, value, unit: str) -> Dict:
+    record = {
+        '_aws': {
+            'Timestamp': timestamp,
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [[k for k, _ in dims]],
+                'Metrics': [{'Name': name, 'Unit': unit}],
+            }],
+        },
+        name: value,
+    }
+    record.update(dict(dims))
+    return record
+
+
+def _label(key: Tuple) -> str:
+    name, dims = key
+    if not dims:
+        return name
+    return name + '[' + ','.join(f"{k}={v}" for k, v in dims) + ']'
@@ -0,0 +1,245 @@
+import hashlib
+import hmac
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import boto3
+
+import metrics
+
+PII_REDACTION_ENABLED = os.environ.get('PII_REDACTION', 'on').lower() not in ('off', 'false', '0')
+PII_ENTITY_TYPES = [
+    t.strip().upper() for t in os.environ.get('PII_ENTITY_TYPES', 'EMAIL,SSN,CARD,PHONE,IP').split(',')
+    if t.strip()
+]
+# Keys the placeholder hashes so they are stable across containers without storing values.
+# Deployed stacks generate it in Secrets Manager (PII_PLACEHOLDER_KEY_SECRET_ARN); local runs
+# set PII_PLACEHOLDER_KEY. Without a secret key, anyone who knows a session ID could hash
+# guesses of a short value (a phone number, an SSN) until one matches the stored placeholder,
+# so redaction refuses to run without one.
+PII_PLACEHOLDER_KEY = os.environ.get('PII_PLACEHOLDER_KEY', '')
+PII_PLACEHOLDER_KEY_SECRET_ARN = os.environ.get('PII_PLACEHOLDER_KEY_SECRET_ARN', '')
+PII_VAULT_MAX_SESSIONS = int(os.environ.get('PII_VAULT_MAX_SESSIONS', '512'))
+
+_placeholder_key: Optional[bytes] = None
+
+
+def placeholder_key() -> bytes:
+    """The placeholder HMAC key, fetched from Secrets Manager once per container"""
+    global _placeholder_key
+    if _placeholder_key is None:
+        key = PII_PLACEHOLDER_KEY
+        if not key and PII_PLACEHOLDER_KEY_SECRET_ARN:
+            key = boto3.client('secretsmanager').get_secret_value(
+                SecretId=PII_PLACEHOLDER_KEY_SECRET_ARN
+            )['SecretString']
+        if not key:
+            raise RuntimeError('PII redaction needs PII_PLACEHOLDER_KEY or PII_PLACEHOLDER_KEY_SECRET_ARN')
+        _placeholder_key = key.encode('utf-8')
+    return _placeholder_key
+
+
+# Alternation order matters where entities overlap: SSN and CARD are tried before PHONE
+ENTITY_PATTERNS = {
+    'EMAIL': r"(?<![A-Za-z0-9._%+-])[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}",
+    'SSN': r"(?<!\d)\d{3}-\d{2}-\d{4}(?!\d)",
+    'CARD': r"(?<!\d)\d(?:[ -]?\d){12,18}(?!\d)",
+    'PHONE': r"(?<![\w+])(?:\+?\d{1,3}[ .-]?)?(?:\(\d{3}\)|\d{3})[ .-]?\d{3}[ .-]?\d{4}(?!\d)",
+    'IP': r"(?<![\d.])(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)(?![\d.])",
+}
+
+# Every supported entity contains a digit or an '@'. The combined pattern only runs on the
+# whitespace-delimited run around each of these, found with one C-speed scan of the text.
+_TRIGGER = re.compile(r"[@\d]")
+_RUN_TAIL = re.compile(r"(?:\S|(?<=[\d()+-])[ \n](?=[\d()+-]))*")
+
+_PLACEHOLDER = re.compile(r"\[(?:" + "|".join(ENTITY_PATTERNS) + r")_[0-9a-f]{6}\]")
+
+# No entity crosses whitespace, except between the digit groups of a PHONE or CARD
+_DIGITISH = set('0123456789()+-')
+
+# Past this many pending characters without a safe cut, a stream emits anyway
+STREAM_MAX_PENDING = 1024
+
+
+def _combined_pattern(entity_types: List[str]) -> re.Pattern:
+    unknown = set(entity_types) - set(ENTITY_PATTERNS)
+    if unknown:
+        raise ValueError(f"Unknown PII entity types: {', '.join(sorted(unknown))}")
+    return re.compile("|".join(
+        f"(?P<{name}>{pattern})" for name, pattern in ENTITY_PATTERNS.items() if name in entity_types
+    ))
+
+
+_ENTITIES = _combined_pattern(PII_ENTITY_TYPES)
+
+
+def _is_boundary(text: str, i: int) -> bool:
+    """Whether text[i] is whitespace that no entity can span"""
+    if not text[i].isspace():
+        return False
+    return not (0 < i < len(text) - 1 and text[i - 1] in _DIGITISH and text[i + 1] in _DIGITISH)
+
+
+def _candidate_spans(text: str):
+    """Yield (start, end) of the runs between boundaries that contain a trigger character"""
+    end = 0
+    match = _TRIGGER.search(text)
+    while match:
+        trigger = match.start()
+        # Back to the previous space or newline that is a boundary (never past the last run)
+        start = trigger
+        while True:
+            start = max(text.rfind(' ', end, start), text.rfind('\n', end, start))
+            if start < 0:
+                start = end
+                break
+            if not (start > 0 and text[start - 1] in _DIGITISH and text[start + 1] in _DIGITISH):
+                start += 1
+                break
+        end = _RUN_TAIL.match(text, trigger).end()
+        yield start, end
+        match = _TRIGGER.search(text, end)
+
+
+def _luhn_valid(digits: str) -> bool:
+    total = 0
+    for i, ch in enumerate(reversed(digits)):
+        d = int(ch)
+        if i % 2:
+            d = d * 2 - 9 if d > 4 else d * 2
+        total += d
+    return total % 10 == 0
+
+
+class ChunkScanner:
+    """Applies a regex substitution to text arriving in chunks, in one pass.
+
+    Each chunk is appended to a small pending buffer; everything up to the last whitespace
+    that no entity can span is substituted and passed to sink, the rest waits for the next
+    chunk. flush() emits whatever is left at the end of the stream.
+    """
+
+    def __init__(self, transform: Callable[[str], str], sink: Callable[[str], None]):
+        self.transform = transform
+        self.sink = sink
+        self._pending = ''
+
+    def feed(self, chunk: str):
+        self._pending += chunk
+        cut = self._safe_cut()
+        if cut:
+            self._emit(self._pending[:cut])
+            self._pending = self._pending[cut:]
+
+    def flush(self):
+        if self._pending:
+            self._emit(self._pending)
+            self._pending = ''
+
+    def __call__(self, chunk: str):
+        self.feed(chunk)
+
+    def _emit(self, text: str):
+        out = self.transform(text)
+        if out:
+            self.sink(out)
+
+    def _safe_cut(self) -> int:
+        text = self._pending
+        for i in range(len(text) - 1, 0, -1):
+            if not _is_boundary(text, i):
+                continue
+            if i + 1 == len(text) and text[i - 1] in _DIGITISH:
+                # The next chunk may continue a number group
+                continue
+            return i + 1
+        return len(text) if len(text) > STREAM_MAX_PENDING else 0
+
+
+class SessionVault:
+    """Redacts and restores PII for one session.
+
+    Placeholders are '[TYPE_xxxxxx]', a keyed hash of the session and value, so the same value
+    always gets the same placeholder in a session, in any container, without the value being
+    stored. Values seen by this container are kept in memory so restore() can put them back
+    in text going to the user; placeholders from other containers are left as they are.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self._values: Dict[str, str] = {}  # placeholder -> value
+        self._placeholders: Dict[Tuple[str, str], str] = {}  # (entity, value) -> placeholder
+        self._lock = threading.Lock()
+
+    def placeholder(self, entity: str, value: str) -> str:
+        token = self._placeholders.get((entity, value))
+        if token:
+            return token
+        digest = hmac.new(
+            placeholder_key(), f"{self.session_id}\x00{entity}\x00{value}".encode('utf-8'), hashlib.sha256
+        ).hexdigest()[:6]
+        token = f"[{entity}_{digest}]"
+        with self._lock:
+            self._values[token] = value
+            self._placeholders[(entity, value)] = token
+        return token
+
+    def redact(self, text: str) -> str:
+        if not PII_REDACTION_ENABLED or not text:
+            return text
+        placeholder_key()  # fail every message, not only those with PII, when there is no key
+        found = [0]
+
+        def replace(match: re.Match) -> str:
+            entity = match.lastgroup
+            value = match.group(0)
+            if entity == 'CARD' and not _luhn_valid(re.sub(r"[ -]", '', value)):
+                return value
+            found[0] += 1
+            return self.placeholder(entity, value)
+
+        parts, last = [], 0
+        for start, end in _candidate_spans(text):
+            parts.append(text[last:start])
+            parts.append(_ENTITIES.sub(replace, text[start:end]))
+            last = end
+        if not parts:
+            return text
+        parts.append(text[last:])
+        if found[0]:
+            metrics.incr('PIIRedacted', found[0])
+        return ''.join(parts)
+
+    def restore(self, text: str) -> str:
+        if not text or '[' not in text:
+            return text
+        with self._lock:
+            values = dict(self._values)
+        return _PLACEHOLDER.sub(lambda m: values.get(m.group(0), m.group(0)), text)
+
+    def redacting_stream(self, sink: Callable[[str], None]) -> ChunkScanner:
+        return ChunkScanner(self.redact, sink)
+
+    def restoring_stream(self, sink: Callable[[str], None]) -> ChunkScanner:
+        return ChunkScanner(self.restore, sink)
+
+
+_vaults: OrderedDict = OrderedDict()
+_vaults_lock = threading.Lock()
+
+
+def vault(session_id: str) -> SessionVault:
+    """The session's vault, kept in a bounded warm-container LRU"""
+    with _vaults_lock:
+        found = _vaults.get(session_id)
+        if found is None:
+            found = _vaults[session_id] = SessionVault(session_id)
+            while len(_vaults) > PII_VAULT_MAX_SESSIONS:
+                _vaults.popitem(last=False)
+        else:
+            _vaults.move_to_end(session_id)
+        return found
@@ -0,0 +1,113 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from metrics import percentile
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker that trips on error rate or slow-call rate"""
+
+    def __init__(self, name: str, window_seconds: float = 60, min_calls: int = 5,
+                 error_threshold: float = 0.5, slow_call_ms: float = 10000,
+                 slow_call_threshold: float = 0.8, cooldown_seconds: float = 30):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.slow_call_ms = slow_call_ms
+        self.slow_call_threshold = slow_call_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._calls = deque()  # (monotonic time, success, latency_ms)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def allow(self) -> bool:
+        """Return True if a call may be attempted now"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record(self, success: bool, latency_ms: float):
+        """Record the outcome of a call and update breaker state"""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                if success and latency_ms < self.slow_call_ms:
+                    self._state = CLOSED
+                    self._calls.clear()
+                else:
+                    self._trip(now)
+                return
+
+            self._calls.append((now, success, latency_ms))
+            while self._calls and now - self._calls[0][0] > self.window_seconds:
+                self._calls.popleft()
+
+            if self._state == CLOSED and len(self._calls) >= self.min_calls:
+                total = len(self._calls)
+                errors = sum(1 for _, ok, _ in self._calls if not ok)
+                slow = sum(1 for _, _, ms in self._calls if ms >= self.slow_call_ms)
+                if errors / total >= self.error_threshold or slow / total >= self.slow_call_threshold:
+                    self._trip(now)
+
+    def cancel_probe(self):
+        """Give back a half-open probe that allow() granted but no call was made for"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+
+    def _trip(self, now: float):
+        print(f"Circuit breaker {self.name} opened")
+        self._state = OPEN
+        self._opened_at = now
+        self._calls.clear()
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+
+
+class LatencyTracker:
+    """Bounded reservoir of recent latencies for percentile estimates"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, latency_ms: float):
+        with self._lock:
+            self._samples.append(latency_ms)
+
+    def p95(self, min_samples: int = 20) -> Optional[float]:
+        """Return the p95 latency, or None until enough samples are collected"""
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            return percentile(list(self._samples), 95)
+
+
+def backoff_delay(attempt: int, base: float = 0.25, cap: float = 4.0) -> float:
+    """Full-jitter exponential backoff delay in seconds"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
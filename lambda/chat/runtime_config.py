@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import boto3
+from botocore.config import Config
+
+import metrics
+
+# Where the runtime settings document (a JSON object) lives:
+#   ssm:<parameter name>                           SSM Parameter Store (the stack's default)
+#   appconfig:<application>/<environment>/<profile> through the AWS AppConfig Lambda extension
+#   file:<path>                                    local stand-in, re-read like the others
+# Empty: environment variables only.
+RUNTIME_CONFIG_SOURCE = os.environ.get('RUNTIME_CONFIG_SOURCE', '')
+
+# Age after which a read triggers a background refresh; requests never wait for one
+RUNTIME_CONFIG_TTL_SECONDS = float(os.environ.get('RUNTIME_CONFIG_TTL_SECONDS', '30'))
+
+# Provider names llm_provider.PROVIDERS knows
+LLM_PROVIDERS = ('bedrock', 'openai', 'local')
+
+
+def _model_tiers_valid(value) -> bool:
+    return all(isinstance(tiers, dict) and all(isinstance(m, str) and m for m in tiers.values())
+               for tiers in value.values())
+
+
+def _routing_policy_valid(value) -> bool:
+    fields = {'task': str, 'tier': str, 'max_tokens': int, 'max_input_chars': int}
+    return all(
+        isinstance(rule, dict) and set(rule) <= set(fields)
+        and all(isinstance(rule[k], fields[k]) and not isinstance(rule[k], bool) for k in rule)
+        for rule in value
+    )
+
+
+# Settings the document may carry: name -> (environment variable, type, default, check).
+# A document value wins over the environment variable, which wins over the default; None
+# defaults leave the owning module's built-in value in place.
+SETTINGS = {
+    'system_prompt': ('SYSTEM_PROMPT', str, 'You are a helpful AI assistant.', lambda v: 0 < len(v) <= 8000),
+    'llm_provider': ('LLM_PROVIDER', str, 'bedrock', lambda v: v in LLM_PROVIDERS),
+    'llm_fallback_providers': ('LLM_FALLBACK_PROVIDERS', str, '', None),
+    'llm_model_tiers': ('LLM_MODEL_TIERS', dict, None, _model_tiers_valid),
+    'llm_routing_policy': ('LLM_ROUTING_POLICY', list, None, _routing_policy_valid),
+    'data_retention_days': ('DATA_RETENTION_DAYS', int, 30, lambda v: 1 <= v <= 3650),
+}
+
+
+class InvalidConfig(ValueError):
+    """Raised when a settings document does not match SETTINGS"""
+
+
+def _from_env(name: str, kind: type, default):
+    raw = os.environ.get(name)
+    if not raw:
+        return default
+    try:
+        return json.loads(raw) if kind in (dict, list) else kind(raw)
+    except ValueError:
+        print(f"Ignoring invalid {name}")
+        return default
+
+
+def validate(document: Dict) -> Dict:
+    """The document's settings, checked against SETTINGS; any error rejects all of them"""
+    if not isinstance(document, dict):
+        raise InvalidConfig('settings document must be a JSON object')
+    unknown = set(document) - set(SETTINGS)
+    if unknown:
+        raise InvalidConfig(f"unknown settings: {', '.join(sorted(unknown))}")
+    for name, value in document.items():
+        _, kind, _, check = SETTINGS[name]
+        if not isinstance(value, kind) or isinstance(value, bool):
+            raise InvalidConfig(f"{name} must be of type {kind.__name__}")
+        if check and not check(value):
+            raise InvalidConfig(f"{name} has an invalid value")
+    return document
+
+
+_defaults = {name: _from_env(env, kind, default) for name, (env, kind, default, _) in SETTINGS.items()}
+_values: Dict[str, Any] = dict(_defaults)
+_raw: Optional[str] = None
+_fetched_at = float('-inf')
+_refreshing = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1)
+_ssm = None
+
+
+def _fetch() -> str:
+    global _ssm
+    scheme, _, location = RUNTIME_CONFIG_SOURCE.partition(':')
+    if scheme == 'ssm':
+        if _ssm is None:
+            _ssm = boto3.client('ssm', config=Config(connect_timeout=1, read_timeout=2,
+                                                     retries={'max_attempts': 2, 'mode': 'standard'}))
+        return _ssm.get_parameter(Name=location)['Parameter']['Value']
+    if scheme == 'appconfig':
+        application, environment, profile = location.split('/')
+        port = os.environ.get('AWS_APPCONFIG_EXTENSION_HTTP_PORT', '2772')
+        url = (f"http://localhost:{port}/applications/{application}"
+               f"/environments/{environment}/configurations/{profile}")
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return response.read().decode('utf-8')
+    if scheme == 'file':
+        with open(location) as f:
+            return f.read()
+    raise InvalidConfig(f"unsupported RUNTIME_CONFIG_SOURCE scheme: {scheme}")
+
+
+def refresh():
+    """Fetch the document and swap in its settings if it changed and is valid"""
+    global _values, _raw, _fetched_at
+    try:
+        raw = _fetch()
+        if raw != _raw:
+            document = validate(json.loads(raw or '{}'))
+            _values = {**_defaults, **document}
+            _raw = raw
+            print(f"Runtime config loaded: {', '.join(sorted(document)) or 'no overrides'}")
+            metrics.incr('RuntimeConfigUpdates')
+    except Exception as e:
+        # Keep serving the last good settings; the next read after the TTL tries again
+        print(f"Runtime config refresh failed: {type(e).__name__}: {str(e)}")
+        metrics.incr('RuntimeConfigErrors')
+    finally:
+        _fetched_at = time.monotonic()
+
+
+def _refresh_in_background():
+    try:
+        refresh()
+    finally:
+        _refreshing.release()
+
+
+def get(name: str):
+    """Current value of a setting; a stale cache is refreshed in the background"""
+    if RUNTIME_CONFIG_SOURCE and time.monotonic() - _fetched_at > RUNTIME_CONFIG_TTL_SECONDS:
+        if _refreshing.acquire(blocking=False):
+            _executor.submit(_refresh_in_background)
+    return _values[name]
+
+
+# Cold starts load the document before the first request, so no request sees stale settings
+if RUNTIME_CONFIG_SOURCE:
+    refresh()
@@ -0,0 +1,151 @@
+import json
+import math
+import os
+import re
+import time
+from typing import Dict, NamedTuple, Optional
+
+import metrics
+
+# Optional local classifier: JSON with 'bias', 'weights' (unigram/bigram -> weight) and
+# 'threshold'; see scripts/bench_crisis_screening.py --train-classifier. It only raises
+# messages the patterns missed to 'elevated'; 'high' always comes from an explicit pattern.
+CRISIS_CLASSIFIER_PATH = os.environ.get('CRISIS_CLASSIFIER_PATH', '')
+
+# What a high-risk message gets: 'resources' answers with CRISIS_RESOURCES_MESSAGE without
+# calling the LLM; 'route' sends it to the 'crisis' task (safe model tier) instead
+CRISIS_HIGH_ACTION = os.environ.get('CRISIS_HIGH_ACTION', 'resources').lower()
+
+CRISIS_RESOURCES_MESSAGE = os.environ.get('CRISIS_RESOURCES_MESSAGE') or (
+    "I'm really sorry you're going through this, and I'm glad you told me. You deserve support "
+    "from a person right now. If you're in the US, you can call or text 988 to reach the Suicide "
+    "& Crisis Lifeline, or text HOME to 741741 to reach the Crisis Text Line, any time. If you're "
+    "somewhere else, findahelpline.com lists free, confidential services in your country. If you "
+    "are in immediate danger, please call your local emergency number. I'm here to keep talking too."
+)
+
+# Explicit first-person statements of intent or self-harm. A mention of suicide or an
+# overdose on its own (a documentary, the news, someone else's loss or risk), an accident
+# and idioms like "going to die of embarrassment" are not: those go to the elevated list
+# or pass.
+HIGH_RISK_PATTERNS = [
+    r"kill(?:ing)? my ?self",
+    r"end(?:ing)? (?:my life|it all)",
+    r"end(?:ing)? (?:things|everything)(?! (?:with|between|at|for|off|on|early|before|after)\b)",
+    r"take my (?:own )?life",
+    r"(?:(?:want|going|plan(?:ning)?) to|wanna|gonna) (?:die|overdose)(?! (?:of|from|laughing|if|lol)\b)",
+    r"(?:i|i'm|im|i've|i'd)(?: (?:am|was|have|had|been|keep|get|feel|feeling|having|getting|so|really|very"
+    r"|still|always|often|kind of|kinda|a bit|a little|actively))* su[i1]c[i1]dal",
+    r"(?:commit(?:ting)?|attempt(?:ing)?|thinking (?:about|of)|thoughts of|consider(?:ing)?) su[i1]c[i1]de",
+    r"self[- ]?harm(?:ing)?",
+    r"(?<!accidentally )(?:hurt(?:ing)?|cut(?:ting)?) my ?self"
+    r"(?! (?:while|playing|cooking|shaving|chopping|slicing|during|at|on (?!purpose\b)|by accident|accidentally)\b)",
+    r"(?:i|i'm|im|i've|i'll|i'd)(?: (?:am|was|have|had|just|almost|nearly|might|will|could|want to|going to"
+    r"|gonna|planning to|thinking about|tried to))* (?:take|taking|took|taken) an overdose",
+    r"better off dead",
+    r"no reason to (?:live|go on|keep going)",
+    r"don'?t want to (?:live|be alive|be here anymore|wake up)",
+    r"(?:wrote|writing|written|left) (?:a|my) (?:suicide|goodbye) (?:note|letter)",
+]
+
+# Hopelessness and distress that warrant the safer model but not a script
+ELEVATED_RISK_PATTERNS = [
+    r"hopeless(?:ness)?",
+    r"can'?t (?:go on|take (?:it|this) anymore|do this anymore)",
+    r"no way out",
+    r"(?:nobody|no one) would (?:miss|care about) me",
+    r"(?:feel|am|i'm) (?:so )?worthless",
+    r"(?:everyone|they) would be better off without me",
+    r"give up on (?:everything|life)",
+    r"(?:disappear|vanish) forever",
+    r"(?:panic attack|can'?t breathe)",
+    r"su[i1]c[i1]de(?! (?:prevention|awareness|hotline|lifeline|rates?|statistics|research)\b)",
+    r"su[i1]c[i1]dal",
+    r"(?:(?:want|going) to|wanna|gonna) die",
+]
+
+NONE, ELEVATED, HIGH = 'none', 'elevated', 'high'
+
+
+def _compile(patterns) -> re.Pattern:
+    return re.compile(r"\b(?:" + "|".join(patterns) + r")\b")
+
+
+# One alternation per level: the regex engine scans each message once per level
+_HIGH_RISK = _compile(HIGH_RISK_PATTERNS)
+_ELEVATED_RISK = _compile(ELEVATED_RISK_PATTERNS)
+
+_NORMALIZE = str.maketrans({'’': "'", '‘': "'", ' ': ' '})
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+
+class Screening(NamedTuple):
+    level: str
+    matched: Optional[str] = None
+    score: Optional[float] = None
+
+    @property
+    def flagged(self) -> bool:
+        return self.level != NONE
+
+
+def _load_classifier() -> Optional[Dict]:
+    if not CRISIS_CLASSIFIER_PATH or not os.path.exists(CRISIS_CLASSIFIER_PATH):
+        return None
+    with open(CRISIS_CLASSIFIER_PATH, encoding='utf-8') as f:
+        model = json.load(f)
+    model.setdefault('threshold', 0.5)
+    return model
+
+
+# Loaded once per container
+_classifier = _load_classifier()
+
+
+def normalize(text: str) -> str:
+    return ' '.join(text.translate(_NORMALIZE).lower().split())
+
+
+def features(text: str):
+    """Unigrams and bigrams of normalized text, as used by the classifier"""
+    tokens = _TOKEN.findall(text)
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def classifier_score(text: str, model: Optional[Dict] = None) -> Optional[float]:
+    """Logistic score of a normalized message, or None when no classifier is loaded"""
+    model = model or _classifier
+    if model is None:
+        return None
+    weights = model['weights']
+    z = model.get('bias', 0.0) + sum(weights.get(f, 0.0) for f in features(text))
+    return 1 / (1 + math.exp(-max(-30.0, min(30.0, z))))
+
+
+def screen(text: str) -> Screening:
+    """Classify a message as 'high', 'elevated' or 'none' risk"""
+    normalized = normalize(text)
+
+    match = _HIGH_RISK.search(normalized)
+    if match:
+        return Screening(HIGH, match.group(0))
+
+    match = _ELEVATED_RISK.search(normalized)
+    if match:
+        return Screening(ELEVATED, match.group(0))
+
+    score = classifier_score(normalized)
+    if score is not None and score >= _classifier['threshold']:
+        return Screening(ELEVATED, None, score)
+    return Screening(NONE, None, score)
+
+
+def screen_message(text: str) -> Screening:
+    """screen() with latency and outcome metrics"""
+    start = time.perf_counter()
+    result = screen(text)
+    metrics.timing('ScreeningLatency', (time.perf_counter() - start) * 1000)
+    if result.flagged:
+        metrics.incr('CrisisScreened', Level=result.level)
+        print(f"Crisis screening flagged a message: level={result.level}")
+    return result
@@ -0,0 +1,294 @@
+import base64
+import math
+import os
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+import data_access
+import encryption
+import metrics
+from codec import decode_content
+from deadline import Deadline
+
+# Message roles added to the index; assistant replies are long and rarely what users look for
+SEARCH_INDEX_ROLES = {r.strip() for r in os.environ.get('SEARCH_INDEX_ROLES', 'user').split(',') if r.strip()}
+
+# Posting-list updates in flight at once in the indexer
+SEARCH_INDEX_CONCURRENCY = int(os.environ.get('SEARCH_INDEX_CONCURRENCY', '16'))
+
+SEARCH_MAX_QUERY_TERMS = int(os.environ.get('SEARCH_MAX_QUERY_TERMS', '8'))
+SEARCH_MAX_RESULTS = 50
+SEARCH_SNIPPET_CHARS = int(os.environ.get('SEARCH_SNIPPET_CHARS', '160'))
+
+# Best candidates by posting lists that are fetched and rescored on their text
+SEARCH_RERANK_CANDIDATES = int(os.environ.get('SEARCH_RERANK_CANDIDATES', '30'))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Time GET /search spends before answering with what it has
+SEARCH_BUDGET_SECONDS = float(os.environ.get('SEARCH_BUDGET_SECONDS', '3'))
+
+# Posting lists are sharded by day so each stays small to update and expires with its messages
+DAY_MS = 24 * 60 * 60 * 1000
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further
+had has have having he her here hers herself him himself his how i if in into is it its
+itself just me more most my myself no nor not now of off on once only or other our ours
+ourselves out over own same she should so some such than that the their theirs them
+themselves then there these they this those through to too under until up very was we were
+what when where which while who whom why will with would you your yours yourself yourselves
+im ive id ill dont didnt cant wont isnt
+""".split())
+
+
+def _stem(word: str) -> str:
+    """Light suffix stripping, enough to match 'issues' with 'issue' or 'sleeping' with 'sleep'"""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith('ied'):
+        return word[:-3] + 'y'
+    if len(word) > 5 and word.endswith('ing'):
+        return word[:-3]
+    if len(word) > 4 and word.endswith('ed') and not word.endswith('eed'):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def _words(text: str) -> List[Tuple[str, int, int]]:
+    """(token, start, end) of every indexable word in text"""
+    words = []
+    for match in _WORD_RE.finditer(text.lower()):
+        word = match.group().split("'")[0]
+        if len(word) < 2 or word in STOPWORDS:
+            continue
+        words.append((_stem(word), match.start(), match.end()))
+    return words
+
+
+def tokenize(text: str) -> List[str]:
+    """Distinct search tokens of a text, in order of first appearance"""
+    return list(dict.fromkeys(token for token, _, _ in _words(text)))
+
+
+def snippet(text: str, tokens: Set[str]) -> str:
+    """About SEARCH_SNIPPET_CHARS of text around the first word matching a token"""
+    if len(text) <= SEARCH_SNIPPET_CHARS:
+        return text
+    first = next(((start, end) for token, start, end in _words(text) if token in tokens), None)
+    start, end = first or (0, 0)
+    begin = max(0, min(start - SEARCH_SNIPPET_CHARS // 3, len(text) - SEARCH_SNIPPET_CHARS))
+    finish = begin + SEARCH_SNIPPET_CHARS
+    # Cut at spaces rather than mid-word
+    if begin > 0:
+        space = text.find(' ', begin, start)
+        begin = space + 1 if space != -1 else begin
+    if finish < len(text):
+        space = text.rfind(' ', end, finish)
+        finish = space if space != -1 else finish
+    return ('…' if begin > 0 else '') + text[begin:finish].strip() + ('…' if finish < len(text) else '')
+
+
+# Indexer: DynamoDB Streams consumer on ChatHistory
+
+def _image_value(value: Dict):
+    # Stream images carry binary attributes base64 encoded
+    return base64.b64decode(value['B']) if 'B' in value else value['S']
+
+
+def _record_message(record: Dict) -> Optional[Dict]:
+    image = record['dynamodb'].get('NewImage' if record['eventName'] == 'INSERT' else 'OldImage')
+    if not image or 'username' not in image:
+        return None
+    return {
+        'username': image['username']['S'],
+        'sessionId': image['sessionId']['S'],
+        'timestamp': int(image['timestamp']['N']),
+        'role': image['role']['S'],
+        'content': _image_value(image['content']),
+        'ttl': int(image['ttl']['N']) if 'ttl' in image else 0,
+    }
+
+
+def _user_postings(username: str, messages: List[Dict]) -> Dict[str, List[Dict]]:
+    """Messages of one user grouped by the posting lists (token hash and day) they belong to"""
+    postings: Dict[str, List[Dict]] = defaultdict(list)
+    contents = encryption.decrypt_many(username, [
+        (m['content'], encryption.message_aad(m['sessionId'], m['timestamp'])) for m in messages
+    ])
+    for message, content in zip(messages, contents):
+        if content is None:
+            continue
+        tokens = tokenize(decode_content(content))
+        day = message['timestamp'] // DAY_MS
+        for hashed in encryption.blind_tokens(username, tokens):
+            postings[f"{hashed}#{day}"].append(message)
+    return postings
+
+
+def index_records(records: List[Dict]) -> Dict[str, int]:
+    """Apply a batch of stream records to the posting lists.
+
+    Updates are grouped per (user, posting list), so a batch costs one UpdateItem per list
+    it touches rather than one per word per message. Set ADD/DELETE are idempotent, so a
+    retried batch leaves the same lists (only the per-user message counts can drift).
+    """
+    grouped: Dict[Tuple[str, str], List[Dict]] = defaultdict(list)
+    for record in records:
+        if record.get('eventName') not in ('INSERT', 'REMOVE'):
+            continue
+        message = _record_message(record)
+        if message and message['role'] in SEARCH_INDEX_ROLES:
+            grouped[(message['username'], record['eventName'])].append(message)
+
+    adds, removes, docs = [], [], defaultdict(int)
+    ttls: Dict[str, int] = {}
+    for (username, event_name), messages in grouped.items():
+        user = data_access.get_user(username)
+        if not user or user.get('deletion'):
+            # The account and its index are being deleted; the data key is already gone
+            continue
+        try:
+            postings = _user_postings(username, messages)
+        except LookupError as e:
+            print(f"Skipping {len(messages)} messages of user {username}: {str(e)}")
+            continue
+        if event_name == 'INSERT':
+            # Expired messages carry past TTLs; the stats item must outlive the newest message
+            ttls[username] = max([ttls.get(username, 0)] + [m['ttl'] for m in messages])
+        for term, found in postings.items():
+            refs = [data_access.posting_ref(m['sessionId'], m['timestamp']) for m in found]
+            if event_name == 'INSERT':
+                adds.append((data_access.add_postings, (username, term, refs, max(m['ttl'] for m in found))))
+            else:
+                removes.append((data_access.remove_postings, (username, term, refs)))
+        docs[username] += len(messages) if event_name == 'INSERT' else -len(messages)
+
+    # Adds before removes: a message inserted and expired within one batch ends up absent
+    with ThreadPoolExecutor(max_workers=max(1, SEARCH_INDEX_CONCURRENCY)) as executor:
+        for calls in (adds, removes):
+            for future in [executor.submit(fn, *args) for fn, args in calls]:
+                future.result()
+    for username, delta in docs.items():
+        if delta:
+            data_access.add_search_docs(username, delta, ttls.get(username))
+
+    return {'added': len(adds), 'removed': len(removes)}
+
+
+def indexer_handler(event, context):
+    """Stream consumer keeping SearchIndex in step with ChatHistory inserts and TTL expiry.
+
+    A failed batch raises so Lambda retries it (bisecting on repeated errors).
+    """
+    start = time.perf_counter()
+    try:
+        counts = index_records(event.get('Records', []))
+        metrics.incr('SearchPostingsAdded', counts['added'])
+        metrics.incr('SearchPostingsRemoved', counts['removed'])
+        metrics.timing('SearchIndexBatchLatency', (time.perf_counter() - start) * 1000)
+        return counts
+    finally:
+        metrics.flush()
+
+
+# Query side: GET /search
+
+def _load_messages(username: str, refs: List[str], deadline: Deadline) -> List[Dict]:
+    """Decrypted messages of the user for posting refs; expired or deleted ones are absent.
+
+    Refs name the message row, so one BatchGetItem fetches them all; only bare timestamps from
+    older posting lists need a UserIndex query each.
+    """
+    keys = [data_access.posting_key(ref) for ref in refs]
+    legacy = [int(ref) for ref, key in zip(refs, keys) if key is None]
+    keys = [key for key in keys if key is not None]
+    if legacy:
+        key_lists = deadline.run_all([(data_access.message_keys_at, (username, ts)) for ts in legacy],
+                                     cap=SEARCH_BUDGET_SECONDS)
+        keys.extend(key for found in key_lists for key in found)
+    items = data_access.batch_get_messages(keys) if keys else []
+    # Another user's row under a colliding key is not theirs to see
+    items = [item for item in items if item.get('username') == username]
+    contents = encryption.decrypt_many(username, [
+        (item['content'], encryption.message_aad(item['sessionId'], item['timestamp'])) for item in items
+    ])
+    return [{**item, 'content': decode_content(content)} for item, content in zip(items, contents)
+            if content is not None]
+
+
+def _ref_timestamp(ref: str) -> int:
+    return int(ref.rpartition('#')[2])
+
+
+def _bm25(tokens: List[str], idf: Dict[str, float], length: int, avg_length: float) -> float:
+    counts = defaultdict(int)
+    for token in tokens:
+        counts[token] += 1
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / max(avg_length, 1.0))
+    return sum(weight * counts[t] * (BM25_K1 + 1) / (counts[t] + norm) for t, weight in idf.items() if counts[t])
+
+
+def search(username: str, query: str, limit: int, deadline: Deadline) -> Dict:
+    """The user's messages best matching query, with snippets.
+
+    Candidates are ranked by the summed IDF of the query tokens they contain (from the
+    posting lists alone), then the best SEARCH_RERANK_CANDIDATES are fetched and rescored
+    with BM25 on their text; ties go to the newest. Postings of messages that expired or
+    were deleted since are dropped when the rows are fetched.
+    """
+    start = time.perf_counter()
+    tokens = tokenize(query)[:SEARCH_MAX_QUERY_TERMS]
+    if not tokens:
+        return {'results': [], 'total': 0}
+
+    hashed = encryption.blind_tokens(username, tokens)
+    lookups = deadline.run_all(
+        [(data_access.query_postings, (username, h)) for h in hashed] + [(data_access.get_search_docs, (username,))],
+        cap=SEARCH_BUDGET_SECONDS,
+    )
+    docs = lookups.pop()
+    idf: Dict[str, float] = {}
+    scores: Dict[str, float] = defaultdict(float)
+    for token, refs in zip(tokens, lookups):
+        refs = set(refs)
+        if refs:
+            idf[token] = math.log(1 + max(docs, len(refs)) / len(refs))
+            for ref in refs:
+                scores[ref] += idf[token]
+    ranked = sorted(scores, key=lambda ref: (scores[ref], _ref_timestamp(ref)), reverse=True)
+
+    # Fetch in rank order until enough live messages are found; stale postings are skipped
+    pool = max(limit, SEARCH_RERANK_CANDIDATES)
+    messages = []
+    for offset in range(0, min(len(ranked), pool * 3), pool):
+        if not deadline.has(0.5):
+            break
+        messages.extend(_load_messages(username, ranked[offset:offset + pool], deadline))
+        if len(messages) >= limit:
+            break
+
+    texts = [[token for token, _, _ in _words(m['content'])] for m in messages]
+    avg_length = sum(map(len, texts)) / len(texts) if texts else 0.0
+    results = [
+        {
+            'sessionId': message['sessionId'],
+            'timestamp': message['timestamp'],
+            'role': message['role'],
+            'snippet': snippet(message['content'], set(idf)),
+            'score': round(_bm25(words, idf, len(words), avg_length), 3),
+        }
+        for message, words in zip(messages, texts)
+    ]
+    results.sort(key=lambda r: (r['score'], r['timestamp']), reverse=True)
+
+    metrics.timing('SearchLatency', (time.perf_counter() - start) * 1000)
+    return {'results': results[:limit], 'total': len(ranked)}
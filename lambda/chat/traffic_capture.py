@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+# 'on' records the shape of every API request for scripts/replay_traffic.py: route, sizes,
+# turn counts, LLM token counts and latencies, DynamoDB call latencies. Never any content.
+TRAFFIC_CAPTURE = os.environ.get('TRAFFIC_CAPTURE', 'off').lower() == 'on'
+
+# Fraction of users captured; all requests of a captured user are kept so sessions replay whole
+TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.environ.get('TRAFFIC_CAPTURE_SAMPLE_RATE', '1'))
+
+# Local runs append records to this file; in Lambda they are printed to the function log
+TRAFFIC_CAPTURE_PATH = os.environ.get('TRAFFIC_CAPTURE_PATH', '')
+
+# Key for the pseudonymous user and session IDs. Without one each container picks its own,
+# so a user served by two containers shows up as two users.
+_key = (os.environ.get('TRAFFIC_CAPTURE_KEY') or os.urandom(16).hex()).encode()
+
+TRACE_VERSION = 1
+
+_lock = threading.Lock()
+_current: Optional[Dict] = None
+_cold = True
+
+
+def pseudonym(value: str) -> str:
+    return hashlib.blake2b(value.encode(), key=_key, digest_size=8).hexdigest()
+
+
+def begin(event) -> Optional[Dict]:
+    """Start the record of a request (None when capture is off); finish() emits it.
+
+    Lambda runs one request per container at a time, so the record in progress is
+    module state that note(), llm_call() and the DynamoDB hooks add to from any thread.
+    """
+    global _current, _cold
+    if not TRAFFIC_CAPTURE:
+        return None
+    body = event.get('body') or ''
+    _current = {
+        'traffic': TRACE_VERSION,
+        'at': int(time.time() * 1000),
+        'cold': _cold,
+        'requestBytes': len(body.encode('utf-8') if isinstance(body, str) else body),
+        'llm': [],
+        'dynamodb': defaultdict(list),
+        '_start': time.perf_counter(),
+    }
+    _cold = False
+    return _current
+
+
+def note(**fields):
+    """Add shape fields (sizes and counts, never content) to the request being captured"""
+    if _current is not None:
+        with _lock:
+            _current.update(fields)
+
+
+def note_user(username: str, session_id: Optional[str] = None):
+    if _current is not None:
+        note(user=pseudonym(username), **({'session': pseudonym(session_id)} if session_id else {}))
+
+
+def llm_call(task: str, result: Dict):
+    if _current is not None:
+        with _lock:
+            _current['llm'].append({
+                'task': task,
+                'provider': result.get('provider'),
+                'inputTokens': result.get('input_tokens', 0),
+                'cachedInputTokens': result.get('cached_input_tokens', 0),
+                'outputTokens': result.get('output_tokens', 0),
+                'latencyMs': round(result.get('latency_ms', 0), 1),
+            })
+
+
+def finish(capture: Optional[Dict], response: Optional[Dict]):
+    """Emit the request's record, unless its user falls outside the sample"""
+    global _current
+    if capture is None:
+        return
+    _current = None
+    user = capture.get('user')
+    sample = int(user, 16) / 2 ** 64 if user else random.random()
+    if sample >= TRAFFIC_CAPTURE_SAMPLE_RATE:
+        return
+    body = (response or {}).get('body') or ''
+    record = {k: v for k, v in capture.items() if not k.startswith('_')}
+    record.update(
+        status=(response or {}).get('statusCode', 500),
+        responseBytes=len(body.encode('utf-8') if isinstance(body, str) else body),
+        durationMs=round((time.perf_counter() - capture['_start']) * 1000, 1),
+    )
+    line = json.dumps(record, separators=(',', ':'))
+    if TRAFFIC_CAPTURE_PATH:
+        with _lock, open(TRAFFIC_CAPTURE_PATH, 'a') as f:
+            f.write(line + '\n')
+    else:
+        print(line)
+
+
+def _before_call(context, **kwargs):
+    if _current is not None:
+        context['traffic_capture'] = (_current, time.perf_counter())
+
+
+def _after_call(context, event_name, **kwargs):
+    # Also the handler of after-call-error, which has no model: the operation ends the event name
+    started = context.get('traffic_capture')
+    if started:
+        capture, start = started
+        with _lock:
+            capture['dynamodb'][event_name.rsplit('.', 1)[-1]].append(round((time.perf_counter() - start) * 1000, 1))
+
+
+def instrument(*clients):
+    """Time the DynamoDB calls of these clients (or resource Tables; None is skipped)"""
+    if not TRAFFIC_CAPTURE:
+        return
+    for client in clients:
+        if client is None:
+            continue
+        client = getattr(getattr(client, 'meta', None), 'client', client)
+        client.meta.events.register('before-call.dynamodb', _before_call)
+        client.meta.events.register('after-call.dynamodb', _after_call)
+        client.meta.events.register('after-call-error.dynamodb', _after_call)
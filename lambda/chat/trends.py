@@ -0,0 +1,281 @@
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import boto3
+
+import data_access
+import metrics
+
+TRENDS_TABLE_NAME = os.environ.get('TRENDS_TABLE_NAME', '')
+
+# Rollup rows outlive the summaries they count (DATA_RETENTION_DAYS) so trends span months
+TRENDS_RETENTION_DAYS = int(os.environ.get('TRENDS_RETENTION_DAYS', '180'))
+
+# Sentiment at or beyond these bounds counts as a positive or negative session
+MOOD_THRESHOLD = 0.25
+
+# Most periods GET /trends serves
+MAX_PERIODS = {'day': 90, 'week': 52}
+
+trends_table = boto3.resource('dynamodb').Table(TRENDS_TABLE_NAME) if TRENDS_TABLE_NAME else None
+
+_executor = ThreadPoolExecutor(max_workers=2)
+_pending: List[Future] = []
+
+# Lexicon entries are whole words, or stems when they end in '*' ('anxi*' matches anxious
+# and anxiety). Stems are only used where no common unrelated word shares them: 'happ*'
+# would match "happened", so the happy forms are listed instead. Negative entries are
+# checked first so 'hopeless' isn't read as 'hope'. scripts/check_trend_features.py checks
+# changes against labeled summaries.
+NEGATIVE = (
+    'hopeless*', 'anxi*', 'stress*', 'sad', 'sadder', 'saddest', 'sadly', 'sadness', 'depress*', 'lonel*',
+    'worr*', 'overwhelm*', 'angry', 'angrier', 'angrily', 'anger*', 'frustrat*', 'tired*', 'exhausted',
+    'exhausting', 'exhaustion', 'panic*', 'fear', 'feared', 'fearful', 'fears', 'afraid', 'hurt*', 'grief',
+    'griev*', 'struggl*', 'difficult*', 'upset*', 'guilt*', 'ashamed', 'shame*', 'cried', 'cry', 'crying',
+    'scared', 'nervous*', 'burnout', 'burned', 'burnt', 'numb', 'numbness', 'irritab*', 'irritated',
+    'conflict*', 'insomnia', 'isolat*', 'unhappy', 'miserable', 'low',
+)
+POSITIVE = (
+    'hope', 'hoped', 'hopeful*', 'hopes', 'hoping', 'calm*', 'better', 'improv*', 'happy', 'happier',
+    'happiest', 'happily', 'happiness', 'grateful', 'gratitude', 'relax*', 'proud', 'enjoy*', 'progress*',
+    'confiden*', 'relief', 'reliev*', 'motivat*', 'optimis*', 'excit*', 'peace*', 'good', 'great', 'glad',
+    'accomplish*', 'resilien*', 'contented', 'contentment', 'energi*', 'connected', 'support*', 'cope',
+    'coped', 'copes', 'coping', 'positive',
+)
+NEGATIONS = {'not', 'no', 'never', 'without', 'nor', 'hardly', 'barely'}
+
+TOPICS = {
+    'sleep': ('sleep*', 'slept', 'insomnia', 'nightmare*', 'bedtime', 'nap', 'naps', 'napping'),
+    'work': ('work', 'worked', 'working', 'works', 'workplace', 'job', 'jobs', 'boss*', 'career*', 'coworker*',
+             'colleague*', 'deadline*', 'office', 'manager*'),
+    'school': ('school*', 'class', 'classes', 'classmate*', 'exam', 'exams', 'study', 'studying', 'studies',
+               'homework', 'college*', 'universit*', 'teacher*', 'grade', 'grades'),
+    'family': ('family', 'families', 'parent*', 'mother*', 'mom', 'moms', 'father*', 'dad', 'dads', 'sibling*',
+               'brother*', 'sister*', 'child', 'children', 'childhood', 'kid', 'kids', 'son', 'sons',
+               'daughter*'),
+    'relationships': ('partner*', 'relationship*', 'boyfriend*', 'girlfriend*', 'husband*', 'wife', 'wives',
+                      'marri*', 'divorc*', 'breakup*', 'dating'),
+    'social': ('friend*', 'social*', 'lonel*', 'isolat*'),
+    'health': ('health*', 'doctor*', 'pain', 'pains', 'painful', 'illness*', 'sick*', 'medic*', 'diet', 'diets',
+               'eating', 'symptom*'),
+    'anxiety': ('anxi*', 'panic*', 'worr*', 'nervous*', 'fear', 'fears', 'fearful'),
+    'mood': ('depress*', 'sad', 'sadness', 'hopeless*', 'mood*', 'crying', 'cried', 'grief', 'griev*', 'numb',
+             'numbness'),
+    'stress': ('stress*', 'overwhelm*', 'pressure*', 'burnout'),
+    'self_care': ('exercis*', 'meditat*', 'breath*', 'walk', 'walks', 'walking', 'yoga', 'journal*',
+                  'mindful*', 'routine*', 'hobby', 'hobbies'),
+    'money': ('money', 'financ*', 'debt*', 'rent', 'bills', 'budget*', 'afford*', 'salary', 'salaries'),
+}
+
+
+def _lexicon(entries) -> Tuple[frozenset, Tuple[str, ...]]:
+    """(whole words, stems) of a lexicon"""
+    return (frozenset(e for e in entries if not e.endswith('*')),
+            tuple(e[:-1] for e in entries if e.endswith('*')))
+
+
+def _matches(word: str, lexicon: Tuple[frozenset, Tuple[str, ...]]) -> bool:
+    return word in lexicon[0] or word.startswith(lexicon[1])
+
+
+_NEGATIVE = _lexicon(NEGATIVE)
+_POSITIVE = _lexicon(POSITIVE)
+_TOPICS = {topic: _lexicon(entries) for topic, entries in TOPICS.items()}
+
+_WORD_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+
+def extract_features(text: str) -> Tuple[float, List[str]]:
+    """(sentiment from -1 to 1, topic tags) of a summary, from word lists.
+
+    Sentiment is (positive - negative) / (positive + negative) over affect words, with a
+    word's polarity flipped when a negation is among the two words before it.
+    """
+    words = _WORD_RE.findall(text.lower())
+    positive = negative = 0
+    topics = set()
+    for i, word in enumerate(words):
+        negated = any(w in NEGATIONS or w.endswith("n't") for w in words[max(0, i - 2):i])
+        if _matches(word, _NEGATIVE):
+            polarity = -1
+        elif _matches(word, _POSITIVE):
+            polarity = 1
+        else:
+            polarity = 0
+        if negated:
+            polarity = -polarity
+        positive += polarity > 0
+        negative += polarity < 0
+        for topic, lexicon in _TOPICS.items():
+            if _matches(word, lexicon):
+                topics.add(topic)
+    sentiment = (positive - negative) / (positive + negative) if positive + negative else 0.0
+    return sentiment, sorted(topics)
+
+
+def mood(sentiment: float) -> str:
+    if sentiment >= MOOD_THRESHOLD:
+        return 'positive'
+    if sentiment <= -MOOD_THRESHOLD:
+        return 'negative'
+    return 'neutral'
+
+
+def _periods(created_at: int) -> List[Tuple[str, int]]:
+    """(row key, ttl) of the day and ISO week rows a summary is counted in"""
+    day = datetime.fromtimestamp(created_at, timezone.utc).date()
+    week_start = day - timedelta(days=day.weekday())
+    year, week, _ = day.isocalendar()
+    retention = timedelta(days=TRENDS_RETENTION_DAYS)
+    return [
+        (f"D#{day.isoformat()}", _epoch(day + timedelta(days=1) + retention)),
+        (f"W#{year}-W{week:02d}", _epoch(week_start + timedelta(days=7) + retention)),
+    ]
+
+
+def _epoch(day) -> int:
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+
+def _counters(features: Dict, sign: int) -> Counter:
+    counters = Counter({
+        'sessions': sign,
+        'sentiment_milli': sign * int(round(features['sentiment'] * 1000)),
+        f"mood_{mood(features['sentiment'])}": sign,
+    })
+    for topic in features['topics']:
+        counters[f"topic_{topic}"] += sign
+    return counters
+
+
+def _deltas(old: Optional[Dict], new: Optional[Dict]) -> Dict[str, Tuple[Counter, int]]:
+    """Counter changes per rollup row for replacing a summary's features old with new"""
+    rows: Dict[str, Tuple[Counter, int]] = {}
+    for features, sign in ((old, -1), (new, 1)):
+        if features is None:
+            continue
+        for period, ttl in _periods(features['created_at']):
+            counters, row_ttl = rows.get(period, (Counter(), 0))
+            counters.update(_counters(features, sign))
+            rows[period] = (counters, max(row_ttl, ttl))
+    return {period: ({k: v for k, v in c.items() if v}, ttl) for period, (c, ttl) in rows.items()}
+
+
+def record(username: str, old_item: Optional[Dict], new_item: Dict):
+    """Queue the rollup updates for a stored summary; call wait_pending() before returning.
+
+    A session's summary is rewritten as the conversation goes on, so the features of the
+    summary it replaced are taken out again: each session is counted once, by its latest
+    summary.
+    """
+    if trends_table is None:
+        return
+    deltas = _deltas(data_access.item_to_summary_features(old_item), data_access.item_to_summary_features(new_item))
+    for period, (counters, ttl) in deltas.items():
+        if counters:
+            _pending.append(_executor.submit(_add, username, period, counters, ttl))
+
+
+def wait_pending(timeout: Optional[float] = None):
+    """Block until queued rollup updates finish so Lambda doesn't freeze them mid-flight"""
+    stop_at = time.monotonic() + timeout if timeout is not None else None
+    while _pending:
+        try:
+            remaining = max(0.0, stop_at - time.monotonic()) if stop_at is not None else None
+            _pending.pop().result(timeout=remaining)
+        except Exception as e:
+            print(f"Trend rollup update failed: {str(e)}")
+            metrics.incr('TrendUpdateErrors')
+
+
+def _add(username: str, period: str, counters: Dict[str, int], ttl: int):
+    names = {f"#c{i}": name for i, name in enumerate(counters)}
+    trends_table.update_item(
+        Key={'username': username, 'period': period},
+        UpdateExpression='ADD ' + ', '.join(f"{n} :c{n[2:]}" for n in names) + ' SET #ttl = :ttl',
+        ExpressionAttributeNames={**names, '#ttl': 'ttl'},
+        ExpressionAttributeValues={
+            **{f":c{n[2:]}": counters[name] for n, name in names.items()},
+            ':ttl': ttl,
+        },
+    )
+
+
+def get_trends(username: str, period: str = 'week', count: int = 12) -> List[Dict]:
+    """The last count days or weeks of a user's rollups, oldest first, with empty periods filled"""
+    today = datetime.now(timezone.utc).date()
+    if period == 'day':
+        keys = [f"D#{(today - timedelta(days=i)).isoformat()}" for i in range(count - 1, -1, -1)]
+    else:
+        keys = []
+        for i in range(count - 1, -1, -1):
+            year, week, _ = (today - timedelta(weeks=i)).isocalendar()
+            keys.append(f"W#{year}-W{week:02d}")
+    response = trends_table.query(
+        KeyConditionExpression='username = :username AND #period BETWEEN :first AND :last',
+        ExpressionAttributeNames={'#period': 'period'},
+        ExpressionAttributeValues={':username': username, ':first': keys[0], ':last': keys[-1]},
+    )
+    rows = {item['period']: item for item in response.get('Items', [])}
+    return [_series_point(key, rows.get(key, {})) for key in keys]
+
+
+def _series_point(key: str, item: Dict) -> Dict:
+    sessions = int(item.get('sessions', 0))
+    return {
+        'period': key[2:],
+        'sessions': sessions,
+        'sentiment': round(int(item.get('sentiment_milli', 0)) / 1000 / sessions, 3) if sessions > 0 else None,
+        'moods': {m: int(item.get(f"mood_{m}", 0)) for m in ('positive', 'neutral', 'negative')},
+        'topics': {
+            name[len('topic_'):]: int(value)
+            for name, value in item.items() if name.startswith('topic_') and int(value) > 0
+        },
+    }
+
+
+def delete_trends(username: str):
+    """Delete all of a user's rollup rows"""
+    if trends_table is None:
+        return
+    params = {
+        'KeyConditionExpression': 'username = :username',
+        'ExpressionAttributeNames': {'#period': 'period'},
+        'ExpressionAttributeValues': {':username': username},
+        'ProjectionExpression': 'username, #period',
+    }
+    # batch_writer sends 25-item batches and resends unprocessed items
+    with trends_table.batch_writer() as batch:
+        while True:
+            response = trends_table.query(**params)
+            for item in response.get('Items', []):
+                batch.delete_item(Key={'username': item['username'], 'period': item['period']})
+            if 'LastEvaluatedKey' not in response:
+                break
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def rebuild(username: str) -> int:
+    """Recompute a user's rollups from their stored summaries (after bulk rewrites); returns rows written.
+
+    Rollup updates made by chat turns while this runs can be lost, so run it off-peak.
+    """
+    if trends_table is None:
+        return 0
+    rows: Dict[str, Tuple[Counter, int]] = defaultdict(lambda: (Counter(), 0))
+    for page in data_access.iter_summary_feature_pages(username):
+        for features in page:
+            for period, (counters, ttl) in _deltas(None, features).items():
+                total, row_ttl = rows[period]
+                total.update(counters)
+                rows[period] = (total, max(row_ttl, ttl))
+    delete_trends(username)
+    with trends_table.batch_writer() as batch:
+        for period, (counters, ttl) in rows.items():
+            batch.put_item(Item={'username': username, 'period': period, **counters, 'ttl': ttl})
+    return len(rows)
@@ -0,0 +1,185 @@
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import boto3
+
+import metrics
+
+USAGE_TABLE_NAME = os.environ.get('USAGE_TABLE_NAME', '')
+USAGE_RETENTION_DAYS = int(os.environ.get('USAGE_RETENTION_DAYS', '90'))
+
+# Daily per-user token quotas (input + output); 0 disables the check
+USER_DAILY_SOFT_TOKEN_QUOTA = int(os.environ.get('USER_DAILY_SOFT_TOKEN_QUOTA', '0'))
+USER_DAILY_HARD_TOKEN_QUOTA = int(os.environ.get('USER_DAILY_HARD_TOKEN_QUOTA', '0'))
+
+COUNTER_FIELDS = ('requests', 'input_tokens', 'output_tokens', 'tokens', 'llm_ms')
+
+usage_table = boto3.resource('dynamodb').Table(USAGE_TABLE_NAME) if USAGE_TABLE_NAME else None
+
+_executor = ThreadPoolExecutor(max_workers=4)
+_pending: List[Future] = []
+
+# Latest known totals per (username, day), refreshed from every counter update
+_totals: Dict[tuple, Dict[str, int]] = {}
+
+
+class QuotaExceeded(Exception):
+    """Raised when a user has used up their daily hard quota"""
+
+    def __init__(self, retry_after: int):
+        super().__init__('Daily usage quota exceeded')
+        self.retry_after = retry_after
+
+
+def today() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+
+def prefetch_totals(username: str) -> Future:
+    """Start loading today's totals so the read overlaps other work on the request path"""
+    day = today()
+    if usage_table is None or (username, day) in _totals:
+        done = Future()
+        done.set_result(_totals.get((username, day), {}))
+        return done
+    return _executor.submit(_load_totals, username, day)
+
+
+def totals_within(future: Future, timeout: float) -> Dict[str, int]:
+    """Result of prefetch_totals, or no totals (fail open) if it is not ready in time"""
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        metrics.incr('UsagePrefetchTimeout')
+        return {}
+
+
+def check_quota(totals: Dict[str, int]) -> Optional[str]:
+    """Raise QuotaExceeded over the hard quota; return 'soft_limit' over the soft quota"""
+    used = totals.get('tokens', 0)
+    if USER_DAILY_HARD_TOKEN_QUOTA and used >= USER_DAILY_HARD_TOKEN_QUOTA:
+        metrics.incr('QuotaRejected')
+        raise QuotaExceeded(_seconds_until_midnight())
+    if USER_DAILY_SOFT_TOKEN_QUOTA and used >= USER_DAILY_SOFT_TOKEN_QUOTA:
+        metrics.incr('QuotaSoftLimit')
+        return 'soft_limit'
+    return None
+
+
+def record(username: str, requests: int = 0, input_tokens: int = 0,
+           output_tokens: int = 0, llm_ms: float = 0):
+    """Queue an atomic increment of today's counters; call wait_pending() before returning"""
+    if usage_table is None:
+        return
+    counters = {
+        'requests': requests,
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'tokens': input_tokens + output_tokens,
+        'llm_ms': int(llm_ms),
+    }
+    _pending.append(_executor.submit(_add, username, today(), counters))
+
+
+def wait_pending(timeout: Optional[float] = None):
+    """Block until queued counter updates finish so Lambda doesn't freeze them mid-flight"""
+    stop_at = time.monotonic() + timeout if timeout is not None else None
+    while _pending:
+        try:
+            remaining = max(0.0, stop_at - time.monotonic()) if stop_at is not None else None
+            _pending.pop().result(timeout=remaining)
+        except Exception as e:
+            print(f"Usage update failed: {str(e)}")
+            metrics.incr('UsageUpdateErrors')
+
+
+def get_usage(username: str, days: int = 7) -> List[Dict]:
+    """Daily usage rows for a user, newest first"""
+    since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    response = usage_table.query(
+        KeyConditionExpression='username = :username AND #day >= :since',
+        ExpressionAttributeNames={'#day': 'day'},
+        ExpressionAttributeValues={':username': username, ':since': since},
+        ScanIndexForward=False,
+    )
+    return [_row(item) for item in response.get('Items', [])]
+
+
+def get_top_users(day: str, limit: int = 20) -> List[Dict]:
+    """Heaviest users for a day by total tokens"""
+    response = usage_table.query(
+        IndexName='DayIndex',
+        KeyConditionExpression='#day = :day',
+        ExpressionAttributeNames={'#day': 'day'},
+        ExpressionAttributeValues={':day': day},
+        ScanIndexForward=False,
+        Limit=limit,
+    )
+    return [_row(item) for item in response.get('Items', [])]
+
+
+def delete_usage(username: str):
+    """Delete all of a user's daily counter rows"""
+    if usage_table is None:
+        return
+    params = {
+        'KeyConditionExpression': 'username = :username',
+        'ExpressionAttributeNames': {'#day': 'day'},
+        'ExpressionAttributeValues': {':username': username},
+        'ProjectionExpression': 'username, #day',
+    }
+    # batch_writer sends 25-item batches and resends unprocessed items
+    with usage_table.batch_writer() as batch:
+        while True:
+            response = usage_table.query(**params)
+            for item in response.get('Items', []):
+                batch.delete_item(Key={'username': item['username'], 'day': item['day']})
+            if 'LastEvaluatedKey' not in response:
+                break
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    for key in [key for key in _totals if key[0] == username]:
+        _totals.pop(key, None)
+
+
+def _load_totals(username: str, day: str) -> Dict[str, int]:
+    item = usage_table.get_item(Key={'username': username, 'day': day}).get('Item', {})
+    totals = {field: int(item.get(field, 0)) for field in COUNTER_FIELDS}
+    _totals[(username, day)] = totals
+    return totals
+
+
+def _add(username: str, day: str, counters: Dict[str, int]):
+    response = usage_table.update_item(
+        Key={'username': username, 'day': day},
+        UpdateExpression=(
+            'ADD requests :requests, input_tokens :input_tokens, output_tokens :output_tokens, '
+            'tokens :tokens, llm_ms :llm_ms SET #ttl = if_not_exists(#ttl, :ttl)'
+        ),
+        ExpressionAttributeNames={'#ttl': 'ttl'},
+        ExpressionAttributeValues={
+            **{f":{field}": value for field, value in counters.items()},
+            ':ttl': int(time.time()) + USAGE_RETENTION_DAYS * 24 * 60 * 60,
+        },
+        ReturnValues='UPDATED_NEW',
+    )
+    attributes = response.get('Attributes', {})
+    _totals[(username, day)] = {field: int(attributes.get(field, 0)) for field in COUNTER_FIELDS}
+    if len(_totals) > 10000:
+        _totals.clear()
+
+
+def _row(item: Dict) -> Dict:
+    return {
+        'username': item['username'],
+        'day': item['day'],
+        **{field: int(item.get(field, 0)) for field in COUNTER_FIELDS},
+    }
+
+
+def _seconds_until_midnight() -> int:
+    now = datetime.now(timezone.utc)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(1, int((midnight - now).total_seconds()))
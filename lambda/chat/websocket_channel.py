@@ -0,0 +1,125 @@
+import json
+import os
+import time
+from typing import Dict, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+import data_access
+import metrics
+
+# Management API endpoint override, e.g. http://localhost:8765 for scripts/local_websocket_server.py
+WEBSOCKET_CALLBACK_URL = os.environ.get('WEBSOCKET_CALLBACK_URL', '')
+
+# API Gateway closes WebSocket connections after two hours; stale rows expire by TTL
+WEBSOCKET_CONNECTION_TTL_SECONDS = int(os.environ.get('WEBSOCKET_CONNECTION_TTL_SECONDS', '7200'))
+
+# Streamed text is batched into at most one frame per interval to limit post_to_connection calls
+WEBSOCKET_DELTA_FLUSH_MS = float(os.environ.get('WEBSOCKET_DELTA_FLUSH_MS', '100'))
+
+_clients = {}
+
+# connectionId -> username for connections this container has seen
+_connection_users: Dict[str, str] = {}
+
+
+def is_websocket_event(event) -> bool:
+    context = event.get('requestContext') or {}
+    return 'connectionId' in context and 'eventType' in context
+
+
+def callback_url(event) -> str:
+    """Management API endpoint for the connection's API and stage"""
+    if WEBSOCKET_CALLBACK_URL:
+        return WEBSOCKET_CALLBACK_URL
+    context = event['requestContext']
+    return f"https://{context['domainName']}/{context['stage']}"
+
+
+def register(connection_id: str, username: str):
+    now = int(time.time())
+    data_access.put_connection(connection_id, username, now, now + WEBSOCKET_CONNECTION_TTL_SECONDS)
+    _remember(connection_id, username)
+
+
+def lookup(connection_id: str) -> Optional[str]:
+    """Username authenticated on $connect for this connection"""
+    username = _connection_users.get(connection_id)
+    if username is None:
+        username = data_access.get_connection_user(connection_id)
+        if username:
+            _remember(connection_id, username)
+    return username
+
+
+def forget(connection_id: str):
+    _connection_users.pop(connection_id, None)
+    data_access.delete_connection(connection_id)
+
+
+def send(endpoint: str, connection_id: str, frame: Dict) -> bool:
+    """Push a JSON frame to a connection; False if the client has gone away"""
+    try:
+        _client(endpoint).post_to_connection(
+            ConnectionId=connection_id,
+            Data=json.dumps(frame).encode('utf-8'),
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'GoneException':
+            raise
+        metrics.incr('WebSocketGone')
+        forget(connection_id)
+        return False
+
+
+class DeltaStream:
+    """on_delta callback that pushes streamed text to a connection in batched frames
+
+    A client that disconnects mid-answer stops the pushes but not the LLM call, so the
+    reply is still stored and shows up in the session history.
+    """
+
+    def __init__(self, endpoint: str, connection_id: str, request_id: Optional[str] = None):
+        self.endpoint = endpoint
+        self.connection_id = connection_id
+        self.request_id = request_id
+        self.gone = False
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def __call__(self, text: str):
+        self._buffer.append(text)
+        if (time.monotonic() - self._last_flush) * 1000 >= WEBSOCKET_DELTA_FLUSH_MS:
+            self.flush()
+
+    def flush(self):
+        if self._buffer and not self.gone:
+            frame = {'type': 'delta', 'requestId': self.request_id, 'text': ''.join(self._buffer)}
+            self.gone = not send(self.endpoint, self.connection_id, frame)
+            metrics.incr('WebSocketFrames')
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+
+def _client(endpoint: str):
+    if endpoint not in _clients:
+        _clients[endpoint] = boto3.client(
+            'apigatewaymanagementapi',
+            endpoint_url=endpoint,
+            config=Config(
+                tcp_keepalive=True,
+                connect_timeout=1,
+                read_timeout=3,
+                retries={'max_attempts': 2, 'mode': 'standard'},
+            ),
+        )
+    return _clients[endpoint]
+
+
+def _remember(connection_id: str, username: str):
+    if len(_connection_users) > 10000:
+        _connection_users.clear()
+    _connection_users[connection_id] = username
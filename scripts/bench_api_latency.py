@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Compare request latency of the REST API and HTTP API front doors
+Usage: python scripts/bench_api_latency.py --url <REST_URL> --url <HTTP_URL> --username U --password P [--api-key KEY]
+       python scripts/bench_api_latency.py --local
+
+Remote mode logs in once per URL, then times sequential authorized GET /summaries calls
+(API Gateway + cached authorizer + chat function + one DynamoDB query) and reports
+p50/p95/p99. Deploy the stack twice (API_TYPE=rest and API_TYPE=http) to compare.
+
+Local mode replays equivalent payload 1.0 and 2.0 events through the handler on routes
+that need no AWS access, checking both formats route the same way.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(label: str, latencies_ms):
+    print(f"{label:<60} n={len(latencies_ms):4d}  p50 {percentile(latencies_ms, 50):8.3f} ms  "
+          f"p95 {percentile(latencies_ms, 95):8.3f} ms  p99 {percentile(latencies_ms, 99):8.3f} ms")
+
+
+def bench_remote(api_url: str, api_key: str, username: str, password: str, count: int, warmup: int):
+    api_url = api_url.rstrip('/') + '/'
+    session = requests.Session()
+    session.headers['Content-Type'] = 'application/json'
+    if api_key:
+        session.headers['x-api-key'] = api_key
+
+    response = session.post(f"{api_url}auth/login", json={'username': username, 'password': password}, timeout=10)
+    response.raise_for_status()
+    session.headers['Authorization'] = f"Bearer {response.json()['token']}"
+
+    latencies, errors = [], 0
+    for i in range(warmup + count):
+        start = time.perf_counter()
+        response = session.get(f"{api_url}summaries", timeout=10)
+        elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code != 200:
+            errors += 1
+        elif i >= warmup:
+            latencies.append(elapsed)
+
+    if latencies:
+        report(api_url, latencies)
+    if errors:
+        print(f"  {errors} non-200 responses")
+
+
+def local_events():
+    """Pairs of equivalent (payload 1.0, payload 2.0) events"""
+    def v1(method, path, body=None, headers=None):
+        return {'httpMethod': method, 'path': path, 'headers': headers or {}, 'body': body,
+                'requestContext': {'stage': 'prod'}}
+
+    def v2(method, path, body=None, headers=None):
+        return {'version': '2.0', 'rawPath': f"/prod{path}", 'headers': headers or {}, 'body': body,
+                'requestContext': {'stage': 'prod', 'http': {'method': method, 'path': f"/prod{path}"}}}
+
+    cases = [
+        ('GET', '/unknown', None, None),
+        ('GET', '/summaries', None, None),
+        ('POST', '/chat', json.dumps({'sessionId': 'bench'}), {'authorization': 'Bearer x'}),
+        ('POST', '/auth/login', json.dumps({'username': ''}), None),
+    ]
+    return [(v1(*case), v2(*case)) for case in cases]
+
+
+def bench_local(count: int):
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'chat'))
+    os.environ.setdefault('CHAT_TABLE_NAME', 'ChatHistory')
+    os.environ.setdefault('USERS_TABLE_NAME', 'Users')
+    os.environ.setdefault('SUMMARIES_TABLE_NAME', 'ChatSummaries')
+    os.environ.setdefault('PII_PLACEHOLDER_KEY', 'bench')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    import index
+
+    pairs = local_events()
+    for rest_event, http_event in pairs:
+        rest_status = index.handler(rest_event, None)['statusCode']
+        http_status = index.handler(http_event, None)['statusCode']
+        route = f"{rest_event['httpMethod']} {rest_event['path']}"
+        flag = 'ok' if rest_status == http_status else 'MISMATCH'
+        print(f"{route:<24} payload 1.0 -> {rest_status}  payload 2.0 -> {http_status}  {flag}")
+
+    for label, events in (('payload 1.0', [p[0] for p in pairs]), ('payload 2.0', [p[1] for p in pairs])):
+        latencies = []
+        for _ in range(count):
+            for event in events:
+                start = time.perf_counter()
+                index.handler(event, None)
+                latencies.append((time.perf_counter() - start) * 1000)
+        report(f"handler overhead, {label}", latencies)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', action='append', default=[], help='API URL (repeat to compare)')
+    parser.add_argument('--api-key', default='', help='x-api-key for the REST API (ignored by HTTP APIs)')
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--local', action='store_true', help='replay events through the handler instead')
+    args = parser.parse_args()
+
+    if args.local:
+        bench_local(args.requests)
+    elif args.url and args.username and args.password:
+        for url in args.url:
+            bench_remote(url, args.api_key, args.username, args.password, args.requests, args.warmup)
+    else:
+        parser.error('either --local or --url with --username and --password is required')
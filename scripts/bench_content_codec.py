@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Benchmark at-rest compression of ChatHistory content
+Usage: python scripts/bench_content_codec.py [--codec zlib|zstd|off] [--dictionary PATH]
+       python scripts/bench_content_codec.py --train-dictionary PATH
+
+Generates realistic synthetic transcripts and reports DynamoDB item sizes, write/read
+capacity units per turn and per 20-message history read, and encode/decode latency.
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'chat'))
+
+USER_OPENERS = [
+    "I've been feeling really anxious lately",
+    "I couldn't sleep again last night",
+    "Work has been overwhelming this week",
+    "I had an argument with my partner",
+    "I'm trying to build a better morning routine",
+    "I keep overthinking everything I say",
+    "My manager gave me some hard feedback today",
+    "I feel lonely since I moved to a new city",
+]
+
+USER_DETAILS = [
+    "and I don't know how to handle it.",
+    "and it keeps replaying in my head.",
+    "and I think it's affecting my health.",
+    "even though I tried the breathing exercise you suggested.",
+    "and I'm not sure who to talk to about it.",
+]
+
+ASSISTANT_SENTENCES = [
+    "It sounds like you're carrying a lot right now, and it makes sense that you feel this way.",
+    "Thank you for sharing that with me; it takes courage to talk about how you're feeling.",
+    "One thing that can help is noticing the thought without judging it, and gently naming it.",
+    "Have you been able to get some rest, even short breaks during the day?",
+    "A simple grounding exercise is to name five things you can see and four things you can hear.",
+    "It might help to write down what's on your mind before bed so your thoughts have somewhere to go.",
+    "Setting a consistent wake-up time can make a real difference to sleep quality over a few weeks.",
+    "Would it feel manageable to reach out to a friend or family member you trust this week?",
+    "Remember that progress isn't linear, and small steps still count.",
+    "If these feelings become overwhelming, please consider talking to a licensed mental health professional.",
+    "What do you think has been the hardest part of this for you?",
+    "You mentioned earlier that mornings are difficult; how have they been going since we last talked?",
+]
+
+
+def generate_transcript(rng: random.Random, turns: int):
+    """Alternating user/assistant messages with realistic lengths"""
+    messages = []
+    for _ in range(turns):
+        user = f"{rng.choice(USER_OPENERS)} {rng.choice(USER_DETAILS)}"
+        if rng.random() < 0.4:
+            user += f" {rng.choice(USER_OPENERS).lower()} {rng.choice(USER_DETAILS)}"
+        messages.append(('user', user))
+        sentences = rng.randint(4, 22)  # up to roughly 1024 tokens
+        messages.append(('assistant', ' '.join(rng.choice(ASSISTANT_SENTENCES) for _ in range(sentences))))
+    return messages
+
+
+def item_size(content) -> int:
+    """Approximate DynamoDB item size for a ChatHistory row"""
+    value_size = len(content) if isinstance(content, bytes) else len(content.encode('utf-8'))
+    return (
+        len('sessionId') + 36
+        + len('timestamp') + 8
+        + len('role') + 9
+        + len('content') + value_size
+        + len('ttl') + 6
+        + len('username') + 12
+    )
+
+
+def train_dictionary(path: str, samples: int = 400):
+    """Build a zlib preset dictionary from frequent phrases in generated transcripts"""
+    rng = random.Random(7)
+    phrases = Counter()
+    for _ in range(samples):
+        for _, text in generate_transcript(rng, 5):
+            words = text.split()
+            for n in (4, 8):
+                for i in range(0, max(0, len(words) - n + 1)):
+                    phrases[' '.join(words[i:i + n])] += 1
+
+    # zlib favours matches near the end of the dictionary, so put the most common last
+    chosen, size = [], 0
+    for phrase, _ in phrases.most_common():
+        encoded = (phrase + ' ').encode('utf-8')
+        if size + len(encoded) > 32 * 1024:
+            break
+        chosen.append(encoded)
+        size += len(encoded)
+    with open(path, 'wb') as f:
+        f.write(b''.join(reversed(chosen)))
+    print(f"Wrote {size} byte dictionary to {path}")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_benchmark(sessions: int, turns: int):
+    from codec import encode_content, decode_content, CONTENT_COMPRESSION
+
+    rng = random.Random(42)
+    raw_sizes, enc_sizes, enc_us, dec_us = [], [], [], []
+    raw_wcu = enc_wcu = 0
+    raw_rcu = enc_rcu = 0.0
+
+    for _ in range(sessions):
+        transcript = generate_transcript(rng, turns)
+        raw_items, encoded_items = [], []
+        for _, text in transcript:
+            start = time.perf_counter()
+            encoded = encode_content(text)
+            enc_us.append((time.perf_counter() - start) * 1e6)
+
+            start = time.perf_counter()
+            assert decode_content(encoded) == text
+            dec_us.append((time.perf_counter() - start) * 1e6)
+
+            raw_sizes.append(item_size(text))
+            enc_sizes.append(item_size(encoded))
+            raw_wcu += math.ceil(raw_sizes[-1] / 1024)
+            enc_wcu += math.ceil(enc_sizes[-1] / 1024)
+            raw_items.append(raw_sizes[-1])
+            encoded_items.append(enc_sizes[-1])
+
+        # Every turn reads the latest 20 items (eventually consistent: 0.5 RCU per 4 KB)
+        for end in range(2, len(transcript) + 1, 2):
+            window_raw = raw_items[max(0, end - 20):end]
+            window_enc = encoded_items[max(0, end - 20):end]
+            raw_rcu += math.ceil(sum(window_raw) / 4096) * 0.5
+            enc_rcu += math.ceil(sum(window_enc) / 4096) * 0.5
+
+    messages = len(raw_sizes)
+    print(f"Codec: {CONTENT_COMPRESSION}  sessions={sessions} turns={turns} messages={messages}")
+    print(f"Avg item size:        raw {sum(raw_sizes) / messages:8.0f} B   encoded {sum(enc_sizes) / messages:8.0f} B")
+    print(f"Max item size:        raw {max(raw_sizes):8d} B   encoded {max(enc_sizes):8d} B")
+    print(f"WCU for all writes:   raw {raw_wcu:8d}     encoded {enc_wcu:8d}     "
+          f"({100 * (1 - enc_wcu / raw_wcu):.1f}% saved)")
+    print(f"RCU for history reads: raw {raw_rcu:7.1f}     encoded {enc_rcu:7.1f}     "
+          f"({100 * (1 - enc_rcu / raw_rcu):.1f}% saved)")
+    print(f"Encode latency:       p50 {percentile(enc_us, 50):6.1f} us  p95 {percentile(enc_us, 95):6.1f} us")
+    print(f"Decode latency:       p50 {percentile(dec_us, 50):6.1f} us  p95 {percentile(dec_us, 95):6.1f} us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--codec', default='zlib', choices=['zlib', 'zstd', 'off'])
+    parser.add_argument('--dictionary', help='zlib preset dictionary to benchmark with')
+    parser.add_argument('--train-dictionary', metavar='PATH', help='write a trained dictionary and exit')
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--turns', type=int, default=15)
+    args = parser.parse_args()
+
+    if args.train_dictionary:
+        train_dictionary(args.train_dictionary)
+        sys.exit(0)
+
+    # codec reads its settings at import time
+    os.environ['CONTENT_COMPRESSION'] = args.codec
+    if args.dictionary:
+        os.environ['CONTENT_DICTIONARY_PATH'] = args.dictionary
+
+    run_benchmark(args.sessions, args.turns)
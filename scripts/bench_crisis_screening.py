@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Accuracy and throughput of the crisis-language screen
+Usage: python scripts/bench_crisis_screening.py [--corpus PATH] [--iterations N]
+       python scripts/bench_crisis_screening.py --train-classifier OUT.json [--epochs N]
+
+Runs lambda/chat/screening.py over a labeled JSONL corpus ({"text": ..., "label":
+"high" | "elevated" | "none"}, default scripts/crisis_screening_corpus.jsonl) and reports
+per-level precision/recall, then times screen() per message on short and long inputs.
+The long input is a 4000-character message that matches nothing, the slowest case: it
+measures about 0.6 ms p50 and 1 ms p99 on a laptop (up to ~2 ms p99 on slower hosts),
+against ~10 us for corpus-sized messages.
+
+--train-classifier fits the optional bag-of-words classifier (logistic regression on
+unigrams and bigrams) to the corpus and writes it in the format CRISIS_CLASSIFIER_PATH
+loads. Set CRISIS_CLASSIFIER_PATH before running to include a classifier in the report.
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'chat'))
+
+import screening
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), 'crisis_screening_corpus.jsonl')
+LEVELS = [screening.HIGH, screening.ELEVATED, screening.NONE]
+
+
+def load_corpus(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report_accuracy(corpus):
+    confusion = {(expected, actual): 0 for expected in LEVELS for actual in LEVELS}
+    misses = []
+    for row in corpus:
+        actual = screening.screen(row['text']).level
+        confusion[(row['label'], actual)] += 1
+        if actual != row['label']:
+            misses.append((row['label'], actual, row['text']))
+
+    print(f"{'level':<10} {'precision':>10} {'recall':>10} {'support':>8}")
+    for level in LEVELS:
+        tp = confusion[(level, level)]
+        predicted = sum(confusion[(e, level)] for e in LEVELS)
+        support = sum(confusion[(level, a)] for a in LEVELS)
+        precision = tp / predicted if predicted else 0.0
+        recall = tp / support if support else 0.0
+        print(f"{level:<10} {precision:>10.2f} {recall:>10.2f} {support:>8}")
+
+    # The number that matters most: risky messages the screen let through unflagged
+    missed = sum(confusion[(level, screening.NONE)] for level in (screening.HIGH, screening.ELEVATED))
+    print(f"flagged messages missed entirely: {missed}")
+    for expected, actual, text in misses:
+        print(f"  expected={expected:<8} got={actual:<8} {text[:70]}")
+
+
+def report_throughput(corpus, iterations):
+    short = [row['text'] for row in corpus]
+    # A long benign message is the worst case: every pattern has to fail across all of it, so
+    # it is built only from rows the screen passes (one match would end the search early)
+    long_text = ' '.join(row['text'] for row in corpus if screening.screen(row['text']).level == screening.NONE)
+    long = [(long_text * 4)[:4000]]
+
+    for name, texts in (('corpus messages', short), ('4000-char message', long)):
+        samples = []
+        for _ in range(iterations):
+            for text in texts:
+                start = time.perf_counter()
+                screening.screen(text)
+                samples.append((time.perf_counter() - start) * 1e6)
+        total = sum(samples) / 1e6
+        print(f"{name:<18} {len(samples) / total:>12,.0f} msg/s  "
+              f"p50={percentile(samples, 50):.1f}us  p99={percentile(samples, 99):.1f}us")
+
+
+def train_classifier(corpus, out_path, epochs, rate=0.5, l2=1e-3):
+    """Fit flagged-vs-none logistic regression with plain SGD and write the weights"""
+    examples = [(screening.features(screening.normalize(row['text'])), row['label'] != screening.NONE)
+                for row in corpus]
+    weights, bias = {}, 0.0
+    for _ in range(epochs):
+        for feats, label in examples:
+            z = bias + sum(weights.get(f, 0.0) for f in feats)
+            error = 1 / (1 + math.exp(-max(-30.0, min(30.0, z)))) - label
+            bias -= rate * error
+            for f in feats:
+                w = weights.get(f, 0.0)
+                weights[f] = w - rate * (error + l2 * w)
+
+    model = {
+        'bias': round(bias, 4),
+        'weights': {f: round(w, 4) for f, w in weights.items() if abs(w) >= 0.01},
+        'threshold': 0.5,
+    }
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(model, f, indent=1, sort_keys=True)
+    print(f"Wrote {len(model['weights'])} weights to {out_path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--train-classifier', metavar='OUT', help='fit the optional classifier and exit')
+    parser.add_argument('--epochs', type=int, default=30)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if args.train_classifier:
+        train_classifier(corpus, args.train_classifier, args.epochs)
+        sys.exit(0)
+
+    classifier = screening.CRISIS_CLASSIFIER_PATH if screening._classifier else 'none'
+    print(f"{len(corpus)} labeled messages, classifier: {classifier}\n")
+    report_accuracy(corpus)
+    print()
+    report_throughput(corpus, args.iterations)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark DynamoDB item (de)serialization and response encoding
+Usage: python scripts/bench_data_access.py [--iterations N]
+
+Compares the boto3 resource layer's TypeSerializer/TypeDeserializer plus json.dumps with
+DecimalEncoder (the previous path) against the hand-written marshallers in
+lambda/chat/data_access.py plus orjson (when installed). No AWS calls are made.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'chat'))
+
+# data_access reads table names and builds a client at import time
+os.environ.setdefault('CHAT_TABLE_NAME', 'ChatHistory')
+os.environ.setdefault('USERS_TABLE_NAME', 'Users')
+os.environ.setdefault('SUMMARIES_TABLE_NAME', 'ChatSummaries')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+import data_access
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class DecimalEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return int(obj) if obj % 1 == 0 else float(obj)
+        return super().default(obj)
+
+
+def sample_history(count: int = 20):
+    """A query page of ChatHistory items in wire format"""
+    now = int(time.time() * 1000)
+    return [
+        data_access.message_to_item(
+            'a3f1c2d4-5b6e-4f70-8a9b-0c1d2e3f4a5b',
+            now + i,
+            'user' if i % 2 == 0 else 'assistant',
+            ("I've been having trouble sleeping and it is affecting my work. " * (1 if i % 2 == 0 else 8)).strip(),
+            int(time.time()) + 30 * 86400,
+            'alice',
+        )
+        for i in range(count)
+    ]
+
+
+def bench(label: str, fn, iterations: int):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    per_call_us = (time.perf_counter() - start) / iterations * 1e6
+    print(f"{label:<48} {per_call_us:9.1f} us/op")
+    return per_call_us
+
+
+def main(iterations: int):
+    wire_items = sample_history()
+    deserializer = TypeDeserializer()
+    serializer = TypeSerializer()
+
+    def resource_read():
+        items = [{k: deserializer.deserialize(v) for k, v in item.items()} for item in wire_items]
+        return [{'role': i['role'], 'content': i['content'], 'timestamp': i['timestamp']} for i in items]
+
+    def client_read():
+        return [data_access.item_to_message(item) for item in wire_items]
+
+    plain_items = resource_read()
+
+    def resource_write():
+        return [{k: serializer.serialize(v) for k, v in item.items()} for item in plain_items]
+
+    def client_write():
+        return [
+            data_access.message_to_item('a3f1c2d4', i['timestamp'], i['role'], i['content'], 0, 'alice')
+            for i in plain_items
+        ]
+
+    summaries = [
+        {'sessionId': f"session-{i}", 'summary': 'Talked about sleep and stress at work. ' * 3,
+         'created_at': Decimal(1760000000 + i)}
+        for i in range(50)
+    ]
+    summaries_int = [dict(s, created_at=int(s['created_at'])) for s in summaries]
+
+    print(f"Iterations: {iterations}")
+    old_read = bench('history read: resource deserializer (20 items)', resource_read, iterations)
+    new_read = bench('history read: hand-written marshaller', client_read, iterations)
+    old_write = bench('message write: resource serializer (20 items)', resource_write, iterations)
+    new_write = bench('message write: hand-written marshaller', client_write, iterations)
+    old_json = bench('summaries response: json + DecimalEncoder', lambda: json.dumps({'summaries': summaries}, cls=DecimalEncoder), iterations)
+    new_json = bench('summaries response: json (ints, no Decimal)', lambda: json.dumps({'summaries': summaries_int}), iterations)
+    if orjson is not None:
+        new_json = bench('summaries response: orjson', lambda: orjson.dumps({'summaries': summaries_int}).decode(), iterations)
+    else:
+        print('orjson not installed; skipping orjson path')
+
+    print()
+    print(f"Read speedup:     {old_read / new_read:5.1f}x")
+    print(f"Write speedup:    {old_write / new_write:5.1f}x")
+    print(f"Encode speedup:   {old_json / new_json:5.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=5000)
+    main(parser.parse_args().iterations)
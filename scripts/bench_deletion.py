@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Wall time of DELETE /me for a heavy user
+Usage: python scripts/bench_deletion.py [--sessions N] [--messages N] [--latency-ms MS] [--unprocessed P]
+
+Runs lambda/chat/data_deletion.py against an in-memory stand-in for the DynamoDB calls it
+makes: every call sleeps --latency-ms, and BatchWriteItem leaves a fraction --unprocessed
+of each batch unprocessed, as a throttled table does. Compares DELETE_CONCURRENCY=1 with
+the configured concurrency. No AWS calls are made.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'chat'))
+
+# data_deletion and data_access read settings at import time
+os.environ.setdefault('CHAT_TABLE_NAME', 'ChatHistory')
+os.environ.setdefault('USERS_TABLE_NAME', 'Users')
+os.environ.setdefault('SUMMARIES_TABLE_NAME', 'ChatSummaries')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import data_access
+import data_deletion
+from deadline import Deadline
+
+
+class FakeTables:
+    """The rows data_deletion reads and deletes, keyed by (table, key values)"""
+
+    def __init__(self, sessions, messages, latency, unprocessed):
+        self.latency = latency
+        self.unprocessed = unprocessed
+        self.rng = random.Random(7)
+        self.calls = 0
+        self.rows = {(data_access.CHAT_TABLE_NAME, f"s{s}", str(m)) for s in range(sessions) for m in range(messages)}
+        self.rows |= {(data_access.SUMMARIES_TABLE_NAME, 'bench', f"s{s}") for s in range(0, sessions, 4)}
+
+    def key_pages(self, username):
+        # A keys-only index page holds ~1 MB of keys
+        keys = sorted((k[1], int(k[2])) for k in self.rows if k[0] == data_access.CHAT_TABLE_NAME)
+        for i in range(0, len(keys), 8000):
+            time.sleep(self.latency)
+            yield [{'sessionId': s, 'timestamp': t} for s, t in keys[i:i + 8000]]
+
+    def summary_pages(self, username):
+        time.sleep(self.latency)
+        yield [{'sessionId': k[2]} for k in self.rows if k[0] == data_access.SUMMARIES_TABLE_NAME]
+
+    def session_pages(self, session_id, page_size=200):
+        time.sleep(self.latency)
+        yield []
+
+    def batch_write_item(self, RequestItems):
+        time.sleep(self.latency)
+        self.calls += 1
+        (table, requests), = RequestItems.items()
+        kept = [r for r in requests if self.rng.random() < self.unprocessed]
+        for request in requests:
+            if request not in kept:
+                key = request['DeleteRequest']['Key']
+                self.rows.discard((table, *(v.get('S') or v.get('N') for v in key.values())))
+        return {'UnprocessedItems': {table: kept} if kept else {}}
+
+
+def run(args, concurrency):
+    tables = FakeTables(args.sessions, args.messages, args.latency_ms / 1000, args.unprocessed)
+    data_access.iter_user_message_key_pages = tables.key_pages
+    data_access.iter_summary_pages = tables.summary_pages
+    data_access.iter_session_message_pages = tables.session_pages
+    data_access.dynamodb = tables
+    data_access.record_deletion_progress = lambda *a: time.sleep(tables.latency)
+    data_access.delete_user = lambda username: None
+    data_deletion.usage.delete_usage = lambda username: None
+    data_deletion.trends.delete_trends = lambda username: None
+    data_deletion.idempotency.delete_records = lambda username: None
+    data_deletion.DELETE_CONCURRENCY = concurrency
+
+    start = time.perf_counter()
+    deleted = data_deletion.delete_user_data('bench', Deadline(600000))
+    elapsed = time.perf_counter() - start
+    assert not tables.rows, f"{len(tables.rows)} rows left"
+    return deleted, tables.calls, elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=300)
+    parser.add_argument('--messages', type=int, default=60, help='messages per session')
+    parser.add_argument('--latency-ms', type=float, default=10, help='simulated DynamoDB call latency')
+    parser.add_argument('--unprocessed', type=float, default=0.05, help='fraction of each batch left unprocessed')
+    parser.add_argument('--concurrency', type=int, default=data_deletion.DELETE_CONCURRENCY)
+    args = parser.parse_args()
+
+    for concurrency in sorted({1, args.concurrency}):
+        deleted, calls, elapsed = run(args, concurrency)
+        print(f"concurrency {concurrency:>2}: {deleted} items in {calls} BatchWriteItem calls, "
+              f"{elapsed:.2f}s ({deleted / elapsed:,.0f} items/s)")
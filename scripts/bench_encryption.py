@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Cost of per-user envelope encryption on the message path
+Usage: python scripts/bench_encryption.py [--messages N] [--users N]
+
+Runs lambda/chat/encryption.py with its LocalKms stand-in and an in-memory key store in
+place of the Users table, and reports:
+  - encrypt and decrypt time per message with the data key cached
+  - decrypt_many over a 20-row history page
+  - the cold path (wrapped key fetch + KMS Decrypt + key schedule) for a new container
+  - KMS calls per message for a traffic mix over N users, showing what the cache saves
+No AWS calls are made.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'chat'))
+
+# encryption and data_access read settings at import time
+os.environ['CONTENT_ENCRYPTION'] = 'local'
+os.environ.setdefault('CHAT_TABLE_NAME', 'ChatHistory')
+os.environ.setdefault('USERS_TABLE_NAME', 'Users')
+os.environ.setdefault('SUMMARIES_TABLE_NAME', 'ChatSummaries')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import data_access
+import encryption
+from codec import encode_content
+
+wrapped_keys = {}
+data_access.get_user_data_key = wrapped_keys.get
+data_access.put_user_data_key = lambda username, key: wrapped_keys.setdefault(username, key) is key
+
+
+class CountingKms(encryption.LocalKms):
+    calls = 0
+
+    def generate_data_key(self, **kwargs):
+        CountingKms.calls += 1
+        return super().generate_data_key(**kwargs)
+
+    def decrypt(self, **kwargs):
+        CountingKms.calls += 1
+        return super().decrypt(**kwargs)
+
+
+encryption._kms_client = CountingKms()
+
+MESSAGE = ("I've been feeling a bit overwhelmed at work lately, and I'd like some ideas for "
+           "winding down in the evening without looking at my phone. ") * 3
+
+
+def per_call_us(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=50)
+    args = parser.parse_args()
+
+    encoded = encode_content(MESSAGE)
+    aad = encryption.message_aad('bench-session', 1)
+    encryption.user_cipher('alice')
+    sealed = encryption.encrypt('alice', encoded, aad)
+    page = [(encryption.encrypt('alice', encoded, encryption.message_aad('bench-session', i)),
+             encryption.message_aad('bench-session', i)) for i in range(20)]
+
+    print(f"message: {len(MESSAGE)} chars, {len(encoded)} bytes encoded, {len(sealed)} bytes sealed")
+    print(f"encrypt, cached key       {per_call_us(lambda: encryption.encrypt('alice', encoded, aad), 5000):8.1f} us")
+    print(f"decrypt, cached key       {per_call_us(lambda: encryption.decrypt_many('alice', [(sealed, aad)]), 5000):8.1f} us")
+    print(f"decrypt_many, 20-row page {per_call_us(lambda: encryption.decrypt_many('alice', page), 1000):8.1f} us")
+
+    def cold():
+        encryption.forget_user('alice')
+        encryption.user_cipher('alice')
+    print(f"cold key load (LocalKms)  {per_call_us(cold, 500):8.1f} us  (plus a KMS round trip in AWS)")
+
+    # Traffic mix: each message goes to a random user; count KMS calls with and without caching
+    encryption._keys.clear()
+    CountingKms.calls = 0
+    rng = random.Random(7)
+    for i in range(args.messages):
+        encryption.encrypt(f"user{rng.randrange(args.users)}", encoded, aad)
+    print(f"{args.messages} messages over {args.users} users: {CountingKms.calls} KMS calls "
+          f"(vs {args.messages} without the data key cache)")
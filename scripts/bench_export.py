@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Wall time and peak memory of GET /export for a heavy user
+Usage: python scripts/bench_export.py [--sessions N] [--messages N] [--latency-ms MS]
+
+Runs lambda/chat/data_export.py against an in-memory stand-in for the DynamoDB queries it
+makes (each call sleeps --latency-ms, and pages hold 100 rows) and a null S3 upload, and
+compares EXPORT_CONCURRENCY=1 with the configured worker count. Peak memory is the Python
+heap high-water mark while the export runs. No AWS calls are made.
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'chat'))
+
+# data_export and data_access read settings at import time
+os.environ['EXPORT_BUCKET_NAME'] = 'bench-exports'
+os.environ.setdefault('CHAT_TABLE_NAME', 'ChatHistory')
+os.environ.setdefault('USERS_TABLE_NAME', 'Users')
+os.environ.setdefault('SUMMARIES_TABLE_NAME', 'ChatSummaries')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import data_access
+import data_export
+from deadline import Deadline
+
+PAGE_ROWS = 100
+MESSAGE = "I've been trying the breathing exercise before bed and it helps a little. " * 4
+
+
+class NullS3:
+    """Accepts the multipart upload and keeps only its size"""
+    uploaded = 0
+
+    def create_multipart_upload(self, **kwargs):
+        return {'UploadId': 'bench'}
+
+    def upload_part(self, Body, PartNumber, **kwargs):
+        NullS3.uploaded += len(Body)
+        return {'ETag': str(PartNumber)}
+
+    def complete_multipart_upload(self, **kwargs):
+        pass
+
+    def abort_multipart_upload(self, **kwargs):
+        pass
+
+    def generate_presigned_url(self, *args, **kwargs):
+        return 'https://example.invalid/export'
+
+
+def install_fake_tables(sessions, messages, latency):
+    def pages(rows):
+        for i in range(0, len(rows), PAGE_ROWS):
+            time.sleep(latency)
+            yield rows[i:i + PAGE_ROWS]
+        if not rows:
+            time.sleep(latency)
+            yield []
+
+    def key_pages(username):
+        # A keys-only index page holds far more than 100 rows; ~1 MB of keys
+        keys = [{'sessionId': f"s{s}", 'timestamp': m} for s in range(sessions) for m in range(messages)]
+        for i in range(0, len(keys), 8000):
+            time.sleep(latency)
+            yield keys[i:i + 8000]
+
+    def session_pages(session_id, page_size=200):
+        return pages([{'sessionId': session_id, 'timestamp': m, 'role': 'user',
+                       'content': MESSAGE, 'username': 'bench'} for m in range(messages)])
+
+    data_access.iter_user_message_key_pages = key_pages
+    data_access.iter_session_message_pages = session_pages
+    data_access.iter_summary_pages = lambda username: pages([
+        {'sessionId': f"s{s}", 'summary': 'A short summary of the session.', 'timestamp': 0}
+        for s in range(0, sessions, 4)
+    ])
+
+
+def run(concurrency):
+    data_export.EXPORT_CONCURRENCY = concurrency
+    NullS3.uploaded = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    sink = data_export.ExportSink(data_export.export_key('bench'))
+    counts = data_export.export_user('bench', sink, Deadline(600000))
+    sink.finish()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return counts, sink.bytes_written, elapsed, peak
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=300)
+    parser.add_argument('--messages', type=int, default=60, help='messages per session')
+    parser.add_argument('--latency-ms', type=float, default=8, help='simulated DynamoDB query latency')
+    parser.add_argument('--concurrency', type=int, default=data_export.EXPORT_CONCURRENCY)
+    args = parser.parse_args()
+
+    install_fake_tables(args.sessions, args.messages, args.latency_ms / 1000)
+    data_export._s3 = NullS3()
+
+    for concurrency in sorted({1, args.concurrency}):
+        counts, raw, elapsed, peak = run(concurrency)
+        print(f"concurrency {concurrency:>2}: {counts['messages']} messages in {counts['sessions']} sessions, "
+              f"{raw / 1e6:.1f} MB NDJSON -> {NullS3.uploaded / 1e6:.1f} MB gzip, "
+              f"{elapsed:.2f}s, peak heap {peak / 1e6:.1f} MB")
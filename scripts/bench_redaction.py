@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Throughput and latency budget of the PII redaction stage
+Usage: python scripts/bench_redaction.py [--megabytes N] [--budget-ms MS]
+
+Measures lambda/chat/redaction.py in MB/s on typical chat text (no PII), PII-dense text,
+redaction of a stream arriving in small LLM-token-sized chunks, and placeholder restore.
+Then times redact() on 4000-character messages and exits non-zero if the p99 exceeds
+--budget-ms (default 1 ms), so it can gate a change to the patterns.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'chat'))
+
+# redaction reads its key at import time
+os.environ.setdefault('PII_PLACEHOLDER_KEY', 'bench')
+
+import redaction
+
+CLEAN_SENTENCES = [
+    "I had a long day and I keep thinking about the conversation with my sister.",
+    "Work has been stressful since the reorganization, but the team is supportive.",
+    "Yesterday I went for a walk by the river and it helped me feel calmer.",
+    "I want to build a better routine around sleep and journaling this month.",
+    "Sometimes I feel like I am behind everyone else, even when I know that's not true.",
+    "We talked for 20 minutes and I felt a bit better after 3 deep breaths.",
+]
+PII_SENTENCES = [
+    "You can reach me at jamie.rivera@example.org or on (512) 555-0142 after 6.",
+    "My old number was +1 737 555 0199 and my work email is j.rivera@corp.example.com.",
+    "The form asked for 078-05-1120 and the card ending 4242 4242 4242 4242.",
+    "The router at 192.168.1.20 kept dropping, so I called 512.555.0177.",
+]
+
+
+def build_text(sentences, size):
+    rng = random.Random(7)
+    parts, length = [], 0
+    while length < size:
+        sentence = rng.choice(sentences)
+        parts.append(sentence)
+        length += len(sentence) + 1
+    return ' '.join(parts)[:size]
+
+
+def megabytes_per_second(fn, text, megabytes):
+    size = len(text.encode('utf-8'))
+    rounds = max(1, int(megabytes * 1024 * 1024 / size))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(text)
+    return rounds * size / (time.perf_counter() - start) / (1024 * 1024)
+
+
+def stream_through(vault, text, chunk_size=12):
+    out = []
+    scanner = vault.redacting_stream(out.append)
+    for i in range(0, len(text), chunk_size):
+        scanner.feed(text[i:i + chunk_size])
+    scanner.flush()
+    return ''.join(out)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megabytes', type=float, default=8, help='data per throughput case')
+    parser.add_argument('--budget-ms', type=float, default=1.0, help='p99 budget for a 4000-char message')
+    parser.add_argument('--samples', type=int, default=2000)
+    args = parser.parse_args()
+
+    vault = redaction.vault('bench-session')
+    clean = build_text(CLEAN_SENTENCES, 64 * 1024)
+    mixed = build_text(CLEAN_SENTENCES + PII_SENTENCES, 64 * 1024)
+    redacted = vault.redact(mixed)
+    assert stream_through(vault, mixed) == redacted, 'streamed redaction differs from one-shot'
+
+    print(f"entity types: {', '.join(redaction.PII_ENTITY_TYPES)}")
+    cases = [
+        ('redact, no PII', vault.redact, clean),
+        ('redact, PII-dense', vault.redact, mixed),
+        ('redact, 12-char stream', lambda t: stream_through(vault, t), mixed),
+        ('restore placeholders', vault.restore, redacted),
+    ]
+    for name, fn, text in cases:
+        print(f"{name:<24} {megabytes_per_second(fn, text, args.megabytes):>8.1f} MB/s")
+
+    worst = {}
+    for name, text in (('no PII', clean), ('PII-dense', mixed)):
+        samples = []
+        for i in range(args.samples):
+            offset = (i * 997) % (len(text) - 4000)
+            message = text[offset:offset + 4000]
+            start = time.perf_counter()
+            vault.redact(message)
+            samples.append((time.perf_counter() - start) * 1000)
+        worst[name] = percentile(samples, 99)
+        print(f"4000-char message, {name:<9} p50={percentile(samples, 50):.3f}ms  p99={worst[name]:.3f}ms")
+
+    over = {name: p99 for name, p99 in worst.items() if p99 > args.budget_ms}
+    if over:
+        print(f"FAIL: p99 over the {args.budget_ms}ms budget: {over}")
+        sys.exit(1)
+    print(f"OK: p99 within the {args.budget_ms}ms budget")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Index cost and GET /search latency as a user's history grows
+Usage: python scripts/bench_search.py [--messages N,N,...] [--latency-ms MS] [--per-day N]
+
+Runs lambda/chat/search.py against an in-memory stand-in for SearchIndex and ChatHistory:
+every DynamoDB call sleeps --latency-ms. Messages arrive in stream batches of 100, --per-day
+per day. Reports UpdateItem calls per indexed message, the size of the posting lists (the
+item size that UpdateItem is billed on), and search latency with the ChatHistory reads
+(BatchGetItem and UserIndex queries) per search. No AWS calls are made.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'chat'))
+
+# search and data_access read settings at import time
+os.environ.setdefault('CHAT_TABLE_NAME', 'ChatHistory')
+os.environ.setdefault('USERS_TABLE_NAME', 'Users')
+os.environ.setdefault('SUMMARIES_TABLE_NAME', 'ChatSummaries')
+os.environ.setdefault('SEARCH_TABLE_NAME', 'SearchIndex')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import data_access
+import search
+from deadline import Deadline
+
+VOCABULARY = ("sleep work anxiety family exercise breathing friends music weather cooking school "
+              "stress partner therapy walk tired morning evening weekend job money health").split()
+
+
+class FakeTables:
+    """Posting lists and messages of one user, with the calls search.py makes"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.updates = 0
+        self.postings = defaultdict(set)
+        self.docs = 0
+        self.messages = {}
+        self.reads = 0
+
+    def add_postings(self, username, term, refs, ttl):
+        time.sleep(self.latency)
+        self.updates += 1
+        self.postings[term].update(refs)
+
+    def remove_postings(self, username, term, refs):
+        time.sleep(self.latency)
+        self.updates += 1
+        self.postings[term].difference_update(refs)
+
+    def add_search_docs(self, username, delta, ttl=None):
+        time.sleep(self.latency)
+        self.docs += delta
+
+    def get_search_docs(self, username):
+        time.sleep(self.latency)
+        return self.docs
+
+    def query_postings(self, username, token):
+        time.sleep(self.latency)
+        return [t for term, refs in self.postings.items() if term.startswith(f"{token}#") for t in refs]
+
+    def message_keys_at(self, username, timestamp):
+        time.sleep(self.latency)
+        self.reads += 1
+        return [data_access.message_key('bench', timestamp)] if timestamp in self.messages else []
+
+    def batch_get_messages(self, keys):
+        time.sleep(self.latency)
+        self.reads += 1
+        return [self.messages[int(k['timestamp']['N'])] for k in keys]
+
+
+def message_text(rng):
+    words = rng.sample(VOCABULARY, 4)
+    return (f"Today I kept thinking about {words[0]} and {words[1]}. "
+            f"My {words[2]} has been hard, and {words[3]} didn't help much.")
+
+
+def run(count, args, rng):
+    tables = FakeTables(args.latency_ms / 1000)
+    for name in ('add_postings', 'remove_postings', 'add_search_docs', 'get_search_docs', 'query_postings',
+                 'message_keys_at', 'batch_get_messages'):
+        setattr(data_access, name, getattr(tables, name))
+    data_access.get_user = lambda username: {'username': username}
+
+    records = []
+    for i in range(count):
+        timestamp = (i // args.per_day) * search.DAY_MS + i
+        content = message_text(rng)
+        tables.messages[timestamp] = {'sessionId': 'bench', 'timestamp': timestamp, 'role': 'user',
+                                      'content': content, 'username': 'bench'}
+        records.append({'eventName': 'INSERT', 'dynamodb': {'NewImage': {
+            'username': {'S': 'bench'}, 'sessionId': {'S': 'bench'}, 'timestamp': {'N': str(timestamp)},
+            'role': {'S': 'user'}, 'content': {'S': content}, 'ttl': {'N': '0'},
+        }}})
+
+    start = time.perf_counter()
+    for i in range(0, len(records), 100):
+        search.index_records(records[i:i + 100])
+    index_seconds = time.perf_counter() - start
+
+    # SS values are billed as their UTF-8 bytes; the key and attribute names add ~40 bytes per item
+    sizes = sorted(40 + sum(len(ref) for ref in refs) for refs in tables.postings.values())
+    latencies = []
+    reads = tables.reads
+    for query in ('trouble with sleep', 'work stress', 'money and family worries'):
+        start = time.perf_counter()
+        found = search.search('bench', query, 10, Deadline(10000, reserve_ms=0))
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert found['results'], query
+    return tables.updates, index_seconds, sizes, latencies, (tables.reads - reads) / 3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', default='1000,5000,20000', help='history sizes to compare')
+    parser.add_argument('--latency-ms', type=float, default=5, help='simulated DynamoDB call latency')
+    parser.add_argument('--per-day', type=int, default=60, help='messages per day')
+    args = parser.parse_args()
+
+    for count in [int(n) for n in args.messages.split(',')]:
+        updates, seconds, sizes, latencies, reads = run(count, args, random.Random(7))
+        print(f"{count:>6} messages: {updates / count:.2f} UpdateItem calls per message, "
+              f"posting lists median {sizes[len(sizes) // 2]} B / max {sizes[-1]} B, "
+              f"indexing {seconds:.1f}s, search {min(latencies):.0f}-{max(latencies):.0f} ms "
+              f"with {reads:.0f} message reads")
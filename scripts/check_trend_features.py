@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Check the sentiment and topic features behind GET /trends against labeled summaries
+Usage: python scripts/check_trend_features.py [--corpus PATH]
+
+Runs trends.extract_features over a labeled JSONL corpus ({"text": ..., "mood":
+"positive" | "neutral" | "negative", "topics": [...]}, default
+scripts/trend_features_corpus.jsonl), prints every mismatch and exits non-zero if there is
+one, so it can gate a change to the lexicons.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'chat'))
+
+# trends and data_access read settings at import time
+os.environ.setdefault('CHAT_TABLE_NAME', 'ChatHistory')
+os.environ.setdefault('USERS_TABLE_NAME', 'Users')
+os.environ.setdefault('SUMMARIES_TABLE_NAME', 'ChatSummaries')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import trends
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), 'trend_features_corpus.jsonl')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding='utf-8') as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    failures = 0
+    for row in corpus:
+        sentiment, topics = trends.extract_features(row['text'])
+        mood = trends.mood(sentiment)
+        if mood != row['mood'] or topics != sorted(row['topics']):
+            failures += 1
+            print(f"MISMATCH mood {mood} (expected {row['mood']}, sentiment {sentiment:.2f}), "
+                  f"topics {topics} (expected {sorted(row['topics'])}): {row['text']}")
+    print(f"{len(corpus) - failures}/{len(corpus)} summaries match")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the API Gateway WebSocket API
+Usage: python scripts/local_websocket_server.py [--port 8765] [--callback-port 8766] [--echo]
+
+Accepts clients on ws://localhost:PORT and turns the handshake, sendMessage frames and
+disconnects into the events API Gateway sends, running lambda/chat/authorizer.py and
+lambda/chat/index.py in-process. Frames the handler pushes with post_to_connection go to a
+local management API on http://localhost:CALLBACK_PORT (WEBSOCKET_CALLBACK_URL is set to
+it) and are forwarded to the client.
+
+The handler still needs its tables (point DYNAMODB_ENDPOINT_URL at DynamoDB Local), an
+LLM provider and a PII_PLACEHOLDER_KEY. With --echo, sendMessage is answered by the server itself, streaming the
+message back word by word, so a client can be exercised without any AWS access.
+
+Requires: pip install websockets
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'chat'))
+
+connections = {}  # connectionId -> client connection
+loop = None
+handlers = {}  # 'authorizer' and 'index' modules, loaded unless --echo
+
+
+class ManagementApi(BaseHTTPRequestHandler):
+    """POST /@connections/{connectionId}, as called by post_to_connection"""
+
+    def do_POST(self):
+        prefix = '/@connections/'
+        if not self.path.startswith(prefix):
+            return self._reply(HTTPStatus.NOT_FOUND, 'NotFoundException')
+
+        data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        client = connections.get(unquote(self.path[len(prefix):]))
+        if client is None:
+            return self._reply(HTTPStatus.GONE, 'GoneException')
+
+        asyncio.run_coroutine_threadsafe(client.send(data.decode('utf-8')), loop).result(timeout=5)
+        self._reply(HTTPStatus.OK)
+
+    def _reply(self, status: HTTPStatus, error_type: str = None):
+        body = json.dumps({'message': error_type}).encode() if error_type else b''
+        self.send_response(status)
+        if error_type:
+            self.send_header('x-amzn-ErrorType', error_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def lambda_event(event_type: str, route_key: str, connection_id: str, headers=None,
+                 query=None, body=None, authorizer=None):
+    context = {
+        'routeKey': route_key,
+        'eventType': event_type,
+        'connectionId': connection_id,
+        'domainName': 'localhost',
+        'stage': 'local',
+        'requestTimeEpoch': int(time.time() * 1000),
+    }
+    if authorizer:
+        context['authorizer'] = authorizer
+    return {
+        'requestContext': context,
+        'headers': headers or {},
+        'queryStringParameters': query or None,
+        'body': body,
+        'isBase64Encoded': False,
+    }
+
+
+async def invoke(event) -> dict:
+    """Run the chat handler off the event loop, as a separate Lambda invocation would"""
+    return await loop.run_in_executor(None, handlers['index'].handler, event, None)
+
+
+async def on_handshake(client, request):
+    """$connect: authorize, then let the handler register the connection"""
+    client.connection_id = uuid.uuid4().hex[:16] + '='
+    client.authorizer = None
+    if 'index' not in handlers:
+        return None
+
+    headers = dict(request.headers.raw_items())
+    query = dict(parse_qsl(urlsplit(request.path).query))
+    try:
+        policy = handlers['authorizer'].handler({
+            'type': 'REQUEST',
+            'methodArn': 'arn:aws:execute-api:local:000000000000:local/local/$connect',
+            'headers': headers,
+            'queryStringParameters': query,
+        }, None)
+    except Exception:
+        return client.respond(HTTPStatus.UNAUTHORIZED, 'Unauthorized\n')
+
+    client.authorizer = {'principalId': policy['principalId'], **policy.get('context', {})}
+    response = await invoke(lambda_event(
+        'CONNECT', '$connect', client.connection_id, headers, query, authorizer=client.authorizer
+    ))
+    if response.get('statusCode') != 200:
+        return client.respond(HTTPStatus(response.get('statusCode', 500)), 'Connection rejected\n')
+    return None
+
+
+async def echo(client, body: dict):
+    """--echo: stream the message back as delta frames, then a done frame"""
+    words = (body.get('message') or '').split(' ')
+    for i, word in enumerate(words):
+        await client.send(json.dumps({
+            'type': 'delta', 'requestId': body.get('requestId'), 'text': word if i == 0 else ' ' + word,
+        }))
+        await asyncio.sleep(0.05)
+    await client.send(json.dumps({
+        'type': 'done', 'status': 200, 'requestId': body.get('requestId'),
+        'sessionId': body.get('sessionId'), 'response': ' '.join(words),
+        'timestamp': int(time.time() * 1000),
+    }))
+
+
+async def on_client(client):
+    connections[client.connection_id] = client
+    print(f"connected {client.connection_id}")
+    try:
+        async for raw in client:
+            try:
+                body = json.loads(raw)
+            except ValueError:
+                body = {}
+            if body.get('action') != 'sendMessage':
+                # API Gateway answers unmatched routes itself when there is no $default route
+                await client.send(json.dumps({'message': 'Forbidden', 'connectionId': client.connection_id}))
+                continue
+            if 'index' not in handlers:
+                await echo(client, body)
+                continue
+            await invoke(lambda_event(
+                'MESSAGE', 'sendMessage', client.connection_id, body=raw, authorizer=client.authorizer
+            ))
+    except ConnectionClosed:
+        pass
+    finally:
+        connections.pop(client.connection_id, None)
+        if 'index' in handlers:
+            await invoke(lambda_event('DISCONNECT', '$disconnect', client.connection_id))
+        print(f"disconnected {client.connection_id}")
+
+
+async def main(port: int, callback_port: int):
+    global loop
+    loop = asyncio.get_running_loop()
+
+    management = ThreadingHTTPServer(('127.0.0.1', callback_port), ManagementApi)
+    threading.Thread(target=management.serve_forever, daemon=True).start()
+
+    async with serve(on_client, '127.0.0.1', port, process_request=on_handshake):
+        mode = 'echo' if 'index' not in handlers else 'handler'
+        print(f"WebSocket stand-in ({mode}) on ws://127.0.0.1:{port}, "
+              f"management API on http://127.0.0.1:{callback_port}")
+        await asyncio.get_running_loop().create_future()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--callback-port', type=int, default=8766)
+    parser.add_argument('--echo', action='store_true', help='answer messages locally instead of running the handler')
+    args = parser.parse_args()
+
+    if not args.echo:
+        # The handler reads these at import time
+        os.environ['WEBSOCKET_CALLBACK_URL'] = f"http://127.0.0.1:{args.callback_port}"
+        os.environ.setdefault('CONNECTIONS_TABLE_NAME', 'WebSocketConnections')
+        import authorizer
+        import index
+        handlers.update(authorizer=authorizer, index=index)
+
+    try:
+        asyncio.run(main(args.port, args.callback_port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,732 @@
+#!/usr/bin/env python3
+"""
+Capture-driven replay of API traffic against the local chat handler
+Usage:
+  python scripts/replay_traffic.py collect --log-group NAME [--hours 24] --output trace.jsonl
+  python scripts/replay_traffic.py run trace.jsonl [--speed 1] [--concurrency 32] [--report out.json]
+  python scripts/replay_traffic.py compare before.json after.json
+
+Traces come from the chat handler with TRAFFIC_CAPTURE=on (lambda/chat/traffic_capture.py):
+one JSON record per request with its route, arrival time, sizes, session turn count, LLM
+calls (tokens, latency) and DynamoDB call latencies, with pseudonymous user and session
+IDs and no content. collect pulls the records out of the function's CloudWatch log group;
+a local run with TRAFFIC_CAPTURE_PATH set writes the file directly.
+
+run replays a trace through lambda/chat/index.py handler in this process, at the captured
+arrival times divided by --speed (0: as fast as --concurrency allows). A session's
+requests run in order, each after the previous one finished. Messages and queries are
+synthetic text of the captured sizes; sessions that were already under way when capture
+started are seeded with as many stored turns as their first captured request saw.
+
+Nothing leaves the machine. LLM calls return after the captured latency with the captured
+token counts, in the order the request made them. DynamoDB calls are answered by an
+in-memory stand-in for the stack's tables, after a latency drawn (seeded by --seed) from
+the trace's latencies for the same operation. Everything else (hashing, encryption,
+redaction, serialization, thread pools) is the handler's own code, so an optimization to
+it shows up as a change in replayed latency and throughput. The report gives both per
+route; save it with --report and diff two runs with compare.
+
+Concurrent requests share this process (and its GIL), where Lambda gives each its own
+container: CPU-heavy routes such as login read slower than captured under load. Compare
+replays with each other; the captured column is for orientation.
+"""
+
+import argparse
+import base64
+import contextlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'chat'))
+
+import metrics
+
+# The handler reads its settings at import time; every table lives in ReplayTables
+REPLAY_ENV = {
+    'CHAT_TABLE_NAME': 'ChatHistory',
+    'USERS_TABLE_NAME': 'Users',
+    'SUMMARIES_TABLE_NAME': 'ChatSummaries',
+    'RATE_LIMIT_TABLE_NAME': 'RateLimits',
+    'USAGE_TABLE_NAME': 'UsageCounters',
+    'SEARCH_TABLE_NAME': 'SearchIndex',
+    'TRENDS_TABLE_NAME': 'TrendRollups',
+    'CONNECTIONS_TABLE_NAME': 'Connections',
+    # Captured traffic got past the rate limits, so the replay must too
+    'USER_RATE_LIMIT': '1000000',
+    'LLM_PROVIDER': 'local',
+    'LLM_FALLBACK_PROVIDERS': '',
+    'MEMORY_EMBEDDING_PROVIDER': 'local',
+    'PII_PLACEHOLDER_KEY': 'replay',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'replay',
+    'AWS_SECRET_ACCESS_KEY': 'replay',
+}
+
+# (partition key, sort key) per table, as in ChatbotStack
+TABLE_KEYS = {
+    'ChatHistory': ('sessionId', 'timestamp'),
+    'Users': ('username', None),
+    'ChatSummaries': ('username', 'sessionId'),
+    'RateLimits': ('bucket', None),
+    'UsageCounters': ('username', 'day'),
+    'SearchIndex': ('username', 'term'),
+    'TrendRollups': ('username', 'period'),
+    'Connections': ('connectionId', None),
+    'IdempotencyKeys': ('key', None),
+}
+# (partition key, sort key, keys only) per global secondary index
+INDEX_KEYS = {
+    ('ChatHistory', 'UserIndex'): ('username', 'timestamp', True),
+    ('UsageCounters', 'DayIndex'): ('day', 'tokens', False),
+    ('IdempotencyKeys', 'UserIndex'): ('username', None, True),
+    ('Connections', 'UserIndex'): ('username', None, True),
+}
+
+REPLAYED_ROUTES = {'POST /chat', 'GET /summaries', 'GET /search', 'GET /trends', 'GET /me',
+                   'POST /auth/login', 'POST /auth/register'}
+REPLAY_PASSWORD = 'replay-password'
+DEFAULT_DYNAMODB_MS = 5.0
+WORDS = ("today felt heavy and I kept thinking about work sleep family friends school stress "
+         "the week was long but walking and breathing helped a little more than before").split()
+
+
+# DynamoDB stand-in: answers before-call events, so requests are never sent
+
+class ConditionFailed(Exception):
+    pass
+
+
+def _wire_to_parsed(value):
+    """Request bodies carry binary base64 encoded; parsed responses carry bytes"""
+    (kind, inner), = value.items()
+    if kind == 'B':
+        return {'B': base64.b64decode(inner)}
+    if kind == 'BS':
+        return {'BS': [base64.b64decode(v) for v in inner]}
+    if kind == 'M':
+        return {'M': {k: _wire_to_parsed(v) for k, v in inner.items()}}
+    if kind == 'L':
+        return {'L': [_wire_to_parsed(v) for v in inner]}
+    return value
+
+
+def _item(attributes):
+    return {k: _wire_to_parsed(v) for k, v in (attributes or {}).items()}
+
+
+def _plain(value):
+    """Comparable Python value of an attribute value"""
+    if value is None:
+        return None
+    (kind, inner), = value.items()
+    if kind == 'N':
+        return Decimal(inner)
+    if kind in ('SS', 'BS'):
+        return frozenset(inner)
+    if kind == 'NS':
+        return frozenset(Decimal(v) for v in inner)
+    if kind in ('M', 'L'):
+        return json.dumps(value, sort_keys=True, default=str)
+    return inner
+
+
+def _number(value: Decimal) -> str:
+    return str(value.normalize()) if value != value.to_integral() else str(int(value))
+
+
+class Expression:
+    """Evaluator for the condition and key condition expressions the handler sends"""
+
+    def __init__(self, text, names, values):
+        self.tokens = re.findall(r"<>|<=|>=|[=<>(),]|[#:]?[A-Za-z_][\w.]*", text or '')
+        self.names = names or {}
+        self.values = values or {}
+        self.pos = 0
+
+    def matches(self, item):
+        self.pos = 0
+        self.item = item
+        return bool(self._or()) if self.tokens else True
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _take(self):
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def _or(self):
+        result = self._and()
+        while self._peek() == 'OR':
+            self._take()
+            right = self._and()
+            result = result or right
+        return result
+
+    def _and(self):
+        result = self._not()
+        while self._peek() == 'AND':
+            self._take()
+            right = self._not()
+            result = result and right
+        return result
+
+    def _not(self):
+        if self._peek() == 'NOT':
+            self._take()
+            return not self._not()
+        return self._primary()
+
+    def _primary(self):
+        token = self._take()
+        if token == '(':
+            result = self._or()
+            self._take()
+            return result
+        if token in ('attribute_exists', 'attribute_not_exists', 'begins_with', 'contains'):
+            self._take()
+            args = [self._operand()]
+            while self._take() == ',':
+                args.append(self._operand())
+            if token == 'attribute_exists':
+                return args[0] is not None
+            if token == 'attribute_not_exists':
+                return args[0] is None
+            if args[0] is None:
+                return False
+            return args[0].startswith(args[1]) if token == 'begins_with' else args[1] in args[0]
+        self.pos -= 1
+        left = self._operand()
+        op = self._take()
+        if op == 'BETWEEN':
+            low = self._operand()
+            self._take()
+            high = self._operand()
+            return left is not None and low <= left <= high
+        right = self._operand()
+        if left is None or right is None:
+            return op == '<>'
+        return {'=': left == right, '<>': left != right, '<': left < right, '<=': left <= right,
+                '>': left > right, '>=': left >= right}[op]
+
+    def _operand(self):
+        token = self._take()
+        if token.startswith(':'):
+            return _plain(self.values[token])
+        return _plain(self.item.get(self.names.get(token, token)))
+
+
+def _split_top_level(text):
+    parts, depth, current = [], 0, ''
+    for char in text:
+        if char == ',' and depth == 0:
+            parts.append(current.strip())
+            current = ''
+            continue
+        depth += (char == '(') - (char == ')')
+        current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def _apply_update(item, expression, names, values):
+    """Apply an UpdateExpression (SET, ADD, REMOVE, DELETE) to item; returns the names set"""
+    name = lambda token: names.get(token.strip(), token.strip())
+    touched = set()
+    clauses = re.split(r'\b(SET|ADD|REMOVE|DELETE)\b', expression)
+    for keyword, body in zip(clauses[1::2], clauses[2::2]):
+        for action in _split_top_level(body):
+            if keyword == 'SET':
+                target, value = (part.strip() for part in action.split('=', 1))
+                match = re.match(r'if_not_exists\(\s*([#\w]+)\s*,\s*(:\w+)\s*\)', value)
+                if match:
+                    existing = item.get(name(match.group(1)))
+                    new = existing if existing is not None else values[match.group(2)]
+                elif '+' in value or ' - ' in value:
+                    left, op, right = re.split(r'\s*([+-])\s*', value, maxsplit=1)
+                    operand = lambda t: values[t] if t.startswith(':') else item.get(name(t), {'N': '0'})
+                    a, b = _plain(operand(left)), _plain(operand(right))
+                    new = {'N': _number(a + b if op == '+' else a - b)}
+                else:
+                    new = values[value] if value.startswith(':') else item[name(value)]
+                item[name(target)] = new
+                touched.add(name(target))
+            elif keyword == 'REMOVE':
+                item.pop(name(action), None)
+            else:
+                target, token = action.split()
+                target, value = name(target), values[token]
+                existing = item.get(target)
+                (kind, inner), = value.items()
+                if kind == 'N':
+                    total = _plain(existing or {'N': '0'}) + Decimal(inner)
+                    item[target] = {'N': _number(total)}
+                else:
+                    current = set(existing[kind]) if existing else set()
+                    current = current | set(inner) if keyword == 'ADD' else current - set(inner)
+                    if current:
+                        item[target] = {kind: sorted(current)}
+                    else:
+                        item.pop(target, None)
+                touched.add(target)
+    return touched
+
+
+class ReplayTables:
+    """In-memory tables answering the handler's DynamoDB calls after a trace-drawn latency"""
+
+    def __init__(self, latencies, seed):
+        self.tables = defaultdict(dict)
+        self.latencies = latencies
+        self.rng = random.Random(seed)
+        self.lock = threading.RLock()
+        self.delay = True
+
+    def _latency(self, operation):
+        if not self.delay:
+            return
+        with self.lock:
+            pool = self.latencies.get(operation)
+            ms = self.rng.choice(pool) if pool else DEFAULT_DYNAMODB_MS
+        time.sleep(ms / 1000)
+
+    def _key(self, table, item):
+        partition, sort = TABLE_KEYS[table]
+        return (_plain(item[partition]), _plain(item[sort]) if sort else None)
+
+    def handle(self, model, params, **kwargs):
+        """before-call hook: answer the call locally and skip the HTTP request"""
+        from botocore.awsrequest import AWSResponse
+        request = json.loads(params['body'] or b'{}')
+        self._latency(model.name)
+        try:
+            with self.lock:
+                parsed = getattr(self, model.name)(request)
+            return AWSResponse('replay', 200, {}, None), parsed
+        except ConditionFailed:
+            error = {'Code': 'ConditionalCheckFailedException', 'Message': 'The conditional request failed'}
+            return AWSResponse('replay', 400, {}, None), {'Error': error, 'ResponseMetadata': {}}
+
+    def _check(self, request, existing):
+        condition = Expression(request.get('ConditionExpression'), request.get('ExpressionAttributeNames'),
+                               _item(request.get('ExpressionAttributeValues')))
+        if request.get('ConditionExpression') and not condition.matches(existing or {}):
+            raise ConditionFailed()
+
+    def GetItem(self, request):
+        table = request['TableName']
+        item = self.tables[table].get(self._key(table, _item(request['Key'])))
+        return {'Item': dict(item)} if item else {}
+
+    def PutItem(self, request):
+        table, item = request['TableName'], _item(request['Item'])
+        key = self._key(table, item)
+        old = self.tables[table].get(key)
+        self._check(request, old)
+        self.tables[table][key] = item
+        return {'Attributes': old} if old and request.get('ReturnValues') == 'ALL_OLD' else {}
+
+    def UpdateItem(self, request):
+        table, key_item = request['TableName'], _item(request['Key'])
+        key = self._key(table, key_item)
+        old = self.tables[table].get(key)
+        self._check(request, old)
+        item = dict(old or key_item)
+        touched = _apply_update(item, request['UpdateExpression'], request.get('ExpressionAttributeNames') or {},
+                                _item(request.get('ExpressionAttributeValues')))
+        self.tables[table][key] = item
+        returns = request.get('ReturnValues', 'NONE')
+        if returns == 'ALL_NEW':
+            return {'Attributes': dict(item)}
+        if returns == 'UPDATED_NEW':
+            return {'Attributes': {k: item[k] for k in touched if k in item}}
+        return {'Attributes': old} if old and returns == 'ALL_OLD' else {}
+
+    def DeleteItem(self, request):
+        table = request['TableName']
+        key = self._key(table, _item(request['Key']))
+        self._check(request, self.tables[table].get(key))
+        old = self.tables[table].pop(key, None)
+        return {'Attributes': old} if old and request.get('ReturnValues') == 'ALL_OLD' else {}
+
+    def BatchWriteItem(self, request):
+        for table, writes in request['RequestItems'].items():
+            for write in writes:
+                if 'PutRequest' in write:
+                    item = _item(write['PutRequest']['Item'])
+                    self.tables[table][self._key(table, item)] = item
+                else:
+                    self.tables[table].pop(self._key(table, _item(write['DeleteRequest']['Key'])), None)
+        return {'UnprocessedItems': {}}
+
+    def BatchGetItem(self, request):
+        responses = {}
+        for table, spec in request['RequestItems'].items():
+            found = (self.tables[table].get(self._key(table, _item(key))) for key in spec['Keys'])
+            responses[table] = [dict(item) for item in found if item]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def _rows(self, request):
+        """Items of the table or index, in key order, with their key attribute names"""
+        table = request['TableName']
+        partition, sort = TABLE_KEYS[table]
+        names, keys_only = [partition] + ([sort] if sort else []), False
+        if request.get('IndexName'):
+            index_partition, index_sort, keys_only = INDEX_KEYS[(table, request['IndexName'])]
+            names += [index_partition, index_sort]
+            partition, sort = index_partition, index_sort
+        items = [item for item in self.tables[table].values() if partition in item and (not sort or sort in item)]
+        items.sort(key=lambda item: (str(_plain(item[partition])), _plain(item[sort]) if sort else 0))
+        if keys_only:
+            items = [{k: item[k] for k in names if k in item} for item in items]
+        return items, names
+
+    def _page(self, request, items, names):
+        if request.get('ExclusiveStartKey'):
+            start = _item(request['ExclusiveStartKey'])
+            position = next((i for i, item in enumerate(items) if all(item.get(k) == v for k, v in start.items())), -1)
+            items = items[position + 1:]
+        limit = request.get('Limit')
+        page, more = (items[:limit], len(items) > limit) if limit else (items, False)
+        condition = Expression(request.get('FilterExpression'), request.get('ExpressionAttributeNames'),
+                               _item(request.get('ExpressionAttributeValues')))
+        response = {'Items': [dict(item) for item in page if condition.matches(item)]}
+        if request.get('ProjectionExpression'):
+            attributes = request.get('ExpressionAttributeNames') or {}
+            wanted = {attributes.get(p.strip(), p.strip()) for p in request['ProjectionExpression'].split(',')}
+            response['Items'] = [{k: v for k, v in item.items() if k in wanted} for item in response['Items']]
+        response['Count'] = response['ScannedCount'] = len(response['Items'])
+        if more:
+            response['LastEvaluatedKey'] = {k: page[-1][k] for k in names if k in page[-1]}
+        return response
+
+    def Query(self, request):
+        items, names = self._rows(request)
+        condition = Expression(request['KeyConditionExpression'], request.get('ExpressionAttributeNames'),
+                               _item(request.get('ExpressionAttributeValues')))
+        items = [item for item in items if condition.matches(item)]
+        if request.get('ScanIndexForward') is False:
+            items.reverse()
+        return self._page(request, items, names)
+
+    def Scan(self, request):
+        items, names = self._rows(request)
+        segments = request.get('TotalSegments', 1)
+        items = [item for i, item in enumerate(items) if i % segments == request.get('Segment', 0)]
+        return self._page(request, items, names)
+
+
+# Replay
+
+def load_trace(path):
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records = [r for r in records if r.get('traffic') and r.get('route')]
+    records.sort(key=lambda r: r['at'])
+    return records
+
+
+def synthetic_text(rng, chars):
+    words = []
+    while sum(len(w) + 1 for w in words) < chars:
+        words.append(rng.choice(WORDS))
+    return ' '.join(words)[:max(chars, 1)]
+
+
+class LLMReplay:
+    """Provider stand-in that plays back each request's captured LLM calls in order"""
+
+    def __init__(self, records, seed):
+        self.local = threading.local()
+        self.pool = [call for r in records for call in r.get('llm', [])]
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def start(self, record, rng):
+        self.local.calls = list(record.get('llm', []))
+        self.local.rng = rng
+
+    def __call__(self, messages, model='replay', timeout=12.0, max_tokens=1024, cache_key=None, on_delta=None):
+        calls = getattr(self.local, 'calls', None)
+        if calls:
+            call = calls.pop(0)
+        else:
+            # The replayed code made a call the captured request didn't
+            with self.lock:
+                call = self.rng.choice(self.pool) if self.pool else {'latencyMs': 1000, 'outputTokens': 100}
+        time.sleep(min(call.get('latencyMs', 0) / 1000, timeout))
+        rng = getattr(self.local, 'rng', None) or random.Random(0)
+        text = synthetic_text(rng, min(call.get('outputTokens', 0), max_tokens) * 4)
+        if on_delta:
+            for i, word in enumerate(text.split(' ')):
+                on_delta(word if i == 0 else ' ' + word)
+        return {
+            'text': text,
+            'input_tokens': call.get('inputTokens', 0),
+            'cached_input_tokens': call.get('cachedInputTokens', 0),
+            'cache_write_tokens': 0,
+            'output_tokens': call.get('outputTokens', 0),
+        }
+
+
+class Context:
+    """Lambda context with the chat function's 30 s timeout"""
+
+    def __init__(self):
+        self._expires = time.monotonic() + 30
+
+    def get_remaining_time_in_millis(self):
+        return int(max(0.0, self._expires - time.monotonic()) * 1000)
+
+
+def build_event(record, rng):
+    method, path = record['route'].split(' ', 1)
+    username = f"u{record['user']}" if record.get('user') else 'anonymous'
+    event = {
+        'path': path,
+        'httpMethod': method,
+        'headers': {},
+        'queryStringParameters': None,
+        'body': None,
+        'requestContext': {'authorizer': {'username': username}},
+    }
+    if path == '/chat':
+        event['body'] = json.dumps({
+            'message': synthetic_text(rng, record.get('messageChars', 40)),
+            'sessionId': f"s{record.get('session', 'none')}",
+        })
+    elif path == '/auth/login':
+        event['body'] = json.dumps({'username': username, 'password': REPLAY_PASSWORD})
+    elif path == '/auth/register':
+        event['body'] = json.dumps({'username': f"{username}-{rng.getrandbits(32):x}", 'password': REPLAY_PASSWORD})
+    elif path == '/search':
+        event['queryStringParameters'] = {'q': synthetic_text(rng, record.get('queryChars', 12))}
+    return event
+
+
+def seed_data(records, index, data_access, seed):
+    """Users for every captured user, and stored turns for sessions already under way"""
+    import runtime_config
+    password_hash = index.hash_password(REPLAY_PASSWORD)
+    now = int(time.time())
+    ttl = now + runtime_config.get('data_retention_days') * 24 * 60 * 60
+    seen_sessions = set()
+    for user in sorted({r['user'] for r in records if r.get('user')}):
+        data_access.create_user(f"u{user}", password_hash, now)
+    rng = random.Random(seed)
+    timestamp = (now - 24 * 60 * 60) * 1000
+    for record in records:
+        session = record.get('session')
+        if record['route'] != 'POST /chat' or not session or session in seen_sessions:
+            continue
+        seen_sessions.add(session)
+        for turn in range(record.get('turns', 0)):
+            role = 'user' if turn % 2 == 0 else 'assistant'
+            chars = record.get('messageChars', 40) if role == 'user' else record.get('replyChars', 400)
+            timestamp += 1
+            index.store_message(f"s{session}", timestamp, role, synthetic_text(rng, chars), ttl, f"u{record['user']}")
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    return {
+        'p50': round(metrics.percentile(values, 50), 1),
+        'p95': round(metrics.percentile(values, 95), 1),
+        'p99': round(metrics.percentile(values, 99), 1),
+        'max': round(max(values), 1),
+    }
+
+
+def command_run(args):
+    records = load_trace(args.trace)
+    if args.limit:
+        records = records[:args.limit]
+    skipped = defaultdict(int)
+    for record in records:
+        if record['route'] not in REPLAYED_ROUTES:
+            skipped[record['route']] += 1
+    records = [r for r in records if r['route'] in REPLAYED_ROUTES]
+    if not records:
+        sys.exit('No replayable requests in the trace')
+
+    for name, value in REPLAY_ENV.items():
+        os.environ.setdefault(name, value)
+    os.environ['TRAFFIC_CAPTURE'] = 'off'
+
+    latencies = defaultdict(list)
+    for record in records:
+        for operation, samples in record.get('dynamodb', {}).items():
+            latencies[operation].extend(samples)
+    tables = ReplayTables(latencies, args.seed)
+    # Clients created from the default session (every handler module's) inherit the hook
+    import boto3
+    boto3.setup_default_session(region_name=os.environ['AWS_DEFAULT_REGION'])
+    boto3.DEFAULT_SESSION.events.register_last('before-call.dynamodb', tables.handle)
+
+    sink = open(os.devnull, 'w')
+    with contextlib.redirect_stdout(sink):
+        import data_access
+        import index
+        import llm_provider
+    llm = LLMReplay(records, args.seed)
+    llm_provider.PROVIDERS['local'] = llm
+
+    tables.delay = False
+    with contextlib.redirect_stdout(sink):
+        seed_data(records, index, data_access, args.seed)
+    tables.delay = True
+
+    results = []
+    results_lock = threading.Lock()
+
+    def replay(i, record, due, previous):
+        if previous is not None:
+            previous.result()
+        rng = random.Random(f"{args.seed}:{i}")
+        event = build_event(record, rng)
+        llm.start(record, rng)
+        started = time.perf_counter()
+        response = index.handler(event, Context())
+        elapsed = (time.perf_counter() - started) * 1000
+        with results_lock:
+            results.append({
+                'route': record['route'],
+                'ms': elapsed,
+                'lagMs': max(0.0, (started - clock_start - due) * 1000),
+                'status': response.get('statusCode', 500),
+                'capturedMs': record.get('durationMs'),
+                'capturedStatus': record.get('status'),
+            })
+
+    print(f"Replaying {len(records)} requests at {'max' if not args.speed else f'{args.speed}x'} speed "
+          f"(skipped {sum(skipped.values())}: {dict(skipped)})", file=sys.stderr)
+    first = records[0]['at']
+    sessions = {}
+    with contextlib.redirect_stdout(sink), ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        clock_start = time.perf_counter()
+        for i, record in enumerate(records):
+            due = (record['at'] - first) / 1000 / args.speed if args.speed else 0.0
+            wait = due - (time.perf_counter() - clock_start)
+            if wait > 0:
+                time.sleep(wait)
+            key = record.get('session') or record.get('user') or f"request-{i}"
+            sessions[key] = executor.submit(replay, i, record, due, sessions.get(key))
+        for future in sessions.values():
+            future.result()
+        wall = time.perf_counter() - clock_start
+
+    report = {
+        'trace': args.trace,
+        'speed': args.speed,
+        'concurrency': args.concurrency,
+        'requests': len(results),
+        'skipped': dict(skipped),
+        'wallSeconds': round(wall, 2),
+        'throughput': round(len(results) / wall, 2),
+        'capturedSeconds': round((records[-1]['at'] - first) / 1000, 2),
+        'lagMs': percentiles([r['lagMs'] for r in results]),
+        'routes': {},
+    }
+    by_route = defaultdict(list)
+    for result in results:
+        by_route[result['route']].append(result)
+    for route, rows in sorted(by_route.items()):
+        captured = [r['capturedMs'] for r in rows if r['capturedMs'] is not None]
+        report['routes'][route] = {
+            'count': len(rows),
+            'errors': sum(1 for r in rows if r['status'] >= 500),
+            # Requests that failed in replay but not in production, or the other way round
+            'mismatched': sum(1 for r in rows if (r['status'] >= 400) != ((r['capturedStatus'] or 200) >= 400)),
+            **percentiles([r['ms'] for r in rows]),
+            'captured': percentiles(captured),
+        }
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def print_report(report):
+    print(f"{report['requests']} requests in {report['wallSeconds']}s ({report['throughput']}/s); "
+          f"captured over {report['capturedSeconds']}s; schedule lag p95 {report['lagMs'].get('p95', 0)} ms")
+    print(f"{'route':<20} {'count':>6} {'errors':>6} {'mismatch':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+          f"   captured p50/p95")
+    for route, row in report['routes'].items():
+        captured = row['captured']
+        print(f"{route:<20} {row['count']:>6} {row['errors']:>6} {row['mismatched']:>8} {row['p50']:>8} {row['p95']:>8} {row['p99']:>8} "
+              f"{row['max']:>8}   {captured.get('p50', '-')}/{captured.get('p95', '-')}")
+
+
+def command_compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    change = lambda old, new: f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+    print(f"throughput {before['throughput']}/s -> {after['throughput']}/s "
+          f"({change(before['throughput'], after['throughput'])})")
+    print(f"{'route':<20} {'p50 before':>11} {'after':>8} {'change':>8} {'p95 before':>11} {'after':>8} {'change':>8}")
+    for route in sorted(set(before['routes']) | set(after['routes'])):
+        old, new = before['routes'].get(route), after['routes'].get(route)
+        if not old or not new:
+            print(f"{route:<20} only in {'after' if new else 'before'}")
+            continue
+        print(f"{route:<20} {old['p50']:>11} {new['p50']:>8} {change(old['p50'], new['p50']):>8} "
+              f"{old['p95']:>11} {new['p95']:>8} {change(old['p95'], new['p95']):>8}")
+
+
+def command_collect(args):
+    import boto3
+    logs = boto3.client('logs')
+    start = int((time.time() - args.hours * 60 * 60) * 1000)
+    count = 0
+    with open(args.output, 'w') as out:
+        records = []
+        paginator = logs.get_paginator('filter_log_events')
+        for page in paginator.paginate(logGroupName=args.log_group, startTime=start,
+                                       filterPattern='{ $.traffic >= 1 }'):
+            for event in page['events']:
+                try:
+                    records.append(json.loads(event['message']))
+                except ValueError:
+                    continue
+        records.sort(key=lambda r: r.get('at', 0))
+        for record in records:
+            out.write(json.dumps(record, separators=(',', ':')) + '\n')
+            count += 1
+    print(f"Wrote {count} records to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    collect = commands.add_parser('collect', help='pull captured records from CloudWatch Logs')
+    collect.add_argument('--log-group', required=True, help='e.g. /aws/lambda/<ChatHandler function name>')
+    collect.add_argument('--hours', type=float, default=24)
+    collect.add_argument('--output', required=True)
+
+    run = commands.add_parser('run', help='replay a trace against the local handler')
+    run.add_argument('trace')
+    run.add_argument('--speed', type=float, default=1, help='arrival-time speedup; 0 replays as fast as possible')
+    run.add_argument('--concurrency', type=int, default=32, help='requests in flight at most')
+    run.add_argument('--seed', type=int, default=7, help='seed for latency draws and synthetic text')
+    run.add_argument('--limit', type=int, help='replay only the first N requests')
+    run.add_argument('--report', help='write the report as JSON for compare')
+
+    compare = commands.add_parser('compare', help='latency and throughput change between two reports')
+    compare.add_argument('before')
+    compare.add_argument('after')
+
+    args = parser.parse_args()
+    {'collect': command_collect, 'run': command_run, 'compare': command_compare}[args.command](args)
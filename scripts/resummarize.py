@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Offline re-summarization of stored sessions and backfill of missing summaries
+Usage:
+  python scripts/resummarize.py run [--users a,b] [--backfill] [--workers N] [--checkpoint FILE]
+  python scripts/resummarize.py prepare-batch --records FILE [--users a,b] [--backfill]
+  python scripts/resummarize.py apply-batch --records FILE --output FILE [--checkpoint FILE]
+
+Rewrites ChatSummaries rows with the current summary prompt and model (the 'summary' route
+of LLM_ROUTING_POLICY), using the same history, summarization and storage code as the chat
+handler: transcripts are rebuilt with get_conversation_history (decrypted, PII redacted),
+summarized with generate_conversation_summary, and written back as summary_item rows
+(embedded for recall, encrypted) with BatchWriteItem. A rewritten summary keeps its TTL.
+Batch writes bypass the trend rollups, so the rollups of every user written to are rebuilt
+from their summaries at the end.
+
+Sessions are every existing summary, plus with --backfill every session with at least
+--min-messages messages and no summary. Without --users, both lists come from parallel
+Scans (--segments) of ChatSummaries and the keys-only UserIndex; run it off-peak.
+
+run summarizes with --workers concurrent LLM calls. Written sessions are appended to
+--checkpoint, and a rerun of the same command skips them, so an interrupted job resumes.
+
+prepare-batch writes Bedrock batch inference input (one record per session, FILE) and a
+manifest (FILE.manifest) instead of calling the model. Upload FILE to S3, start a model
+invocation job with the printed model ID, then run apply-batch on the job's output file.
+Both files hold redacted transcripts and summaries in plain text: keep them in an
+encrypted bucket and delete them afterwards.
+
+Uses the handler's settings from the environment, including PII_PLACEHOLDER_KEY_SECRET_ARN
+(or PII_PLACEHOLDER_KEY) for redacting older rows. For a local run against DynamoDB Local
+with no AWS access: DYNAMODB_ENDPOINT_URL=http://localhost:8000 LLM_PROVIDER=local
+CONTENT_ENCRYPTION=local (with CONTENT_LOCAL_KMS_KEY) MEMORY_EMBEDDING_PROVIDER=local
+PII_PLACEHOLDER_KEY=<any string>.
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'chat'))
+
+os.environ.setdefault('CHAT_TABLE_NAME', 'ChatHistory')
+os.environ.setdefault('USERS_TABLE_NAME', 'Users')
+os.environ.setdefault('SUMMARIES_TABLE_NAME', 'ChatSummaries')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import data_access
+import index
+import llm_provider
+import runtime_config
+import trends
+
+REPORT_EVERY_SECONDS = 5
+
+
+def _parallel_pages(page_iter, segments):
+    """Pages from every Scan segment, as they arrive"""
+    pages = queue.Queue(maxsize=64)
+    done = object()
+
+    def scan(segment):
+        try:
+            for page in page_iter(segment=segment, total_segments=segments):
+                pages.put(page)
+        finally:
+            pages.put(done)
+
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        futures = [executor.submit(scan, segment) for segment in range(segments)]
+        finished = 0
+        while finished < segments:
+            page = pages.get()
+            if page is done:
+                finished += 1
+            else:
+                yield page
+        for future in futures:
+            future.result()
+
+
+def select_sessions(args):
+    """(username, sessionId, ttl or None) of every session to summarize, each once"""
+    users = [u.strip().lower() for u in args.users.split(',') if u.strip()] if args.users else None
+    seen = set()
+
+    if users:
+        summary_pages = (page for user in users for page in data_access.iter_summary_key_pages(user))
+    else:
+        summary_pages = _parallel_pages(data_access.iter_summary_key_pages, args.segments)
+    for page in summary_pages:
+        for row in page:
+            key = (row['username'], row['sessionId'])
+            if key not in seen:
+                seen.add(key)
+                yield key + (row['ttl'],)
+
+    if not args.backfill:
+        return
+    counts = Counter()
+    if users:
+        for user in users:
+            for page in data_access.iter_user_message_key_pages(user):
+                counts.update((user, key['sessionId']) for key in page)
+    else:
+        for page in _parallel_pages(data_access.scan_message_key_pages, args.segments):
+            counts.update((key['username'], key['sessionId']) for key in page)
+    for key, messages in counts.items():
+        if messages >= args.min_messages and key not in seen:
+            yield key + (None,)
+
+
+class Checkpoint:
+    """Append-only file of sessions already written, one 'username<TAB>sessionId' per line"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.done = {tuple(line.rstrip('\n').split('\t', 1)) for line in f if '\t' in line}
+        self._file = open(path, 'a') if path else None
+
+    def __contains__(self, key):
+        return key in self.done
+
+    def add(self, keys):
+        self.done.update(keys)
+        if self._file:
+            self._file.writelines(f"{username}\t{session_id}\n" for username, session_id in keys)
+            self._file.flush()
+
+
+class Writer:
+    """Buffers summary items and writes them 25 at a time, then checkpoints them"""
+
+    def __init__(self, checkpoint, dry_run=False):
+        self.checkpoint = checkpoint
+        self.dry_run = dry_run
+        self.written = 0
+        self.users = set()
+        self._items = []
+
+    def add(self, username, session_id, summary, ttl):
+        ttl = ttl or int(time.time()) + runtime_config.get('data_retention_days') * 24 * 60 * 60
+        self._items.append(((username, session_id), index.summary_item(username, session_id, summary, ttl)))
+        if len(self._items) == data_access.BATCH_WRITE_MAX_ITEMS:
+            self.flush()
+
+    def flush(self):
+        if not self._items:
+            return
+        batch, self._items = self._items, []
+        if not self.dry_run:
+            data_access.batch_put(data_access.SUMMARIES_TABLE_NAME, [item for _, item in batch])
+        self.checkpoint.add([key for key, _ in batch])
+        self.written += len(batch)
+        self.users.update(username for (username, _), _ in batch)
+
+    def rebuild_trends(self):
+        if self.dry_run:
+            return
+        for username in sorted(self.users):
+            trends.rebuild(username)
+
+
+class Report:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.counts = Counter()
+
+    def tick(self, force=False):
+        now = time.perf_counter()
+        if not force and now - self.last < REPORT_EVERY_SECONDS:
+            return
+        self.last = now
+        elapsed = now - self.start
+        done = sum(self.counts.values())
+        print(f"[{elapsed:7.1f}s] {done} sessions ({done / elapsed:.1f}/s): "
+              + ', '.join(f"{k} {v}" for k, v in sorted(self.counts.items())), file=sys.stderr)
+
+
+def transcript(username, session_id):
+    history = index.get_conversation_history(session_id, username)
+    index.history_cache.invalidate(index.history_cache_key(session_id, username))
+    return history
+
+
+def summarize(username, session_id, min_messages):
+    history = transcript(username, session_id)
+    if len(history) < min_messages:
+        return None
+    summary = index.generate_conversation_summary(history)
+    if summary == index.SUMMARY_UNAVAILABLE:
+        raise RuntimeError('summary call failed')
+    return summary
+
+
+def command_run(args):
+    checkpoint = Checkpoint(args.checkpoint)
+    writer = Writer(checkpoint, args.dry_run)
+    report = Report()
+    in_flight = {}
+
+    def settle(futures):
+        for future in futures:
+            username, session_id, ttl = in_flight.pop(future)
+            try:
+                summary = future.result()
+            except Exception as e:
+                print(f"{username}/{session_id}: {e}", file=sys.stderr)
+                report.counts['failed'] += 1
+                continue
+            if summary is None:
+                # Too short to summarize; not revisited on resume
+                checkpoint.add([(username, session_id)])
+                report.counts['skipped'] += 1
+            else:
+                writer.add(username, session_id, summary, ttl)
+                report.counts['summarized'] += 1
+        report.tick()
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for username, session_id, ttl in select_sessions(args):
+            if (username, session_id) in checkpoint:
+                report.counts['already done'] += 1
+                continue
+            # Keep a bounded number of sessions queued so selection streams with the LLM calls
+            while len(in_flight) >= args.workers * 2:
+                settle(wait(in_flight, return_when=FIRST_COMPLETED).done)
+            in_flight[executor.submit(summarize, username, session_id, args.min_messages)] = (username, session_id, ttl)
+        while in_flight:
+            settle(wait(in_flight, return_when=FIRST_COMPLETED).done)
+    writer.flush()
+    writer.rebuild_trends()
+    report.tick(force=True)
+    print(f"Wrote {writer.written} summaries{' (dry run)' if args.dry_run else ''}", file=sys.stderr)
+
+
+def command_prepare_batch(args):
+    checkpoint = Checkpoint(args.checkpoint)
+    report = Report()
+    model_id = None
+    with open(args.records, 'w') as records, open(args.records + '.manifest', 'w') as manifest:
+        for username, session_id, ttl in select_sessions(args):
+            if (username, session_id) in checkpoint:
+                continue
+            history = transcript(username, session_id)
+            if len(history) < args.min_messages:
+                report.counts['skipped'] += 1
+                continue
+            prompt = index.summary_prompt(history)
+            decision = llm_provider.route('summary', prompt)
+            model_id = model_id or llm_provider.model_for('bedrock', decision['tier'])
+            record_id = f"R{report.counts['records']:010d}"
+            records.write(json.dumps({
+                'recordId': record_id,
+                'modelInput': llm_provider.bedrock_payload(prompt, decision['max_tokens']),
+            }) + '\n')
+            manifest.write(json.dumps({'recordId': record_id, 'username': username,
+                                       'sessionId': session_id, 'ttl': ttl}) + '\n')
+            report.counts['records'] += 1
+            report.tick()
+    report.tick(force=True)
+    print(f"Wrote {report.counts['records']} records to {args.records}; "
+          f"start a Bedrock batch inference job with model {model_id}", file=sys.stderr)
+
+
+def command_apply_batch(args):
+    with open(args.records + '.manifest') as f:
+        sessions = {row['recordId']: row for row in map(json.loads, f)}
+    checkpoint = Checkpoint(args.checkpoint)
+    writer = Writer(checkpoint, args.dry_run)
+    report = Report()
+    with open(args.output) as f:
+        for line in f:
+            record = json.loads(line)
+            row = sessions.get(record.get('recordId'))
+            output = record.get('modelOutput') or {}
+            if row is None or 'error' in record or not output.get('content'):
+                report.counts['failed'] += 1
+                continue
+            if (row['username'], row['sessionId']) in checkpoint:
+                report.counts['already done'] += 1
+                continue
+            writer.add(row['username'], row['sessionId'], output['content'][0]['text'], row['ttl'])
+            report.counts['summarized'] += 1
+            report.tick()
+    writer.flush()
+    writer.rebuild_trends()
+    report.tick(force=True)
+    print(f"Wrote {writer.written} summaries{' (dry run)' if args.dry_run else ''}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['run', 'prepare-batch', 'apply-batch'])
+    parser.add_argument('--users', help='comma-separated usernames (default: every user)')
+    parser.add_argument('--backfill', action='store_true', help='also summarize sessions without a summary')
+    parser.add_argument('--min-messages', type=int, default=10,
+                        help='sessions with fewer stored messages are skipped (the chat handler summarizes at 10)')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent LLM calls')
+    parser.add_argument('--segments', type=int, default=4, help='parallel Scan segments without --users')
+    parser.add_argument('--checkpoint', default='resummarize.checkpoint', help="'' to disable")
+    parser.add_argument('--records', help='batch inference input file (prepare-batch, apply-batch)')
+    parser.add_argument('--output', help='batch inference output file (apply-batch)')
+    parser.add_argument('--dry-run', action='store_true', help='summarize but do not write')
+    args = parser.parse_args()
+
+    if args.command != 'run' and not args.records:
+        parser.error('--records is required')
+    if args.command == 'apply-batch' and not args.output:
+        parser.error('--output is required')
+
+    {'run': command_run, 'prepare-batch': command_prepare_batch, 'apply-batch': command_apply_batch}[args.command](args)
@@ -8,7 +8,9 @@ cd lambda/layer
 # Create python directory for Lambda layer
 mkdir -p python
 
-# Install dependencies
-pip install -r requirements.txt -t python/
+# Install dependencies. Wheels are pinned to the Lambda platform so compiled packages
+# (numpy, orjson) work when the layer is built on macOS or Windows.
+pip install -r requirements.txt -t python/ \
+    --platform manylinux2014_x86_64 --python-version 3.11 --only-binary=:all:
 
 echo "Layer built successfully!"
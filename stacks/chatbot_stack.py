@@ -5,10 +5,18 @@ from aws_cdk import (
     RemovalPolicy,
     CfnOutput,
     aws_lambda as lambda_,
+    aws_lambda_event_sources as lambda_event_sources,
     aws_apigateway as apigateway,
+    aws_apigatewayv2 as apigwv2,
+    aws_apigatewayv2_authorizers as apigwv2_authorizers,
+    aws_apigatewayv2_integrations as apigwv2_integrations,
     aws_dynamodb as dynamodb,
     aws_iam as iam,
+    aws_kms as kms,
     aws_logs as logs,
+    aws_s3 as s3,
+    aws_secretsmanager as secretsmanager,
+    aws_ssm as ssm,
 )
 from constructs import Construct
 
@@ -31,6 +39,21 @@ class ChatbotStack(Stack):
             point_in_time_recovery=True,
             removal_policy=RemovalPolicy.RETAIN,
             time_to_live_attribute="ttl",
+            # Feeds the search indexer; old images let it unindex messages expired by TTL
+            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
+        )
+
+        # Finds all of a user's messages without a scan (exports, account deletion).
+        # Keys only: rows are read back from the table by session.
+        chat_table.add_global_secondary_index(
+            index_name="UserIndex",
+            partition_key=dynamodb.Attribute(
+                name="username", type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="timestamp", type=dynamodb.AttributeType.NUMBER
+            ),
+            projection_type=dynamodb.ProjectionType.KEYS_ONLY,
         )
 
         # DynamoDB table for users
@@ -61,6 +84,177 @@ class ChatbotStack(Stack):
             time_to_live_attribute="ttl",
         )
 
+        # DynamoDB table for the per-user search index: posting lists of hashed tokens per
+        # day, expired by TTL along with the messages they point to
+        search_table = dynamodb.Table(
+            self,
+            "SearchIndex",
+            partition_key=dynamodb.Attribute(
+                name="username", type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="term", type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=dynamodb.TableEncryption.AWS_MANAGED,
+            removal_policy=RemovalPolicy.RETAIN,
+            time_to_live_attribute="ttl",
+        )
+
+        # DynamoDB table for rate limit counters (short-lived, expired by TTL)
+        rate_limit_table = dynamodb.Table(
+            self,
+            "RateLimits",
+            partition_key=dynamodb.Attribute(
+                name="bucket", type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=dynamodb.TableEncryption.AWS_MANAGED,
+            removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute="ttl",
+        )
+
+        # DynamoDB table for per-user daily usage counters
+        usage_table = dynamodb.Table(
+            self,
+            "UsageCounters",
+            partition_key=dynamodb.Attribute(
+                name="username", type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="day", type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=dynamodb.TableEncryption.AWS_MANAGED,
+            removal_policy=RemovalPolicy.RETAIN,
+            time_to_live_attribute="ttl",
+        )
+
+        # Lets admins list the heaviest users of a day without a scan
+        usage_table.add_global_secondary_index(
+            index_name="DayIndex",
+            partition_key=dynamodb.Attribute(
+                name="day", type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="tokens", type=dynamodb.AttributeType.NUMBER
+            ),
+        )
+
+        # DynamoDB table for per-user daily and weekly mood and topic rollups of summaries
+        trends_table = dynamodb.Table(
+            self,
+            "TrendRollups",
+            partition_key=dynamodb.Attribute(
+                name="username", type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="period", type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=dynamodb.TableEncryption.AWS_MANAGED,
+            removal_policy=RemovalPolicy.RETAIN,
+            time_to_live_attribute="ttl",
+        )
+
+        # DynamoDB table for /chat idempotency records (expired by TTL)
+        idempotency_table = dynamodb.Table(
+            self,
+            "IdempotencyKeys",
+            partition_key=dynamodb.Attribute(
+                name="key", type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=dynamodb.TableEncryption.AWS_MANAGED,
+            removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute="ttl",
+        )
+        # A user's records (they hold replies) for account deletion
+        idempotency_table.add_global_secondary_index(
+            index_name="UserIndex",
+            partition_key=dynamodb.Attribute(
+                name="username", type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=dynamodb.ProjectionType.KEYS_ONLY,
+        )
+
+        # DynamoDB table mapping WebSocket connections to the user authenticated on $connect
+        websocket_enabled = os.getenv("WEBSOCKET_API_ENABLED", "true").lower() == "true"
+        connections_table = None
+        if websocket_enabled:
+            connections_table = dynamodb.Table(
+                self,
+                "WebSocketConnections",
+                partition_key=dynamodb.Attribute(
+                    name="connectionId", type=dynamodb.AttributeType.STRING
+                ),
+                billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                encryption=dynamodb.TableEncryption.AWS_MANAGED,
+                removal_policy=RemovalPolicy.DESTROY,
+                time_to_live_attribute="ttl",
+            )
+            connections_table.add_global_secondary_index(
+                index_name="UserIndex",
+                partition_key=dynamodb.Attribute(
+                    name="username", type=dynamodb.AttributeType.STRING
+                ),
+                projection_type=dynamodb.ProjectionType.KEYS_ONLY,
+            )
+
+        # KMS key wrapping the per-user data keys that encrypt message content and summaries.
+        # Retained with the tables: without it, retained data can't be decrypted.
+        content_encryption = os.getenv("CONTENT_ENCRYPTION", "kms").lower()
+        content_key = None
+        if content_encryption == "kms":
+            content_key = kms.Key(
+                self,
+                "ContentKey",
+                description="Wraps per-user data keys for chat content",
+                enable_key_rotation=True,
+                removal_policy=RemovalPolicy.RETAIN,
+            )
+
+        # Large /export results, downloaded through short-lived presigned URLs
+        export_bucket = s3.Bucket(
+            self,
+            "Exports",
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            enforce_ssl=True,
+            removal_policy=RemovalPolicy.DESTROY,
+            auto_delete_objects=True,
+            lifecycle_rules=[
+                s3.LifecycleRule(
+                    expiration=Duration.days(1),
+                    abort_incomplete_multipart_upload_after=Duration.days(1),
+                )
+            ],
+        )
+
+        # Keys the PII placeholder hashes; generated so it is never empty or guessable
+        pii_placeholder_key = secretsmanager.Secret(
+            self,
+            "PiiPlaceholderKey",
+            description="HMAC key for PII placeholders in stored chat text",
+            generate_secret_string=secretsmanager.SecretStringGenerator(
+                password_length=64, exclude_punctuation=True
+            ),
+        )
+
+        # Runtime settings (system prompt, LLM providers, model tiers, routing, retention) the
+        # chat function re-reads every RUNTIME_CONFIG_TTL_SECONDS. Deploys only write the
+        # initial empty document, so values edited in Parameter Store survive them.
+        runtime_config_param = ssm.StringParameter(
+            self,
+            "RuntimeConfig",
+            description="JSON runtime settings for the chat function; see runtime_config.py",
+            string_value="{}",
+        )
+
+        # Admission control limits. GLOBAL_RATE_LIMIT should match the LLM provider's
+        # requests-per-minute quota; CHAT_RESERVED_CONCURRENCY caps concurrent invocations.
+        reserved_concurrency = os.getenv("CHAT_RESERVED_CONCURRENCY")
+
         # Lambda layer for dependencies
         lambda_layer = lambda_.LayerVersion(
             self,
@@ -80,34 +274,263 @@ class ChatbotStack(Stack):
             timeout=Duration.seconds(30),
             memory_size=512,
             layers=[lambda_layer],
+            reserved_concurrent_executions=(
+                int(reserved_concurrency) if reserved_concurrency else None
+            ),
             environment={
                 "CHAT_TABLE_NAME": chat_table.table_name,
                 "USERS_TABLE_NAME": users_table.table_name,
                 "SUMMARIES_TABLE_NAME": summaries_table.table_name,
+                "RATE_LIMIT_TABLE_NAME": rate_limit_table.table_name,
+                "USER_RATE_LIMIT": os.getenv("USER_RATE_LIMIT", "10"),
+                "USER_RATE_WINDOW_SECONDS": os.getenv("USER_RATE_WINDOW_SECONDS", "60"),
+                "GLOBAL_RATE_LIMIT": os.getenv("GLOBAL_RATE_LIMIT", "0"),
+                "GLOBAL_RATE_WINDOW_SECONDS": os.getenv(
+                    "GLOBAL_RATE_WINDOW_SECONDS", "60"
+                ),
+                "USAGE_TABLE_NAME": usage_table.table_name,
+                "USER_DAILY_SOFT_TOKEN_QUOTA": os.getenv(
+                    "USER_DAILY_SOFT_TOKEN_QUOTA", "0"
+                ),
+                "USER_DAILY_HARD_TOKEN_QUOTA": os.getenv(
+                    "USER_DAILY_HARD_TOKEN_QUOTA", "0"
+                ),
+                "ADMIN_USERNAMES": os.getenv("ADMIN_USERNAMES", ""),
+                "IDEMPOTENCY_TABLE_NAME": idempotency_table.table_name,
+                "RESPONSE_RESERVE_MS": os.getenv("RESPONSE_RESERVE_MS", "1500"),
+                "SUMMARY_MIN_BUDGET_SECONDS": os.getenv("SUMMARY_MIN_BUDGET_SECONDS", "8"),
+                "CONTENT_COMPRESSION": os.getenv("CONTENT_COMPRESSION", "zlib"),
+                "CONTENT_COMPRESSION_MIN_BYTES": os.getenv(
+                    "CONTENT_COMPRESSION_MIN_BYTES", "512"
+                ),
+                "CONNECTIONS_TABLE_NAME": (
+                    connections_table.table_name if connections_table else ""
+                ),
+                "WEBSOCKET_DELTA_FLUSH_MS": os.getenv("WEBSOCKET_DELTA_FLUSH_MS", "100"),
+                "DYNAMODB_MAX_POOL_CONNECTIONS": os.getenv(
+                    "DYNAMODB_MAX_POOL_CONNECTIONS", "16"
+                ),
+                "HISTORY_CACHE_MAX_ENTRIES": os.getenv("HISTORY_CACHE_MAX_ENTRIES", "256"),
+                "HISTORY_CACHE_MAX_BYTES": os.getenv("HISTORY_CACHE_MAX_BYTES", "8388608"),
                 "LLM_PROVIDER": os.getenv("LLM_PROVIDER", "bedrock"),
+                "LLM_FALLBACK_PROVIDERS": os.getenv("LLM_FALLBACK_PROVIDERS", ""),
+                "BEDROCK_TIMEOUT_SECONDS": os.getenv("BEDROCK_TIMEOUT_SECONDS", "12"),
+                "OPENAI_TIMEOUT_SECONDS": os.getenv("OPENAI_TIMEOUT_SECONDS", "12"),
+                "LLM_MAX_RETRIES": os.getenv("LLM_MAX_RETRIES", "2"),
+                "LLM_HEDGE_ENABLED": os.getenv("LLM_HEDGE_ENABLED", "false"),
+                "LLM_HEDGE_DELAY_MS": os.getenv("LLM_HEDGE_DELAY_MS", "3000"),
+                "LLM_MODEL_TIERS": os.getenv("LLM_MODEL_TIERS", ""),
+                "LLM_ROUTING_POLICY": os.getenv("LLM_ROUTING_POLICY", ""),
+                "LLM_PROMPT_CACHING": os.getenv("LLM_PROMPT_CACHING", "auto"),
                 "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", ""),
+                "TOKEN_MAX_AGE_SECONDS": os.getenv("TOKEN_MAX_AGE_SECONDS", "86400"),
+                "CRISIS_HIGH_ACTION": os.getenv("CRISIS_HIGH_ACTION", "resources"),
+                "CRISIS_RESOURCES_MESSAGE": os.getenv("CRISIS_RESOURCES_MESSAGE", ""),
+                "CRISIS_CLASSIFIER_PATH": os.getenv("CRISIS_CLASSIFIER_PATH", ""),
+                "CONTENT_ENCRYPTION": content_encryption,
+                "CONTENT_KMS_KEY_ID": content_key.key_arn if content_key else "",
+                "DATA_KEY_CACHE_TTL_SECONDS": os.getenv("DATA_KEY_CACHE_TTL_SECONDS", "300"),
+                "PII_REDACTION": os.getenv("PII_REDACTION", "on"),
+                "PII_ENTITY_TYPES": os.getenv("PII_ENTITY_TYPES", "EMAIL,SSN,CARD,PHONE,IP"),
+                "PII_PLACEHOLDER_KEY_SECRET_ARN": pii_placeholder_key.secret_arn,
+                "MEMORY_RETRIEVAL": os.getenv("MEMORY_RETRIEVAL", "on"),
+                "MEMORY_EMBEDDING_PROVIDER": os.getenv("MEMORY_EMBEDDING_PROVIDER", "local"),
+                "MEMORY_EMBEDDING_MODEL": os.getenv(
+                    "MEMORY_EMBEDDING_MODEL", "amazon.titan-embed-text-v2:0"
+                ),
+                "MEMORY_EMBEDDING_DIM": os.getenv("MEMORY_EMBEDDING_DIM", "512"),
+                "MEMORY_TOP_K": os.getenv("MEMORY_TOP_K", "3"),
+                "MEMORY_TOKEN_BUDGET": os.getenv("MEMORY_TOKEN_BUDGET", "300"),
+                "CHAT_USER_INDEX_NAME": "UserIndex",
+                "EXPORT_BUCKET_NAME": export_bucket.bucket_name,
+                "EXPORT_CONCURRENCY": os.getenv("EXPORT_CONCURRENCY", "8"),
+                "EXPORT_INLINE_MAX_BYTES": os.getenv("EXPORT_INLINE_MAX_BYTES", "4194304"),
+                "DELETE_CONCURRENCY": os.getenv("DELETE_CONCURRENCY", "8"),
+                "DELETE_INLINE_BUDGET_SECONDS": os.getenv("DELETE_INLINE_BUDGET_SECONDS", "10"),
+                "SEARCH_TABLE_NAME": search_table.table_name,
+                "SEARCH_RERANK_CANDIDATES": os.getenv("SEARCH_RERANK_CANDIDATES", "30"),
+                "TRENDS_TABLE_NAME": trends_table.table_name,
+                "TRENDS_RETENTION_DAYS": os.getenv("TRENDS_RETENTION_DAYS", "180"),
+                "TRAFFIC_CAPTURE": os.getenv("TRAFFIC_CAPTURE", "off"),
+                "TRAFFIC_CAPTURE_SAMPLE_RATE": os.getenv("TRAFFIC_CAPTURE_SAMPLE_RATE", "1"),
+                "TRAFFIC_CAPTURE_KEY": os.getenv("TRAFFIC_CAPTURE_KEY", ""),
                 "DATA_RETENTION_DAYS": os.getenv("DATA_RETENTION_DAYS", "30"),
                 "SYSTEM_PROMPT": os.getenv(
                     "SYSTEM_PROMPT", "You are a helpful AI assistant."
                 ),
+                "RUNTIME_CONFIG_SOURCE": "ssm:" + runtime_config_param.parameter_name,
+                "RUNTIME_CONFIG_TTL_SECONDS": os.getenv("RUNTIME_CONFIG_TTL_SECONDS", "30"),
+            },
+            log_retention=logs.RetentionDays.ONE_WEEK,
+        )
+
+        # Finishes DELETE /me for accounts too large to delete within one API request.
+        # A run cut short by its timeout fails, and Lambda's async retries carry on from
+        # the progress already made.
+        deletion_worker = lambda_.Function(
+            self,
+            "DataDeletionWorker",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="data_deletion.worker_handler",
+            code=lambda_.Code.from_asset("lambda/chat"),
+            timeout=Duration.minutes(15),
+            memory_size=512,
+            layers=[lambda_layer],
+            retry_attempts=2,
+            environment={
+                "CHAT_TABLE_NAME": chat_table.table_name,
+                "USERS_TABLE_NAME": users_table.table_name,
+                "SUMMARIES_TABLE_NAME": summaries_table.table_name,
+                "USAGE_TABLE_NAME": usage_table.table_name,
+                "SEARCH_TABLE_NAME": search_table.table_name,
+                "TRENDS_TABLE_NAME": trends_table.table_name,
+                "IDEMPOTENCY_TABLE_NAME": idempotency_table.table_name,
+                "CONNECTIONS_TABLE_NAME": (
+                    connections_table.table_name if connections_table else ""
+                ),
+                "CHAT_USER_INDEX_NAME": "UserIndex",
+                "DELETE_CONCURRENCY": os.getenv("DELETE_CONCURRENCY", "8"),
+            },
+            log_retention=logs.RetentionDays.ONE_WEEK,
+        )
+        chat_handler.add_environment(
+            "DELETION_WORKER_FUNCTION_NAME", deletion_worker.function_name
+        )
+        deletion_worker.grant_invoke(chat_handler)
+        for table in (chat_table, users_table, summaries_table, usage_table, search_table, trends_table,
+                      idempotency_table, connections_table):
+            if table:
+                table.grant_read_write_data(deletion_worker)
+
+        # Indexes new messages for GET /search off the reply path, and unindexes them when
+        # TTL expires them. Failed batches are retried, then split to isolate a bad record.
+        search_indexer = lambda_.Function(
+            self,
+            "SearchIndexer",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="search.indexer_handler",
+            code=lambda_.Code.from_asset("lambda/chat"),
+            timeout=Duration.minutes(1),
+            memory_size=256,
+            layers=[lambda_layer],
+            environment={
+                "CHAT_TABLE_NAME": chat_table.table_name,
+                "USERS_TABLE_NAME": users_table.table_name,
+                "SUMMARIES_TABLE_NAME": summaries_table.table_name,
+                "SEARCH_TABLE_NAME": search_table.table_name,
+                "SEARCH_INDEX_ROLES": os.getenv("SEARCH_INDEX_ROLES", "user"),
+                "CONTENT_ENCRYPTION": content_encryption,
+                "CONTENT_KMS_KEY_ID": content_key.key_arn if content_key else "",
+                "DATA_KEY_CACHE_TTL_SECONDS": os.getenv("DATA_KEY_CACHE_TTL_SECONDS", "300"),
             },
             log_retention=logs.RetentionDays.ONE_WEEK,
         )
+        search_indexer.add_event_source(
+            lambda_event_sources.DynamoEventSource(
+                chat_table,
+                starting_position=lambda_.StartingPosition.LATEST,
+                batch_size=100,
+                max_batching_window=Duration.seconds(5),
+                bisect_batch_on_error=True,
+                retry_attempts=3,
+                # Only rows stored under a username are searchable
+                filters=[
+                    lambda_.FilterCriteria.filter({
+                        "eventName": lambda_.FilterRule.is_equal("INSERT"),
+                        "dynamodb": {"NewImage": {"username": {"S": lambda_.FilterRule.exists()}}},
+                    }),
+                    lambda_.FilterCriteria.filter({
+                        "eventName": lambda_.FilterRule.is_equal("REMOVE"),
+                        "dynamodb": {"OldImage": {"username": {"S": lambda_.FilterRule.exists()}}},
+                    }),
+                ],
+            )
+        )
+        search_table.grant_read_write_data(search_indexer)
+        # Reads users' data keys, creating one for a user who has none yet
+        users_table.grant_read_write_data(search_indexer)
 
         # Grant DynamoDB permissions
         chat_table.grant_read_write_data(chat_handler)
         users_table.grant_read_write_data(chat_handler)
         summaries_table.grant_read_write_data(chat_handler)
+        rate_limit_table.grant_read_write_data(chat_handler)
+        usage_table.grant_read_write_data(chat_handler)
+        trends_table.grant_read_write_data(chat_handler)
+        idempotency_table.grant_read_write_data(chat_handler)
+        if connections_table:
+            connections_table.grant_read_write_data(chat_handler)
+        search_table.grant_read_data(chat_handler)
+        if content_key:
+            content_key.grant_encrypt_decrypt(chat_handler)
+            content_key.grant_encrypt_decrypt(search_indexer)
+        export_bucket.grant_read_write(chat_handler)
+        runtime_config_param.grant_read(chat_handler)
+        pii_placeholder_key.grant_read(chat_handler)
 
-        # Grant Bedrock permissions if using Bedrock
-        if os.getenv("LLM_PROVIDER", "bedrock") == "bedrock":
+        # Grant Bedrock permissions if Bedrock is the primary or a fallback provider, or
+        # embeds summaries for memory recall. Permissions follow the deploy-time settings, so
+        # to switch to Bedrock at runtime, deploy with it among LLM_FALLBACK_PROVIDERS.
+        llm_targets = [
+            os.getenv("LLM_PROVIDER", "bedrock"),
+            os.getenv("MEMORY_EMBEDDING_PROVIDER", "local"),
+        ] + os.getenv("LLM_FALLBACK_PROVIDERS", "").split(",")
+        if any(t.strip().startswith("bedrock") for t in llm_targets):
             chat_handler.add_to_role_policy(
                 iam.PolicyStatement(
-                    actions=["bedrock:InvokeModel"],
+                    actions=[
+                        "bedrock:InvokeModel",
+                        "bedrock:InvokeModelWithResponseStream",
+                    ],
                     resources=["*"],
                 )
             )
 
+        # Token authorizer: rejects bad tokens before they reach the chat function and
+        # lets API Gateway cache verified tokens for AUTHORIZER_CACHE_TTL_SECONDS
+        authorizer_handler = lambda_.Function(
+            self,
+            "AuthorizerHandler",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="authorizer.handler",
+            code=lambda_.Code.from_asset("lambda/chat"),
+            timeout=Duration.seconds(5),
+            memory_size=128,
+            environment={
+                "TOKEN_MAX_AGE_SECONDS": os.getenv("TOKEN_MAX_AGE_SECONDS", "86400"),
+            },
+            log_retention=logs.RetentionDays.ONE_WEEK,
+        )
+
+        authorizer_cache_ttl = Duration.seconds(
+            int(os.getenv("AUTHORIZER_CACHE_TTL_SECONDS", "300"))
+        )
+
+        # API front door: "rest" (API keys and a usage plan) or "http" (HTTP API,
+        # lower per-request overhead and cost, stage-level throttling instead of keys)
+        if os.getenv("API_TYPE", "rest").lower() == "http":
+            self._add_http_api(chat_handler, authorizer_handler, authorizer_cache_ttl)
+        else:
+            self._add_rest_api(chat_handler, authorizer_handler, authorizer_cache_ttl)
+
+        # Persistent channel for streamed replies, alongside the request/response API
+        if websocket_enabled:
+            self._add_websocket_api(chat_handler, authorizer_handler)
+
+    def _add_rest_api(
+        self,
+        chat_handler: lambda_.Function,
+        authorizer_handler: lambda_.Function,
+        authorizer_cache_ttl: Duration,
+    ) -> None:
+        token_authorizer = apigateway.TokenAuthorizer(
+            self,
+            "ChatTokenAuthorizer",
+            handler=authorizer_handler,
+            identity_source=apigateway.IdentitySource.header("Authorization"),
+            results_cache_ttl=authorizer_cache_ttl,
+        )
+
         # API Gateway with API key authentication
         api = apigateway.RestApi(
             self,
@@ -131,7 +554,10 @@ class ChatbotStack(Stack):
         usage_plan = api.add_usage_plan(
             "ChatbotUsagePlan",
             name="Standard",
-            throttle=apigateway.ThrottleSettings(rate_limit=10, burst_limit=20),
+            throttle=apigateway.ThrottleSettings(
+                rate_limit=int(os.getenv("API_RATE_LIMIT", "10")),
+                burst_limit=int(os.getenv("API_BURST_LIMIT", "20")),
+            ),
         )
 
         usage_plan.add_api_key(api_key)
@@ -144,6 +570,11 @@ class ChatbotStack(Stack):
         
         chat = api.root.add_resource("chat")
         summaries = api.root.add_resource("summaries")
+        admin_usage = api.root.add_resource("admin").add_resource("usage")
+        search = api.root.add_resource("search")
+        trends = api.root.add_resource("trends")
+        export = api.root.add_resource("export")
+        me = api.root.add_resource("me")
         
         # Auth endpoints
         register.add_method(
@@ -163,6 +594,7 @@ class ChatbotStack(Stack):
             "POST",
             apigateway.LambdaIntegration(chat_handler),
             api_key_required=True,
+            authorizer=token_authorizer,
         )
         
         # Summaries endpoint
@@ -170,8 +602,50 @@ class ChatbotStack(Stack):
             "GET",
             apigateway.LambdaIntegration(chat_handler),
             api_key_required=True,
+            authorizer=token_authorizer,
+        )
+
+        # Admin usage endpoint
+        admin_usage.add_method(
+            "GET",
+            apigateway.LambdaIntegration(chat_handler),
+            api_key_required=True,
+            authorizer=token_authorizer,
+        )
+
+        # Message search endpoint
+        search.add_method(
+            "GET",
+            apigateway.LambdaIntegration(chat_handler),
+            api_key_required=True,
+            authorizer=token_authorizer,
+        )
+
+        # Mood and topic trends endpoint
+        trends.add_method(
+            "GET",
+            apigateway.LambdaIntegration(chat_handler),
+            api_key_required=True,
+            authorizer=token_authorizer,
         )
 
+        # Data export endpoint
+        export.add_method(
+            "GET",
+            apigateway.LambdaIntegration(chat_handler),
+            api_key_required=True,
+            authorizer=token_authorizer,
+        )
+
+        # Account endpoints: deletion progress and "delete my data"
+        for method in ("GET", "DELETE"):
+            me.add_method(
+                method,
+                apigateway.LambdaIntegration(chat_handler),
+                api_key_required=True,
+                authorizer=token_authorizer,
+            )
+
         # Outputs
         CfnOutput(
             self,
@@ -186,3 +660,138 @@ class ChatbotStack(Stack):
             value=api_key.key_id,
             description="API Key ID (retrieve value from AWS Console)",
         )
+
+    def _add_http_api(
+        self,
+        chat_handler: lambda_.Function,
+        authorizer_handler: lambda_.Function,
+        authorizer_cache_ttl: Duration,
+    ) -> None:
+        # Simple-response authorizer on the same function as the REST TOKEN authorizer
+        token_authorizer = apigwv2_authorizers.HttpLambdaAuthorizer(
+            "ChatHttpAuthorizer",
+            authorizer_handler,
+            response_types=[apigwv2_authorizers.HttpLambdaResponseType.SIMPLE],
+            identity_source=["$request.header.Authorization"],
+            results_cache_ttl=authorizer_cache_ttl,
+        )
+
+        http_api = apigwv2.HttpApi(
+            self,
+            "ChatbotHttpApi",
+            api_name="Privacy Chatbot HTTP API",
+            description="Privacy-focused chatbot API",
+            create_default_stage=False,
+            cors_preflight=apigwv2.CorsPreflightOptions(
+                allow_origins=["*"],
+                allow_methods=[apigwv2.CorsHttpMethod.ANY],
+                allow_headers=["Content-Type", "Authorization", "Idempotency-Key"],
+            ),
+        )
+
+        # Same stage name as the REST API so client URLs keep their shape; HTTP APIs
+        # have no usage plans, so the throttle applies to the whole stage
+        stage = http_api.add_stage(
+            "ProdStage",
+            stage_name="prod",
+            auto_deploy=True,
+            throttle=apigwv2.ThrottleSettings(
+                rate_limit=int(os.getenv("API_RATE_LIMIT", "10")),
+                burst_limit=int(os.getenv("API_BURST_LIMIT", "20")),
+            ),
+        )
+
+        integration = apigwv2_integrations.HttpLambdaIntegration(
+            "ChatIntegration", chat_handler
+        )
+
+        # Auth endpoints
+        http_api.add_routes(
+            path="/auth/register",
+            methods=[apigwv2.HttpMethod.POST],
+            integration=integration,
+        )
+        http_api.add_routes(
+            path="/auth/login",
+            methods=[apigwv2.HttpMethod.POST],
+            integration=integration,
+        )
+
+        # Authenticated endpoints
+        for path, method in [
+            ("/chat", apigwv2.HttpMethod.POST),
+            ("/summaries", apigwv2.HttpMethod.GET),
+            ("/admin/usage", apigwv2.HttpMethod.GET),
+            ("/search", apigwv2.HttpMethod.GET),
+            ("/trends", apigwv2.HttpMethod.GET),
+            ("/export", apigwv2.HttpMethod.GET),
+            ("/me", apigwv2.HttpMethod.GET),
+            ("/me", apigwv2.HttpMethod.DELETE),
+        ]:
+            http_api.add_routes(
+                path=path,
+                methods=[method],
+                integration=integration,
+                authorizer=token_authorizer,
+            )
+
+        # Outputs
+        CfnOutput(
+            self,
+            "ApiUrl",
+            value=stage.url,
+            description="API Gateway URL",
+        )
+
+    def _add_websocket_api(
+        self,
+        chat_handler: lambda_.Function,
+        authorizer_handler: lambda_.Function,
+    ) -> None:
+        integration = apigwv2_integrations.WebSocketLambdaIntegration(
+            "ChatWebSocketIntegration", chat_handler
+        )
+
+        # Authenticate once on $connect; later frames are tied to the connection
+        connect_authorizer = apigwv2_authorizers.WebSocketLambdaAuthorizer(
+            "ChatWebSocketAuthorizer",
+            authorizer_handler,
+            identity_source=["route.request.header.Authorization"],
+        )
+
+        websocket_api = apigwv2.WebSocketApi(
+            self,
+            "ChatbotWebSocketApi",
+            api_name="Privacy Chatbot WebSocket API",
+            description="Streaming chat channel",
+            connect_route_options=apigwv2.WebSocketRouteOptions(
+                integration=integration,
+                authorizer=connect_authorizer,
+            ),
+            disconnect_route_options=apigwv2.WebSocketRouteOptions(
+                integration=integration,
+            ),
+        )
+        websocket_api.add_route("sendMessage", integration=integration)
+
+        stage = apigwv2.WebSocketStage(
+            self,
+            "ChatbotWebSocketStage",
+            web_socket_api=websocket_api,
+            stage_name="prod",
+            auto_deploy=True,
+            throttle=apigwv2.ThrottleSettings(
+                rate_limit=int(os.getenv("API_RATE_LIMIT", "10")),
+                burst_limit=int(os.getenv("API_BURST_LIMIT", "20")),
+            ),
+        )
+
+        # Lets the chat function push frames back with post_to_connection
+        stage.grant_management_api_access(chat_handler)
+
+        CfnOutput(
+            self,
+            "WebSocketUrl",
+            value=stage.url,
+            description="WebSocket API URL",
+        )
@@ -7,9 +7,21 @@ A supportive conversational AI designed with mental wellness in mind
 import streamlit as st
 import requests
 import json
+import os
+import time
 from datetime import datetime
 import uuid
 
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+APP_CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'streamlit_styles.css')
+
+# Render timings kept per area (app, sidebar, chat, summaries) for the Settings tab
+RENDER_SAMPLES = 50
+
 # Page config
 st.set_page_config(
     page_title="SoulShield - AI Wellness Companion",
@@ -17,276 +29,17 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+app_started = time.perf_counter()
+
+# Custom CSS inspired by The Good Mental Health Company. The stylesheet is read once per
+# server process; each full run only re-sends the cached string.
+@st.cache_resource
+def load_css() -> str:
+    with open(APP_CSS_PATH, encoding='utf-8') as f:
+        return f"<style>\n{f.read()}</style>"
 
-# Custom CSS inspired by The Good Mental Health Company
-st.markdown("""
-<style>
-    /* Import Google Fonts */
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-    
-    /* Main theme colors inspired by mental health websites */
-    :root {
-        --primary-blue: #4A90E2;       /* Soft Blue */
-        --secondary-blue: #7BB3F0;     /* Light Blue */
-        --accent-blue: #B8D4F0;       /* Very Light Blue */
-        --warm-orange: #FF8C42;        /* Warm Orange */
-        --light-orange: #FFB380;       /* Light Orange */
-        --background-main: #FEFEFE;    /* Almost White */
-        --background-light: #F8FBFF;   /* Very Light Blue */
-        --background-card: #FFFFFF;    /* Pure White */
-        --text-primary: #2C3E50;       /* Dark Blue Gray */
-        --text-secondary: #5A6C7D;     /* Medium Blue Gray */
-        --success-color: #27AE60;      /* Green */
-        --warning-color: #F39C12;      /* Orange */
-        --error-color: #E74C3C;        /* Red */
-    }
-    
-    /* Override Streamlit's default dark theme */
-    .stApp {
-        background: var(--background-main) !important;
-        color: var(--text-primary) !important;
-    }
-    
-    /* Global styling */
-    .main {
-        background: linear-gradient(135deg, var(--background-main) 0%, var(--background-light) 100%) !important;
-        font-family: 'Inter', sans-serif !important;
-        color: var(--text-primary) !important;
-    }
-    
-    /* Force bright background */
-    .stApp > div {
-        background: var(--background-main) !important;
-    }
-    
-    /* Header styling */
-    .main-header {
-        background: linear-gradient(135deg, var(--primary-blue), var(--warm-orange));
-        padding: 2rem 0;
-        border-radius: 0 0 20px 20px;
-        margin-bottom: 2rem;
-        text-align: center;
-        color: white;
-        box-shadow: 0 4px 20px rgba(74, 144, 226, 0.3);
-    }
-    
-    .main-header h1 {
-        font-size: 2.5rem;
-        font-weight: 600;
-        margin: 0;
-        text-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-    
-    .main-header p {
-        font-size: 1.1rem;
-        margin: 0.5rem 0 0 0;
-        opacity: 0.95;
-    }
-    
-    /* Sidebar styling */
-    .css-1d391kg, .css-1cypcdb {
-        background: linear-gradient(180deg, var(--background-card) 0%, var(--background-light) 100%) !important;
-        border-right: 3px solid var(--accent-blue) !important;
-    }
-    
-    /* Sidebar text color */
-    .css-1d391kg *, .css-1cypcdb * {
-        color: var(--text-primary) !important;
-    }
-    
-    /* Chat message styling */
-    .stChatMessage {
-        background: var(--background-card) !important;
-        border-radius: 15px;
-        padding: 1rem;
-        margin: 0.5rem 0;
-        box-shadow: 0 2px 15px rgba(74, 144, 226, 0.1);
-        border-left: 4px solid var(--secondary-blue);
-        color: var(--text-primary) !important;
-    }
-    
-    /* User message styling */
-    .stChatMessage[data-testid="user-message"] {
-        background: linear-gradient(135deg, var(--primary-blue), var(--secondary-blue)) !important;
-        color: white !important;
-        border-left: 4px solid var(--warm-orange);
-    }
-    
-    /* Assistant message styling */
-    .stChatMessage[data-testid="assistant-message"] {
-        background: var(--background-card) !important;
-        border-left: 4px solid var(--warm-orange);
-        color: var(--text-primary) !important;
-    }
-    
-    /* Button styling */
-    .stButton > button {
-        background: linear-gradient(135deg, var(--primary-blue), var(--warm-orange)) !important;
-        color: white !important;
-        border: none !important;
-        border-radius: 25px;
-        padding: 0.5rem 1.5rem;
-        font-weight: 500;
-        transition: all 0.3s ease;
-        box-shadow: 0 4px 15px rgba(74, 144, 226, 0.3);
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 6px 20px rgba(74, 144, 226, 0.4);
-    }
-    
-    /* Input styling */
-    .stTextInput > div > div > input {
-        background: var(--background-card) !important;
-        color: var(--text-primary) !important;
-        border-radius: 15px;
-        border: 2px solid var(--accent-blue) !important;
-        padding: 0.75rem;
-        font-family: 'Inter', sans-serif;
-    }
-    
-    .stTextInput > div > div > input:focus {
-        border-color: var(--primary-blue) !important;
-        box-shadow: 0 0 0 3px rgba(74, 144, 226, 0.2) !important;
-    }
-    
-    /* Card styling */
-    .wellness-card {
-        background: var(--background-card) !important;
-        border-radius: 20px;
-        padding: 1.5rem;
-        margin: 1rem 0;
-        box-shadow: 0 4px 20px rgba(74, 144, 226, 0.1);
-        border: 1px solid var(--accent-blue);
-        color: var(--text-primary) !important;
-    }
-    
-    /* Success/Info/Error styling */
-    .stSuccess {
-        background: linear-gradient(135deg, var(--success-color), #58D68D) !important;
-        border-radius: 15px;
-        border: none !important;
-        color: white !important;
-    }
-    
-    .stInfo {
-        background: linear-gradient(135deg, var(--secondary-blue), var(--accent-blue)) !important;
-        border-radius: 15px;
-        border: none !important;
-        color: var(--text-primary) !important;
-    }
-    
-    .stError {
-        background: linear-gradient(135deg, var(--error-color), #F1948A) !important;
-        border-radius: 15px;
-        border: none !important;
-        color: white !important;
-    }
-    
-    /* Expander styling */
-    .streamlit-expanderHeader {
-        background: var(--background-light) !important;
-        border-radius: 10px;
-        border: 1px solid var(--accent-blue) !important;
-        color: var(--text-primary) !important;
-    }
-    
-    /* Chat input styling */
-    .stChatInputContainer {
-        background: var(--background-card) !important;
-        border-radius: 25px;
-        border: 2px solid var(--accent-blue) !important;
-        box-shadow: 0 4px 15px rgba(74, 144, 226, 0.1);
-    }
-    
-    /* Chat input text */
-    .stChatInput input {
-        background: var(--background-card) !important;
-        color: var(--text-primary) !important;
-    }
-    
-    /* Divider styling */
-    hr {
-        border: none;
-        height: 2px;
-        background: linear-gradient(90deg, transparent, var(--accent-blue), transparent);
-        margin: 2rem 0;
-    }
-    
-    /* Caption styling */
-    .caption {
-        color: var(--text-secondary) !important;
-        font-size: 0.9rem;
-        font-style: italic;
-    }
-    
-    /* Sidebar section headers */
-    .sidebar-header {
-        color: var(--primary-blue) !important;
-        font-weight: 600;
-        font-size: 1.1rem;
-        margin: 1rem 0 0.5rem 0;
-    }
-    
-    /* Privacy badge */
-    .privacy-badge {
-        background: linear-gradient(135deg, var(--primary-blue), var(--warm-orange));
-        color: white;
-        padding: 0.5rem 1rem;
-        border-radius: 20px;
-        font-size: 0.9rem;
-        text-align: center;
-        margin: 1rem 0;
-        box-shadow: 0 2px 10px rgba(74, 144, 226, 0.3);
-    }
-    
-    /* Welcome message */
-    .welcome-message {
-        background: linear-gradient(135deg, var(--warm-orange), var(--light-orange));
-        color: white;
-        padding: 1rem;
-        border-radius: 15px;
-        text-align: center;
-        margin: 1rem 0;
-        box-shadow: 0 4px 15px rgba(255, 140, 66, 0.3);
-    }
-    
-    /* Radio button styling */
-    .stRadio > div {
-        background: var(--background-card) !important;
-        border-radius: 10px;
-        padding: 0.5rem;
-    }
-    
-    /* Select box styling */
-    .stSelectbox > div > div {
-        background: var(--background-card) !important;
-        color: var(--text-primary) !important;
-    }
-    
-    /* Metric styling */
-    .metric-container {
-        background: var(--background-card) !important;
-        color: var(--text-primary) !important;
-    }
-    
-    /* Override any remaining dark elements */
-    div[data-testid="stSidebar"] {
-        background: var(--background-light) !important;
-    }
-    
-    /* Text elements */
-    p, span, div {
-        color: var(--text-primary) !important;
-    }
-    
-    /* Headers */
-    h1, h2, h3, h4, h5, h6 {
-        color: var(--text-primary) !important;
-    }
-</style>
-""", unsafe_allow_html=True)
+
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # Helper functions
 def register_user(api_url: str, api_key: str, username: str, password: str) -> bool:
@@ -344,52 +97,199 @@ def login_user(api_url: str, api_key: str, username: str, password: str) -> str:
         return None
 
 
+@st.cache_data(ttl=600, show_spinner=False)
+def fetch_summaries(api_url: str, api_key: str, token: str, version: int) -> list:
+    """Fetch a user's summaries; cached until version changes (a new reply or a refresh)"""
+    endpoint = api_url.rstrip('/') + '/summaries'
+    headers = {
+        'Content-Type': 'application/json',
+        'x-api-key': api_key,
+        'Authorization': f"Bearer {token}"
+    }
+    
+    response = requests.get(endpoint, headers=headers, timeout=10)
+    response.raise_for_status()
+    return response.json().get('summaries', [])
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def fetch_trends(api_url: str, api_key: str, token: str, period: str, version: int) -> list:
+    """Fetch a user's mood and topic series (None if trends are off); cached like summaries"""
+    endpoint = api_url.rstrip('/') + '/trends'
+    headers = {
+        'Content-Type': 'application/json',
+        'x-api-key': api_key,
+        'Authorization': f"Bearer {token}"
+    }
+    
+    response = requests.get(endpoint, headers=headers, params={'period': period}, timeout=10)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json().get('series', [])
+
+
+def show_trends(api_url: str, api_key: str, token: str):
+    """Charts of session mood and topics over recent weeks or days"""
+    period = st.radio("Trends by", ['week', 'day'], horizontal=True, format_func=str.title)
+    try:
+        series = fetch_trends(api_url, api_key, token, period, st.session_state.summaries_version)
+    except Exception:
+        st.caption("Trends are unavailable right now.")
+        return
+    if not series or not any(point['sessions'] for point in series):
+        return
+    
+    st.markdown('<div class="sidebar-header">📈 How Your Sessions Have Felt</div>', unsafe_allow_html=True)
+    # Periods without sessions have no mood; leaving them out keeps the line unbroken
+    st.line_chart({'Mood (-1 to 1)': {p['period']: p['sentiment'] for p in series if p['sentiment'] is not None}})
+    st.bar_chart({
+        mood.title(): {p['period']: p['moods'][mood] for p in series}
+        for mood in ('positive', 'neutral', 'negative')
+    })
+    
+    topics = {}
+    for point in series:
+        for topic, count in point['topics'].items():
+            label = topic.replace('_', ' ').title()
+            topics[label] = topics.get(label, 0) + count
+    if topics:
+        st.markdown('<div class="sidebar-header">🏷️ What You Talked About</div>', unsafe_allow_html=True)
+        st.bar_chart({'Sessions': topics})
+
+
 def show_summaries(api_url: str, api_key: str, token: str):
     """Show user's chat summaries with improved styling"""
     try:
-        endpoint = api_url.rstrip('/') + '/summaries'
-        headers = {
-            'Content-Type': 'application/json',
-            'x-api-key': api_key
-        }
-        params = {'token': token}
-        
-        response = requests.get(endpoint, headers=headers, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            summaries = data.get('summaries', [])
-            
-            if summaries:
-                st.markdown('<div class="sidebar-header">📊 Your Conversation Summaries</div>', unsafe_allow_html=True)
-                for summary in summaries:
-                    session_date = datetime.fromtimestamp(summary['created_at']).strftime('%B %d, %Y at %H:%M')
-                    with st.expander(f"💭 Session from {session_date}"):
-                        st.markdown(f"""
-                        <div class="wellness-card">
-                            <p style="color: var(--text-primary); line-height: 1.6;">
-                                {summary['summary']}
-                            </p>
-                            <small style="color: var(--text-secondary);">
-                                Session ID: {summary['sessionId'][:12]}...
-                            </small>
-                        </div>
-                        """, unsafe_allow_html=True)
-            else:
-                st.markdown("""
-                <div class="wellness-card" style="text-align: center;">
-                    <h4 style="color: var(--primary-color);">🌱 No Summaries Yet</h4>
-                    <p style="color: var(--text-secondary);">
-                        Start a longer conversation to generate your first summary! 
-                        Summaries help me remember our previous discussions.
+        summaries = fetch_summaries(api_url, api_key, token, st.session_state.summaries_version)
+    except requests.exceptions.HTTPError:
+        st.error("Unable to load your summaries right now. Please try again later.")
+        return
+    except Exception as e:
+        st.error(f"Error loading summaries: {str(e)}")
+        return
+    
+    if summaries:
+        st.markdown('<div class="sidebar-header">📊 Your Conversation Summaries</div>', unsafe_allow_html=True)
+        for summary in summaries:
+            session_date = datetime.fromtimestamp(summary['created_at']).strftime('%B %d, %Y at %H:%M')
+            with st.expander(f"💭 Session from {session_date}"):
+                st.markdown(f"""
+                <div class="wellness-card">
+                    <p style="color: var(--text-primary); line-height: 1.6;">
+                        {summary['summary']}
                     </p>
+                    <small style="color: var(--text-secondary);">
+                        Session ID: {summary['sessionId'][:12]}...
+                    </small>
                 </div>
                 """, unsafe_allow_html=True)
-        else:
-            st.error("Unable to load your summaries right now. Please try again later.")
-            
-    except Exception as e:
-        st.error(f"Error loading summaries: {str(e)}")
+    else:
+        st.markdown("""
+        <div class="wellness-card" style="text-align: center;">
+            <h4 style="color: var(--primary-color);">🌱 No Summaries Yet</h4>
+            <p style="color: var(--text-secondary);">
+                Start a longer conversation to generate your first summary! 
+                Summaries help me remember our previous discussions.
+            </p>
+        </div>
+        """, unsafe_allow_html=True)
+
+
+def record_render_time(area: str, started: float):
+    """Keep recent render times per area and log them so interaction latency can be tracked"""
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    samples = st.session_state.render_times.setdefault(area, [])
+    samples.append(elapsed_ms)
+    del samples[:-RENDER_SAMPLES]
+    print(f"render area={area} ms={elapsed_ms:.1f}")
+
+
+def show_render_times():
+    """Median and worst recent render time per area"""
+    rows = []
+    for area, samples in sorted(st.session_state.render_times.items()):
+        ordered = sorted(samples)
+        rows.append(f"**{area}:** p50 {ordered[len(ordered) // 2]:.0f} ms · max {ordered[-1]:.0f} ms ({len(ordered)} runs)")
+    if rows:
+        st.caption("⏱️ Render times\n\n" + "\n\n".join(rows))
+
+
+def expire_session():
+    """Drop the token and rerun the whole app so the login form replaces the chat"""
+    st.session_state.user_token = None
+    st.session_state.username = None
+    st.session_state.auth_notice = "🔐 Your session has expired. Please login again to continue."
+    st.rerun()
+
+
+def websocket_connection(ws_url: str, token: str):
+    """Reuse one WebSocket per browser session; it is authenticated once on connect"""
+    ws = st.session_state.get('ws_connection')
+    if ws is not None and ws.connected and st.session_state.get('ws_token') == token:
+        return ws
+    if ws is not None:
+        ws.close()
+    ws = websocket.create_connection(ws_url, header=[f"Authorization: Bearer {token}"], timeout=30)
+    st.session_state.ws_connection = ws
+    st.session_state.ws_token = token
+    return ws
+
+
+def chat_over_websocket(ws_url: str, prompt: str, message_placeholder):
+    """Send a message over the WebSocket channel and render the reply as it streams in"""
+    request = {
+        'action': 'sendMessage',
+        'message': prompt,
+        'sessionId': st.session_state.session_id,
+        'requestId': str(uuid.uuid4())
+    }
+    
+    try:
+        try:
+            ws = websocket_connection(ws_url, st.session_state.user_token)
+            ws.send(json.dumps(request))
+        except (websocket.WebSocketConnectionClosedException, BrokenPipeError, ConnectionResetError):
+            # API Gateway closes idle connections after 10 minutes; reconnect once
+            st.session_state.ws_connection = None
+            ws = websocket_connection(ws_url, st.session_state.user_token)
+            ws.send(json.dumps(request))
+        
+        streamed = ''
+        while True:
+            frame = json.loads(ws.recv())
+            if frame.get('requestId') != request['requestId']:
+                continue
+            if frame['type'] != 'delta':
+                break
+            streamed += frame['text']
+            message_placeholder.markdown(streamed + "▌")
+    
+    except websocket.WebSocketTimeoutException:
+        message_placeholder.error("⏱️ The request took too long. Please try again.")
+        return
+    except websocket.WebSocketBadStatusException:
+        expire_session()
+    except Exception:
+        st.session_state.ws_connection = None
+        message_placeholder.error("🔌 Connection issue. Please check your internet connection.")
+        return
+    
+    if frame['type'] == 'done':
+        assistant_message = frame.get('response', streamed)
+        message_placeholder.markdown(assistant_message)
+        current_time = datetime.now().strftime("%H:%M:%S")
+        st.markdown(f'<div class="caption">🤖 {current_time}</div>', unsafe_allow_html=True)
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": assistant_message,
+            "timestamp": current_time
+        })
+        st.session_state.summaries_version += 1
+    elif frame.get('status') == 401:
+        expire_session()
+    else:
+        message_placeholder.error(f"I encountered an issue (Error {frame.get('status')}). Please try again in a moment.")
 
 # Initialize session state
 if 'messages' not in st.session_state:
@@ -402,44 +302,176 @@ if 'username' not in st.session_state:
     st.session_state.username = None
 if 'show_login' not in st.session_state:
     st.session_state.show_login = True
+if 'summaries_version' not in st.session_state:
+    st.session_state.summaries_version = 0
+if 'render_times' not in st.session_state:
+    st.session_state.render_times = {}
 
-# Custom header with navigation
-st.markdown("""
-<div class="main-header">
-    <div style="display: flex; justify-content: space-between; align-items: center; max-width: 1200px; margin: 0 auto; padding: 0 2rem;">
-        <div>
-            <h1>🛡️ SoulShield</h1>
-            <p>Your Privacy-First AI Wellness Companion</p>
-        </div>
-    </div>
-</div>
-""", unsafe_allow_html=True)
-
-# Navigation menu in the main area (since Streamlit tabs can't be moved to header)
-if 'current_page' not in st.session_state:
-    st.session_state.current_page = 'Home'
+# Areas that rerun independently of the rest of the page
+def send_message(prompt: str):
+    """Show the user's message, call the API and render the reply"""
+    api_url = st.session_state.api_url
+    api_key = st.session_state.api_key
+    
+    # Check if API is configured and user is logged in
+    if not api_url or not api_key:
+        st.error("⚠️ Please configure your API settings in the sidebar")
+        st.stop()
+    
+    if not st.session_state.user_token:
+        st.error("⚠️ Please login to start your wellness journey")
+        st.stop()
+    
+    # Add user message to chat
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    st.session_state.messages.append({
+        "role": "user",
+        "content": prompt,
+        "timestamp": timestamp
+    })
+    
+    # Display user message
+    with st.chat_message("user"):
+        st.markdown(prompt)
+        st.markdown(f'<div class="caption">💬 {timestamp}</div>', unsafe_allow_html=True)
+    
+    # Call API
+    with st.chat_message("assistant"):
+        message_placeholder = st.empty()
+        message_placeholder.markdown("🤔 Thinking thoughtfully...")
+        
+        if st.session_state.ws_url and websocket is not None:
+            chat_over_websocket(st.session_state.ws_url, prompt, message_placeholder)
+        else:
+            try:
+                # Ensure URL ends with /
+                endpoint = api_url.rstrip('/') + '/chat'
+            
+                # One key per submitted prompt; resubmitting the same prompt after a timeout
+                # reuses it so the server answers from the first attempt instead of re-running it
+                pending = st.session_state.get('pending_request')
+                if pending and pending['prompt'] == prompt and pending['session_id'] == st.session_state.session_id:
+                    idempotency_key = pending['key']
+                else:
+                    idempotency_key = str(uuid.uuid4())
+                    st.session_state.pending_request = {
+                        'prompt': prompt,
+                        'session_id': st.session_state.session_id,
+                        'key': idempotency_key
+                    }
+            
+                headers = {
+                    'Content-Type': 'application/json',
+                    'x-api-key': api_key,
+                    'Authorization': f"Bearer {st.session_state.user_token}",
+                    'Idempotency-Key': idempotency_key
+                }
+            
+                payload = {
+                    'message': prompt,
+                    'sessionId': st.session_state.session_id
+                }
+            
+                response = requests.post(
+                    endpoint,
+                    headers=headers,
+                    json=payload,
+                    timeout=30
+                )
+            
+                if response.status_code != 409:
+                    st.session_state.pending_request = None
+            
+                if response.status_code == 200:
+                    data = response.json()
+                    assistant_message = data.get('response', 'I apologize, but I didn\'t receive a proper response. Please try again.')
+                
+                    # Update placeholder with actual response
+                    message_placeholder.markdown(assistant_message)
+                    current_time = datetime.now().strftime("%H:%M:%S")
+                    st.markdown(f'<div class="caption">🤖 {current_time}</div>', unsafe_allow_html=True)
+                
+                    # Add to session state
+                    st.session_state.messages.append({
+                        "role": "assistant",
+                        "content": assistant_message,
+                        "timestamp": current_time
+                    })
+                    st.session_state.summaries_version += 1
+                
+                elif response.status_code == 409:
+                    message_placeholder.warning("⏳ I'm still working on your previous message. Send it again in a moment to see my reply.")
+                elif response.status_code in (401, 403):
+                    expire_session()
+                else:
+                    error_msg = f"I encountered an issue (Error {response.status_code}). Please try again in a moment."
+                    message_placeholder.error(error_msg)
+                
+            except requests.exceptions.Timeout:
+                message_placeholder.error("⏱️ The request took too long. Please try again.")
+            except requests.exceptions.ConnectionError:
+                message_placeholder.error("🔌 Connection issue. Please check your internet connection.")
+            except Exception as e:
+                message_placeholder.error(f"❌ Something unexpected happened. Please try again.")
 
-# Create navigation buttons in the top right area
-col1, col2, col3, col4, col5 = st.columns([2, 1, 1, 1, 1])
 
-with col2:
-    if st.button("🏠 Home", use_container_width=True):
-        st.session_state.current_page = 'Home'
+@st.fragment
+def chat_panel():
+    """Chat log and input; sending a message reruns only this area"""
+    started = time.perf_counter()
+    
+    # Chat messages container
+    col1, col2, col3 = st.columns([1, 3, 1])
+    with col2:
+        log = st.container()
+        with log:
+            st.markdown('<div class="wellness-card">', unsafe_allow_html=True)
+            
+            # Display chat messages
+            if not st.session_state.messages:
+                st.info("🌱 **Start Your Conversation** - I'm here to listen and support you. Feel free to share what's on your mind, ask questions, or just have a friendly chat. Your privacy and wellbeing are my top priorities.")
+            
+            for message in st.session_state.messages:
+                with st.chat_message(message["role"]):
+                    st.markdown(message["content"])
+                    if "timestamp" in message:
+                        st.markdown(f'<div class="caption">💬 {message["timestamp"]}</div>', unsafe_allow_html=True)
+            
+            st.markdown('</div>', unsafe_allow_html=True)
+        
+        prompt = st.chat_input("Share what's on your mind... 💭", key="chat_input")
+    
+    if prompt:
+        with log:
+            send_message(prompt)
+    
+    record_render_time('chat', started)
 
-with col3:
-    if st.button("ℹ️ About", use_container_width=True):
-        st.session_state.current_page = 'About'
 
-with col4:
-    if st.button("✨ Features", use_container_width=True):
-        st.session_state.current_page = 'Features'
+@st.fragment
+def summaries_panel():
+    """Summaries tab; fetched once per new reply, or when refreshed"""
+    started = time.perf_counter()
+    
+    st.markdown("### 📊 Your Conversation Summaries")
+    st.write("Track your conversations and see how your discussions have evolved over time.")
+    
+    if st.button("🔄 Refresh summaries"):
+        st.session_state.summaries_version += 1
+    
+    show_trends(st.session_state.api_url, st.session_state.api_key, st.session_state.user_token)
+    
+    # Show summaries
+    show_summaries(st.session_state.api_url, st.session_state.api_key, st.session_state.user_token)
+    
+    record_render_time('summaries', started)
 
-with col5:
-    if st.button("📞 Contact", use_container_width=True):
-        st.session_state.current_page = 'Contact'
 
-# Sidebar for configuration and authentication
-with st.sidebar:
+@st.fragment
+def sidebar_panel():
+    """Configuration, account and session info; its widgets rerun only the sidebar"""
+    started = time.perf_counter()
+    
     st.markdown('<div class="sidebar-header">⚙️ Configuration</div>', unsafe_allow_html=True)
     
     api_url = st.text_input(
@@ -457,9 +489,18 @@ with st.sidebar:
         help="Your API Gateway API key"
     )
     
+    ws_url = st.text_input(
+        "WebSocket URL (optional)",
+        value=st.session_state.get('ws_url', ''),
+        placeholder="wss://your-api.execute-api.region.amazonaws.com/prod",
+        help="Stream replies over a persistent WebSocket connection instead of HTTPS requests",
+        disabled=websocket is None
+    )
+    
     # Save to session state
     st.session_state.api_url = api_url
     st.session_state.api_key = api_key
+    st.session_state.ws_url = ws_url
     
     st.divider()
     
@@ -531,8 +572,53 @@ with st.sidebar:
         🛡️ No data sharing
     </div>
     """, unsafe_allow_html=True)
+    
+    record_render_time('sidebar', started)
+
+
+# Custom header with navigation
+st.markdown("""
+<div class="main-header">
+    <div style="display: flex; justify-content: space-between; align-items: center; max-width: 1200px; margin: 0 auto; padding: 0 2rem;">
+        <div>
+            <h1>🛡️ SoulShield</h1>
+            <p>Your Privacy-First AI Wellness Companion</p>
+        </div>
+    </div>
+</div>
+""", unsafe_allow_html=True)
+
+# Navigation menu in the main area (since Streamlit tabs can't be moved to header)
+if 'current_page' not in st.session_state:
+    st.session_state.current_page = 'Home'
+
+# Create navigation buttons in the top right area
+col1, col2, col3, col4, col5 = st.columns([2, 1, 1, 1, 1])
+
+with col2:
+    if st.button("🏠 Home", use_container_width=True):
+        st.session_state.current_page = 'Home'
+
+with col3:
+    if st.button("ℹ️ About", use_container_width=True):
+        st.session_state.current_page = 'About'
+
+with col4:
+    if st.button("✨ Features", use_container_width=True):
+        st.session_state.current_page = 'Features'
+
+with col5:
+    if st.button("📞 Contact", use_container_width=True):
+        st.session_state.current_page = 'Contact'
+
+# Sidebar for configuration and authentication
+with st.sidebar:
+    sidebar_panel()
 
 # Main interface based on current page
+if st.session_state.get('auth_notice'):
+    st.warning(st.session_state.pop('auth_notice'))
+
 if not st.session_state.user_token:
     # Show welcome page with navigation for non-authenticated users
     
@@ -648,29 +734,10 @@ else:
     tab1, tab2, tab3 = st.tabs(["💬 Chat", "📊 My Summaries", "⚙️ Settings"])
     
     with tab1:
-        # Chat messages container
-        col1, col2, col3 = st.columns([1, 3, 1])
-        with col2:
-            st.markdown('<div class="wellness-card">', unsafe_allow_html=True)
-            
-            # Display chat messages
-            if not st.session_state.messages:
-                st.info("🌱 **Start Your Conversation** - I'm here to listen and support you. Feel free to share what's on your mind, ask questions, or just have a friendly chat. Your privacy and wellbeing are my top priorities.")
-            
-            for message in st.session_state.messages:
-                with st.chat_message(message["role"]):
-                    st.markdown(message["content"])
-                    if "timestamp" in message:
-                        st.markdown(f'<div class="caption">💬 {message["timestamp"]}</div>', unsafe_allow_html=True)
-            
-            st.markdown('</div>', unsafe_allow_html=True)
+        chat_panel()
     
     with tab2:
-        st.markdown("### 📊 Your Conversation Summaries")
-        st.write("Track your conversations and see how your discussions have evolved over time.")
-        
-        # Show summaries
-        show_summaries(api_url, api_key, st.session_state.user_token)
+        summaries_panel()
     
     with tab3:
         col1, col2, col3 = st.columns([1, 2, 1])
@@ -682,89 +749,8 @@ else:
             st.success("**🔒 Privacy Settings**\n\n✅ End-to-end encryption enabled\n\n✅ Auto-deletion after 30 days\n\n✅ Secure password hashing\n\n✅ No data sharing with third parties")
             
             st.write("Need to start fresh or switch accounts? Use the logout button in the sidebar.")
-
-# Chat input (only show when logged in and on chat tab)
-if st.session_state.user_token:
-    if prompt := st.chat_input("Share what's on your mind... 💭", key="chat_input"):
-        # Check if API is configured and user is logged in
-        if not api_url or not api_key:
-            st.error("⚠️ Please configure your API settings in the sidebar")
-            st.stop()
-        
-        if not st.session_state.user_token:
-            st.error("⚠️ Please login to start your wellness journey")
-            st.stop()
-        
-        # Add user message to chat
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        st.session_state.messages.append({
-            "role": "user",
-            "content": prompt,
-            "timestamp": timestamp
-        })
-        
-        # Display user message
-        with st.chat_message("user"):
-            st.markdown(prompt)
-            st.markdown(f'<div class="caption">💬 {timestamp}</div>', unsafe_allow_html=True)
-        
-        # Call API
-        with st.chat_message("assistant"):
-            message_placeholder = st.empty()
-            message_placeholder.markdown("🤔 Thinking thoughtfully...")
             
-            try:
-                # Ensure URL ends with /
-                endpoint = api_url.rstrip('/') + '/chat'
-                
-                headers = {
-                    'Content-Type': 'application/json',
-                    'x-api-key': api_key
-                }
-                
-                payload = {
-                    'message': prompt,
-                    'sessionId': st.session_state.session_id,
-                    'token': st.session_state.user_token
-                }
-                
-                response = requests.post(
-                    endpoint,
-                    headers=headers,
-                    json=payload,
-                    timeout=30
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    assistant_message = data.get('response', 'I apologize, but I didn\'t receive a proper response. Please try again.')
-                    
-                    # Update placeholder with actual response
-                    message_placeholder.markdown(assistant_message)
-                    current_time = datetime.now().strftime("%H:%M:%S")
-                    st.markdown(f'<div class="caption">🤖 {current_time}</div>', unsafe_allow_html=True)
-                    
-                    # Add to session state
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": assistant_message,
-                        "timestamp": current_time
-                    })
-                    
-                elif response.status_code == 401:
-                    message_placeholder.error("🔐 Your session has expired. Please login again to continue.")
-                    st.session_state.user_token = None
-                    st.session_state.username = None
-                else:
-                    error_msg = f"I encountered an issue (Error {response.status_code}). Please try again in a moment."
-                    message_placeholder.error(error_msg)
-                    
-            except requests.exceptions.Timeout:
-                message_placeholder.error("⏱️ The request took too long. Please try again.")
-            except requests.exceptions.ConnectionError:
-                message_placeholder.error("🔌 Connection issue. Please check your internet connection.")
-            except Exception as e:
-                message_placeholder.error(f"❌ Something unexpected happened. Please try again.")
+            show_render_times()
 
 # Footer
 st.divider()
@@ -778,4 +764,6 @@ st.markdown("""
         <strong>You are in control</strong>
     </p>
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+record_render_time('app', app_started)